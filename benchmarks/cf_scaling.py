@@ -0,0 +1,99 @@
+"""
+CF Scaling - item-item training time against the number of worker processes
+Generates a dataset with src.generate_mock_data, builds its interaction
+matrix once and times ``sharded_cosine_similarity`` for each worker count
+(best of several runs), reporting the speedup over one worker and the largest
+deviation from the single-process ``_cosine_similarity``.
+
+BLAS is pinned to one thread per process (unless already configured), so the
+workers, not the BLAS threads, are what scales.
+
+Usage:
+    python -m benchmarks.cf_scaling --size large --workers 1,2,4,8
+    python -m benchmarks.cf_scaling --users 50000 --items 3000 --orders 1000000 --neighbours 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from .run_benchmarks import SIZES
+
+BLAS_THREAD_VARIABLES = ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def run(matrix, worker_counts: List[int], neighbours: int | None, repeat: int) -> List[Dict]:
+    import numpy as np
+
+    from src.core.collaborative import _cosine_similarity
+    from src.core.similarity import sharded_cosine_similarity
+
+    reference = _cosine_similarity(matrix)
+    results = []
+    for workers in worker_counts:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            similarity = sharded_cosine_similarity(matrix, workers=workers, neighbours=neighbours)
+            timings.append(time.perf_counter() - start)
+        result = {"workers": workers, "seconds": min(timings), "neighbours": neighbours}
+        if neighbours is None:
+            result["max_abs_diff"] = float(np.abs(similarity - reference).max())
+        result["speedup"] = results[0]["seconds"] / result["seconds"] if results else 1.0
+        results.append(result)
+        diff = f"   max |diff| {result['max_abs_diff']:.2e}" if "max_abs_diff" in result else ""
+        print(f"{workers:>3} worker(s) {result['seconds']:8.3f} s   speedup x{result['speedup']:5.2f}{diff}")
+    return results
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of sharded item-item CF training")
+    parser.add_argument("--size", type=str, default="large", help=f"Dataset size ({', '.join(SIZES)})")
+    parser.add_argument("--users", type=int, default=None, help="Override the size's user count")
+    parser.add_argument("--items", type=int, default=None, help="Override the size's item count")
+    parser.add_argument("--orders", type=int, default=None, help="Override the size's order count")
+    parser.add_argument("--workers", type=str, default="1,2,4,8", help="Comma-separated worker counts")
+    parser.add_argument("--neighbours", type=_positive_int, default=None, help="Per-item top-N pruning")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per worker count (best is kept)")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    for variable in BLAS_THREAD_VARIABLES:
+        os.environ.setdefault(variable, "1")  # before NumPy is imported, inherited by the workers
+
+    from src.core.collaborative import user_item_matrix
+    from src.data_loader import load_orders
+    from src.generate_mock_data import generate
+
+    size = dict(SIZES[args.size])
+    for key, value in (("n_users", args.users), ("n_items", args.items), ("n_orders", args.orders)):
+        if value is not None:
+            size[key] = value
+    with tempfile.TemporaryDirectory(prefix="smart-menu-cf-scaling-") as tmp:
+        generate(out_dir=tmp, seed=42, days=90, **size)
+        matrix = user_item_matrix(load_orders(os.path.join(tmp, "orders.csv"),
+                                              os.path.join(tmp, "order_items.csv"))).values
+    print(f"{matrix.shape[0]} users x {matrix.shape[1]} items, {os.cpu_count()} CPU(s)")
+
+    results = run(matrix, [int(w) for w in args.workers.split(",")], args.neighbours, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"size": size, "cpus": os.cpu_count(), "shape": list(matrix.shape),
+                       "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Import Budget - keep the cold start of the entry points in check
+Imports each entry module in a fresh interpreter with ``-X importtime`` and
+fails when its cumulative import time exceeds the budget, or when it pulls in
+a heavy module it is meant to load lazily (the recommenders are imported by
+the warm-up hook or the first request, see src/warmup.py).
+
+Usage:
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --scale 2.0   # slower machine or CI runner
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Entry module -> (cumulative import budget in ms, modules it must not import)
+BUDGETS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "src.main": (50, ("pandas", "numpy")),
+    "src.api": (50, ("pandas", "numpy", "fastapi")),
+    "src.api.api": (600, ("pandas", "numpy")),
+    "src.core": (50, ("pandas", "numpy")),
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """Cumulative import time of ``module`` in ms and the modules it loaded"""
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    if cumulative_us is None:
+        raise RuntimeError(f"no importtime entry for {module}")
+    return cumulative_us / 1000, json.loads(proc.stdout.splitlines()[-1])
+
+
+def check(scale: float = 1.0, repeat: int = 3) -> List[str]:
+    """Budget violations (empty when every entry point is within budget)"""
+    violations = []
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        # Best of several runs: the first one also pays for cold disk caches
+        runs = [measure(module) for _ in range(repeat)]
+        elapsed_ms = min(ms for ms, _ in runs)
+        loaded = set(runs[0][1])
+        heavy = [name for name in forbidden if name in loaded]
+        over = elapsed_ms > budget_ms * scale
+        flag = "OVER BUDGET" if over else ""
+        if heavy:
+            flag = f"{flag} imports {', '.join(heavy)}".strip()
+        print(f"{module:<14} {elapsed_ms:8.1f} ms   budget {budget_ms * scale:7.1f} ms   {flag}")
+        if over:
+            violations.append(f"{module} took {elapsed_ms:.1f} ms (budget {budget_ms * scale:.1f} ms)")
+        if heavy:
+            violations.append(f"{module} imports {', '.join(heavy)} at import time")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check entry-point import times against their budgets")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget (slow machines)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module (best is kept)")
+    args = parser.parse_args()
+
+    violations = check(args.scale, args.repeat)
+    if violations:
+        print(f"{len(violations)} violation(s):")
+        for violation in violations:
+            print(f"- {violation}")
+        sys.exit(1)
+    print("All entry points within their import budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Recommender Benchmarks - time every hot path on datasets of increasing size
+Each dataset is produced with src.generate_mock_data into a temporary
+directory and selected through SMART_MENU_DATA_DIR. Every benchmark reports
+min/median/mean wall time over several repeats plus peak traced memory of
+one extra run, and the results are written to a JSON file that can be
+compared against an earlier run to catch regressions.
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes tiny,small --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json --threshold 1.25
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Dataset sizes: users, items, restaurants, orders
+SIZES = {
+    "tiny": dict(n_users=20, n_items=20, n_restaurants=1, n_orders=100),
+    "small": dict(n_users=200, n_items=100, n_restaurants=2, n_orders=2_000),
+    "medium": dict(n_users=1_000, n_items=300, n_restaurants=5, n_orders=20_000),
+    "large": dict(n_users=10_000, n_items=1_000, n_restaurants=20, n_orders=200_000),
+}
+
+LUNCH = datetime(2024, 6, 12, 12, 30)
+
+
+@dataclass
+class Benchmark:
+    name: str
+    run: Callable[[], object]
+    setup: Optional[Callable[[], None]] = None  # called before every repeat, untimed
+
+
+def build_benchmarks(user_id: int) -> List[Benchmark]:
+    """Benchmarks for the dataset selected by SMART_MENU_DATA_DIR"""
+    # Imported lazily so the environment is configured first
+    from src.data_loader import load_all, load_orders, load_order_tables
+    from src.core.collaborative import user_item_matrix, item_similarity, cf_scores_for_user
+    from src.core.contextual import Context, ContextualRecommender
+    from src.core.hybrid import score_items, recommend, recommend_rows
+    from src.core.model_refresher import build_bundle
+    from src.core.tenants import get_tenant_registry
+    from src.smart_recommender import SmartRecommender
+    from src.smart_query_processor import SmartQueryProcessor
+    from src.notifications import generate_notifications
+    from src.serialization import dumps
+
+    users, items, orders = load_all()
+    matrix = user_item_matrix()
+    ctx = lambda: Context(user_id=user_id, now=LUNCH, budget_level="mid").ensure()
+    contextual = ContextualRecommender(*load_order_tables(), users)
+    bundle = build_bundle(0, data=(users, items, orders))
+    get_tenant_registry().invalidate()  # tenants of the previous dataset size
+    restaurant_id = items["restaurant_id"].iloc[0]
+    rows = recommend_rows(user_id, top_k=100, ctx=ctx(), bundle=bundle)
+    recommender = SmartRecommender()
+    processor = SmartQueryProcessor()
+
+    def clear_caches():
+        recommender.recommendation_cache.clear()
+        processor.query_cache.clear()
+
+    return [
+        Benchmark("load_orders", load_orders),
+        Benchmark("user_item_matrix", user_item_matrix),
+        Benchmark("item_similarity", lambda: item_similarity(matrix)),
+        Benchmark("cf_scores_for_user", lambda: cf_scores_for_user(user_id)),
+        Benchmark("ContextualRecommender.recommend", lambda: contextual.recommend(user_id, k=10, context=ctx())),
+        Benchmark("score_items", lambda: score_items(user_id, ctx(), users, items, orders)),
+        Benchmark("recommend", lambda: recommend(user_id, top_k=10, ctx=ctx())),
+        # Served from a trained bundle, as with the refresher running: no reload from disk
+        Benchmark("recommend[bundle]", lambda: recommend(user_id, top_k=10, ctx=ctx(), bundle=bundle)),
+        Benchmark("recommend[tenant]", lambda: recommend(user_id, top_k=10, ctx=ctx(), restaurant_id=restaurant_id)),
+        Benchmark("dumps[recommendations]", lambda: dumps({"recommendations": rows, "metadata": {"user_id": user_id}})),
+        Benchmark("SmartRecommender.get_recommendations",
+                  lambda: recommender.get_recommendations(user_id, top_k=10, context=ctx(),
+                                                          user_query="something vegetarian",
+                                                          include_explanation=True),
+                  setup=clear_caches),
+        Benchmark("SmartQueryProcessor.process_query",
+                  lambda: processor.process_query("find a cheap vegetarian italian dinner for a date",
+                                                  user_id=user_id, current_time=LUNCH),
+                  setup=clear_caches),
+        Benchmark("generate_notifications", lambda: generate_notifications(user_id, now=LUNCH)),
+    ]
+
+
+def time_benchmark(bench: Benchmark, repeat: int) -> Dict:
+    timings = []
+    for _ in range(repeat):
+        if bench.setup:
+            bench.setup()
+        gc.collect()
+        start = time.perf_counter()
+        bench.run()
+        timings.append(time.perf_counter() - start)
+
+    # Separate traced run: tracemalloc slows execution, so it is not timed
+    if bench.setup:
+        bench.setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        bench.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min_seconds": min(timings),
+        "median_seconds": statistics.median(timings),
+        "mean_seconds": statistics.fmean(timings),
+        "repeat": repeat,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_size(size: str, repeat: int, only: Optional[List[str]] = None) -> List[Dict]:
+    from src.generate_mock_data import generate
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix=f"smart-menu-bench-{size}-") as tmp:
+        data_dir = os.path.join(tmp, "data")
+        generate(out_dir=data_dir, seed=42, days=90, **SIZES[size])
+        os.environ["SMART_MENU_DATA_DIR"] = data_dir
+        # Keep published models and shared caches of the host out of the measurements
+        os.environ["SMART_MENU_MODEL_DIR"] = os.path.join(tmp, "models")
+        os.environ["SMART_MENU_CACHE_BACKEND"] = "memory"
+
+        for bench in build_benchmarks(user_id=1):
+            if only and bench.name not in only:
+                continue
+            result = time_benchmark(bench, repeat)
+            result.update({"name": bench.name, "size": size, **SIZES[size]})
+            results.append(result)
+            print(f"{size:>7} {bench.name:<40} median {result['median_seconds'] * 1000:10.2f} ms"
+                  f"   peak {result['peak_memory_bytes'] / 2**20:8.2f} MiB")
+    return results
+
+
+def compare(current: List[Dict], baseline_path: str, threshold: float) -> List[str]:
+    """Names of benchmarks whose median slowed down by more than ``threshold``x"""
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in current:
+        before = baseline.get((result["name"], result["size"]))
+        if not before:
+            continue
+        ratio = result["median_seconds"] / max(before["median_seconds"], 1e-9)
+        mem_ratio = result["peak_memory_bytes"] / max(before["peak_memory_bytes"], 1)
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{result['size']:>7} {result['name']:<40} time x{ratio:5.2f}  memory x{mem_ratio:5.2f} {flag}")
+        if ratio > threshold:
+            regressions.append(f"{result['size']}/{result['name']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommender hot paths")
+    parser.add_argument("--sizes", type=str, default="tiny,small",
+                        help=f"Comma-separated dataset sizes ({', '.join(SIZES)})")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per benchmark")
+    parser.add_argument("--only", type=str, default=None, help="Comma-separated benchmark names")
+    parser.add_argument("--output", type=str, default="benchmarks/results.json", help="JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    only = args.only.split(",") if args.only else None
+    results = []
+    for size in args.sizes.split(","):
+        results.extend(run_size(size, args.repeat, only))
+
+    import numpy
+    import pandas
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": numpy.__version__,
+            "pandas": pandas.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 import json
@@ -21,6 +21,28 @@ from .models import UserProfile, UserFeedback
 from ..src.smart_recommender import get_smart_recommender
 from ..src.smart_query_processor import get_query_processor
 from ..src.contextual import Context
+from ..src.serialization import dumps
+
+
+def _profile_preferences(profile):
+    """Questionnaire answers of a profile in recommendation format"""
+    user_preferences = {
+        'diet': profile.diet,
+        'budget_sensitivity': profile.budget_sensitivity,
+        'favorite_categories': profile.get_favorite_categories(),
+        'time_preferences': profile.get_time_preferences(),
+        'allergies': profile.get_allergies(),
+        'dislikes': profile.get_dislikes(),
+        'health_goals': []
+    }
+    
+    if profile.wants_healthy_options:
+        user_preferences['health_goals'].append('healthy')
+    if profile.wants_low_calorie:
+        user_preferences['health_goals'].append('low_calorie')
+    if profile.wants_high_protein:
+        user_preferences['health_goals'].append('high_protein')
+    return user_preferences
 
 
 def home(request):
@@ -151,22 +173,7 @@ def recommendations(request):
     profile = get_object_or_404(UserProfile, user=request.user)
     
     # Convert profile to recommendation format
-    user_preferences = {
-        'diet': profile.diet,
-        'budget_sensitivity': profile.budget_sensitivity,
-        'favorite_categories': profile.get_favorite_categories(),
-        'time_preferences': profile.get_time_preferences(),
-        'allergies': profile.get_allergies(),
-        'dislikes': profile.get_dislikes(),
-        'health_goals': []
-    }
-    
-    if profile.wants_healthy_options:
-        user_preferences['health_goals'].append('healthy')
-    if profile.wants_low_calorie:
-        user_preferences['health_goals'].append('low_calorie')
-    if profile.wants_high_protein:
-        user_preferences['health_goals'].append('high_protein')
+    user_preferences = _profile_preferences(profile)
     
     # Set user preferences in recommender
     recommender = get_smart_recommender()
@@ -225,7 +232,8 @@ def quick_recommendations(request):
                 top_k=8,
                 context=context,
                 user_query=query,
-                include_explanation=True
+                include_explanation=True,
+                answers=_profile_preferences(profile)
             )
             
             return render(request, 'questionnaire/quick_recommendations.html', {
@@ -343,10 +351,11 @@ def api_recommendations(request):
             top_k=top_k,
             context=context,
             user_query=query,
-            include_explanation=True
+            include_explanation=True,
+            answers=_profile_preferences(profile)  # new users are served from their questionnaire segment
         )
         
-        return JsonResponse(result)
+        return HttpResponse(dumps(result), content_type='application/json')
     
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -1,6 +1,29 @@
 """
 API and integration layer
+Exports load on first access: ``app`` brings in FastAPI, the ``qs_*`` helpers
+only pandas, and neither is imported with the package itself.
 """
 
-from .api import *
-from .django_integration import *
\ No newline at end of file
+import importlib
+
+_EXPORTS = {
+    'app': 'api',
+    'FastJSONResponse': 'api',
+    'qs_menuitems_to_df': 'django_integration',
+    'qs_orders_to_df': 'django_integration',
+    'qs_users_to_df': 'django_integration',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,76 +1,140 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from datetime import datetime
+import os
+import time as _time
+import anyio
 from typing import Optional
-from .contextual import Context
-from .hybrid import recommend as base_recommend
-<<<<<<< HEAD
-from .hybrid_recommender import get_hybrid_recommender
-=======
-from .smart_recommender import get_smart_recommender
-from .smart_query_processor import get_query_processor
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
-from .notifications import generate_notifications
+from ..serialization import dumps
+from ..tracing import stage_latency_snapshot
+from ..metrics import (CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS,
+                       THREADPOOL_BUSY, THREADPOOL_QUEUE, render_metrics)
 import logging
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Smart Menu API - Hackathon Edition", version="2.0.0")
+
+class FastJSONResponse(JSONResponse):
+    """JSON encoded by ``serialization.dumps``: orjson when installed, item fragments spliced in.
+
+    Endpoints return it directly so FastAPI skips its generic ``jsonable_encoder`` pass.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+app = FastAPI(title="Smart Menu API - Hackathon Edition", version="2.0.0",
+              default_response_class=FastJSONResponse)
+
+
+# The recommenders (pandas, NumPy, models) are imported by the warm-up or the first
+# request that needs them, not with this module.
+
+@app.on_event("startup")
+def start_model_refresher():
+    """Warm up before taking traffic, then rebuild models in the background"""
+    from ..core.model_refresher import get_model_refresher
+    from ..core.scoring import get_scoring_config
+    from ..warmup import warm_up
+
+    if os.environ.get("SMART_MENU_WARMUP", "1") != "0":
+        warm_up()
+    else:
+        get_scoring_config()  # validate SMART_MENU_SCORING even without the warm-up
+    get_model_refresher().start()
+
+
+@app.on_event("shutdown")
+def stop_model_refresher():
+    from ..core.model_refresher import get_model_refresher
+
+    get_model_refresher().stop(timeout=5)
+
+
+_in_flight = 0
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and observe latency per endpoint"""
+    global _in_flight
+    _in_flight += 1  # single event-loop thread, no lock needed
+    start = _time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _in_flight -= 1
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method, status=status).inc()
+        HTTP_LATENCY.labels(endpoint=endpoint).observe(_time.perf_counter() - start)
+
+
+HTTP_IN_FLIGHT.set_function(lambda: _in_flight)
 
 
 @app.get("/recommendations")
 def get_recommendations(
-    user_id: int, 
+    user_id: int | None = Query(None, description="Omit for anonymous recommendations"),
     time: str | None = Query(None), 
     budget: str | None = Query(None), 
     top: int = 10,
-<<<<<<< HEAD
-    include_explanation: bool = Query(False, description="Include explanation"),
-    use_hybrid: bool = Query(True, description="Use hybrid recommendation system")
-=======
     query: str | None = Query(None, description="Natural language query for recommendations"),
     include_explanation: bool = Query(False, description="Include AI-generated explanation"),
-    use_smart: bool = Query(True, description="Use smart recommendation system")
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
+    use_smart: bool = Query(True, description="Use smart recommendation system"),
+    include_timings: bool = Query(False, description="Include per-stage latency breakdown"),
+    restaurant_id: int | None = Query(None, description="Recommend from this restaurant's menu only"),
+    diet: str | None = Query(None, description="Diet of an anonymous user (vegetarian, vegan, ...)")
 ):
     """Get personalized menu recommendations"""
+    from ..core.contextual import Context
+    from ..core.hybrid import NoServingBundle, recommend_rows
+    from ..core.tenants import SingleTenantData, UnknownTenant
+    from ..smart_recommender import get_smart_recommender
+
     try:
         ctx = Context(user_id=user_id, now=datetime.now(), time_of_day=time, budget_level=budget)
+        answers = {"diet": diet} if diet else None
         
-<<<<<<< HEAD
-        if use_hybrid:
-            # Use hybrid system
-            recommender = get_hybrid_recommender()
-=======
         if use_smart:
             # Use smart system with impressive features
             recommender = get_smart_recommender()
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
             result = recommender.get_recommendations(
                 user_id=user_id,
                 top_k=top,
                 context=ctx,
-<<<<<<< HEAD
-=======
                 user_query=query,
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
-                include_explanation=include_explanation
+                include_explanation=include_explanation,
+                include_timings=include_timings,
+                restaurant_id=restaurant_id,
+                answers=answers
             )
-            return result
+            return FastJSONResponse(result)
         else:
             # Use original system
-            df = base_recommend(user_id, top_k=top, ctx=ctx)
-            return {
-                "recommendations": df.to_dict(orient="records"),
+            rows = recommend_rows(user_id, top_k=top, ctx=ctx, restaurant_id=restaurant_id, answers=answers)
+            return FastJSONResponse({
+                "recommendations": rows,
                 "metadata": {
                     "user_id": user_id,
                     "time_of_day": ctx.time_of_day,
                     "budget_level": ctx.budget_level,
-                    "total_recommendations": len(df),
+                    "total_recommendations": len(rows),
                     "from_cache": False,
                     "processing_time_seconds": 0.0,
                     "timestamp": datetime.now().isoformat()
                 }
-            }
+            })
+    except UnknownTenant:
+        raise HTTPException(status_code=404, detail=f"Unknown restaurant {restaurant_id}")
+    except SingleTenantData as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NoServingBundle as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating recommendations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -79,8 +143,12 @@ def get_recommendations(
 @app.get("/notifications")
 def get_notifications(user_id: int):
     """Get personalized notifications for user"""
+    from ..notifications import UnknownUser, generate_notifications
+
     try:
         return {"notifications": generate_notifications(user_id)}
+    except UnknownUser:
+        raise HTTPException(status_code=404, detail=f"Unknown user {user_id}")
     except Exception as e:
         logger.error(f"Error generating notifications: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -95,39 +163,51 @@ def record_feedback(
     metadata: dict | None = None
 ):
     """Record user feedback for learning"""
+    from ..smart_recommender import get_smart_recommender
+
     try:
-<<<<<<< HEAD
-        recommender = get_hybrid_recommender()
-=======
         recommender = get_smart_recommender()
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
         recommender.record_feedback(user_id, item_id, value, feedback_type)
         return {"status": "success", "message": "Feedback recorded"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error recording feedback: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _system_stats():
+    from ..smart_recommender import get_smart_recommender
+    recommender = get_smart_recommender()
+    stats = recommender.get_system_stats()
+    stats['stage_latency'] = stage_latency_snapshot()
+    return stats
+
+
 @app.get("/metrics")
-def get_system_metrics():
+async def get_system_metrics(output_format: str = Query("prometheus", alias="format",
+                                                        description="prometheus | json")):
     """Get system performance metrics"""
     try:
-<<<<<<< HEAD
-        recommender = get_hybrid_recommender()
-=======
-        recommender = get_smart_recommender()
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
-        return recommender.get_system_stats()
+        # Sync endpoints run on the event loop's default thread limiter; read it here,
+        # before the collection below borrows a token of its own
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+        THREADPOOL_QUEUE.set(limiter.statistics().tasks_waiting)
+        # Gauge callbacks and stats query the caches (SQLite with that backend): off the event loop
+        if output_format == "json":
+            return await anyio.to_thread.run_sync(_system_stats)
+        return PlainTextResponse(await anyio.to_thread.run_sync(render_metrics), media_type=CONTENT_TYPE)
     except Exception as e:
         logger.error(f"Error getting metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-<<<<<<< HEAD
-=======
 @app.get("/query-analysis")
 def analyze_query(query: str):
     """Analyze natural language query"""
+    from ..smart_query_processor import get_query_processor
+
     try:
         processor = get_query_processor()
         result = processor.process_query(query, user_id=1)  # Demo user
@@ -137,7 +217,6 @@ def analyze_query(query: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
->>>>>>> 2929a20c83374885c753a507262aca7b42e52660
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
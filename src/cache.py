@@ -0,0 +1,353 @@
+"""
+Cache Backends - shared state for multi-worker deployments
+Namespaced key/value caches used by the recommenders for results, parsed
+queries, preference profiles and feedback.
+
+Backends:
+- ``memory``: per-process LRU dict (default, fastest, not shared)
+- ``sqlite``: local SQLite file in WAL mode, shared by every worker on a host
+- ``django``: Django's configured cache framework (``CACHES`` setting)
+
+The backend is selected with the ``SMART_MENU_CACHE_BACKEND`` environment
+variable; the SQLite file location with ``SMART_MENU_CACHE_PATH``.
+Recommendation results expire after ``SMART_MENU_RECOMMENDATION_TTL`` seconds
+(default 300, ``0`` keeps them until evicted or cleared).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .metrics import CACHE_EVICTIONS, CACHE_REQUESTS, CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "memory"
+DEFAULT_SQLITE_PATH = "data/cache/smart_menu_cache.sqlite3"
+DEFAULT_RECOMMENDATION_TTL = 300.0
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """Base class for namespaced key/value caches"""
+
+    backend_name = "base"
+    bounded = True  # honours max_entries
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_counter = CACHE_REQUESTS.labels(cache=namespace, result="hit")
+        self._miss_counter = CACHE_REQUESTS.labels(cache=namespace, result="miss")
+        self._eviction_counter = CACHE_EVICTIONS.labels(cache=namespace)
+        _live_caches.add(self)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Return the cached value for ``key`` or ``default``"""
+        value = self._get(str(key))
+        if value is _MISSING:
+            self.misses += 1
+            self._miss_counter.inc()
+            return default
+        self.hits += 1
+        self._hit_counter.inc()
+        return value
+
+    def _record_evictions(self, count: int):
+        self.evictions += count
+        self._eviction_counter.inc(count)
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        """Store ``value`` under ``key`` (``ttl`` in seconds overrides the default)"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._set(str(key), value, expires_at)
+
+    def delete(self, key: Any):
+        """Remove ``key`` if present"""
+        self._delete(str(key))
+
+    def clear(self):
+        """Remove every entry in this namespace"""
+        raise NotImplementedError
+
+    def size(self) -> Optional[int]:
+        """Number of live entries, or None if the backend cannot tell"""
+        raise NotImplementedError
+
+    def __contains__(self, key: Any) -> bool:
+        return self._get(str(key)) is not _MISSING
+
+    def __len__(self) -> int:
+        return self.size() or 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-process hit/miss/eviction counters"""
+        return {
+            'backend': self.backend_name,
+            'namespace': self.namespace,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': self.size(),
+        }
+
+    def _get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        raise NotImplementedError
+
+    def _delete(self, key: str):
+        raise NotImplementedError
+
+
+class InProcessCache(CacheBackend):
+    """LRU dict cache local to the current process"""
+
+    backend_name = "memory"
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        super().__init__(namespace, ttl, max_entries)
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self._record_evictions(1)
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a local SQLite file shared by all workers on a host"""
+
+    backend_name = "sqlite"
+
+    # Prune expired/overflow rows once every N writes rather than on each one
+    PRUNE_EVERY = 100
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, path: Optional[str] = None):
+        super().__init__(namespace, ttl, max_entries)
+        self.path = path or os.environ.get("SMART_MENU_CACHE_PATH", DEFAULT_SQLITE_PATH)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " expires_at REAL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_updated ON cache (namespace, updated_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Any:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return _MISSING
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self._delete(key)
+            return _MISSING
+        return pickle.loads(value)
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, payload, expires_at, time.time()),
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        """Drop expired rows and, if bounded, the least recently written overflow"""
+        conn = self._connection()
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, time.time()),
+        )
+        if self.max_entries is None:
+            return
+        overflow = (self.size() or 0) - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE rowid IN ("
+                " SELECT rowid FROM cache WHERE namespace = ?"
+                " ORDER BY updated_at LIMIT ?)",
+                (self.namespace, overflow),
+            )
+            self._record_evictions(overflow)
+
+    def _delete(self, key: str):
+        self._connection().execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def size(self) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?"
+            " AND (expires_at IS NULL OR expires_at >= ?)",
+            (self.namespace, time.time()),
+        ).fetchone()
+        return row[0]
+
+
+class DjangoCache(CacheBackend):
+    """Cache backed by Django's cache framework (memcached, redis, db, ...).
+
+    Entries are bounded by the Django cache's own eviction (e.g.
+    ``OPTIONS['MAX_ENTRIES']``), not per namespace, so there is no ``max_entries``.
+    """
+
+    backend_name = "django"
+    bounded = False
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None, alias: str = "default"):
+        super().__init__(namespace, ttl)
+        from django.core.cache import caches  # optional dependency
+
+        self._cache = caches[alias]
+        self._generation_key = f"smart_menu:{namespace}:generation"
+
+    def _generation(self) -> int:
+        # Bumping the generation invalidates the whole namespace in O(1)
+        generation = self._cache.get(self._generation_key)
+        if generation is None:
+            self._cache.add(self._generation_key, 1, timeout=None)
+            generation = self._cache.get(self._generation_key, 1)
+        return generation
+
+    def _full_key(self, key: str) -> str:
+        return f"smart_menu:{self.namespace}:{self._generation()}:{key}"
+
+    def _get(self, key: str) -> Any:
+        return self._cache.get(self._full_key(key), _MISSING)
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        timeout = max(expires_at - time.time(), 0) if expires_at else None
+        self._cache.set(self._full_key(key), value, timeout=timeout)
+
+    def _delete(self, key: str):
+        self._cache.delete(self._full_key(key))
+
+    def clear(self):
+        try:
+            self._cache.incr(self._generation_key)
+        except ValueError:
+            self._cache.set(self._generation_key, 1, timeout=None)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+# Every live cache, so /metrics can report entry counts at scrape time
+_live_caches = weakref.WeakSet()
+CACHE_SIZE.set_function(lambda: {(cache.namespace,): cache.size() for cache in list(_live_caches)})
+
+
+_BACKENDS = {
+    'memory': InProcessCache,
+    'sqlite': SQLiteCache,
+    'django': DjangoCache,
+}
+
+
+def get_cache(namespace: str, ttl: Optional[float] = None,
+              max_entries: Optional[int] = None, backend: Optional[str] = None) -> CacheBackend:
+    """Create a cache for ``namespace`` using the configured backend"""
+    backend = backend or os.environ.get("SMART_MENU_CACHE_BACKEND", DEFAULT_BACKEND)
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown cache backend '{backend}', expected one of {sorted(_BACKENDS)}")
+    cls = _BACKENDS[backend]
+    try:
+        if cls.bounded:
+            return cls(namespace, ttl=ttl, max_entries=max_entries)
+        if max_entries is not None:
+            logger.debug(f"Cache '{namespace}': {backend} backend bounds entries itself, max_entries ignored")
+        return cls(namespace, ttl=ttl)
+    except Exception as e:
+        logger.warning(f"Cache backend '{backend}' unavailable ({e}), falling back to in-process cache")
+        return InProcessCache(namespace, ttl=ttl, max_entries=max_entries)
+
+
+def get_recommendation_cache(namespace: str = 'recommendations') -> CacheBackend:
+    """A bounded result cache, entries expiring after SMART_MENU_RECOMMENDATION_TTL seconds"""
+    ttl = float(os.environ.get("SMART_MENU_RECOMMENDATION_TTL", DEFAULT_RECOMMENDATION_TTL))
+    return get_cache(namespace, ttl=ttl or None, max_entries=10000)
+
+
+def fingerprint(value: Any) -> str:
+    """Short stable digest of a JSON-like value (same across processes), for cache keys"""
+    if not value:
+        return "-"
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
@@ -1,15 +1,32 @@
 """
 Core recommendation algorithms and models
+Exports load on first access, so importing one submodule (``src.core.contextual``)
+does not pull in every recommender.
 """
 
-from .collaborative import cf_scores_for_user
-from .contextual import get_contextual_recommendations
-from .hybrid import get_hybrid_recommendations
-from .popularity import get_popular_items
-
-__all__ = [
-    'cf_scores_for_user',
-    'get_contextual_recommendations',
-    'get_hybrid_recommendations',
-    'get_popular_items',
-]
\ No newline at end of file
+import importlib
+
+_EXPORTS = {
+    'cf_scores_for_user': 'collaborative',
+    'CollaborativeFiltering': 'collaborative',
+    'Context': 'contextual',
+    'ContextualRecommender': 'contextual',
+    'recommend': 'hybrid',
+    'PopularityCube': 'popularity',
+    'PopularityRecommender': 'popularity',
+    'item_popularity': 'popularity',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
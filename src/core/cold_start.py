@@ -0,0 +1,207 @@
+"""
+Cold Start - onboarding recommendations for users without order history
+A user the bundle has never seen order (new in the users table, or only
+known to the Django questionnaire) has no favorites, no recent orders and no
+CF row, so the hybrid score reduces to the content score of their
+questionnaire answers. Those answers fall into a small number of segments
+(diet, budget, cuisines, meal times): ``SegmentTable`` scores each segment
+once per bundle and context, keeps the ranked recommendations built on top
+of it, and serves both with a dictionary lookup afterwards.
+
+New users are detected with the bundle's user-id sets, in O(1)
+(``ModelBundle.has_history``). Without a served bundle, ``score_catalogue``
+looks them up in a ``DatasetIndex`` of the loaded frames and scores their
+segment with ``score_answers``, uncached.
+
+Anonymous requests carry no answers beyond an optional diet, so their
+results only depend on (time of day, season, budget, diet). ``materialize``
+ranks every combination for the current season when a bundle is built, and
+``anonymous`` serves them from a plain dictionary that is never evicted.
+
+Configuration (environment):
+- ``SMART_MENU_ANONYMOUS_TOP_K``: recommendations per materialized anonymous
+  entry (default 10, the API default; read when a bundle is materialized);
+  other sizes use the segment caches
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Mapping, Optional, Tuple, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from ..metrics import COLD_START_REQUESTS
+from ..utils import season_of
+from .contextual import BUDGET_LEVELS, TIMES_OF_DAY, Context
+from .hybrid import ScoredItems, content_scores
+from .item_features import get_item_features
+from .model_refresher import ModelBundle
+from .scoring import ScoringFormula, scoring_formula
+
+T = TypeVar("T")
+
+# Questionnaire choices (questionnaire/models.py UserProfile), plus the mock data's "chicken"
+DIETS = ("none", "vegetarian", "vegan", "chicken", "keto", "paleo", "halal", "kosher", "gluten_free")
+BUDGETS = ("low", "mid", "high")
+
+# Cached segment entries per bundle (scores and ranked recommendations each)
+SEGMENT_CACHE_SIZE = 4096
+
+# Budget levels of anonymous requests (None: no budget given)
+ANONYMOUS_BUDGETS = (None,) + BUDGET_LEVELS
+DEFAULT_ANONYMOUS_TOP_K = 10
+
+def anonymous_top_k() -> int:
+    """Rows per materialized anonymous entry (SMART_MENU_ANONYMOUS_TOP_K)"""
+    return int(os.environ.get("SMART_MENU_ANONYMOUS_TOP_K", DEFAULT_ANONYMOUS_TOP_K))
+
+
+# Stands in for the segment's user when scoring: no orders, favorites or CF row
+SEGMENT_USER_ID = -1
+NO_ORDERS = pd.DataFrame({"user_id": pd.Series(dtype="int64"), "item_id": pd.Series(dtype="int64"),
+                          "timestamp": pd.Series(dtype="datetime64[ns]")})
+
+
+def _as_list(value) -> list:
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return list(value) if isinstance(value, (list, tuple, set)) else []
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Questionnaire answers that decide a new user's recommendations"""
+    diet: str = "none"
+    budget: str = "medium"
+    cuisines: Tuple[str, ...] = ()
+    times: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_answers(cls, answers: Optional[Mapping[str, Any]]) -> "Segment":
+        """From preferences as stored by ``set_user_preferences`` (or a users table row)"""
+        answers = answers or {}
+        return cls(
+            diet=str(answers.get("diet") or "none"),
+            budget=str(answers.get("budget_sensitivity") or "medium"),
+            cuisines=tuple(sorted(_as_list(answers.get("favorite_categories")))),
+            times=tuple(sorted(_as_list(answers.get("time_preferences")))),
+        )
+
+    @classmethod
+    def for_user(cls, bundle: ModelBundle, user_id: int,
+                 answers: Optional[Mapping[str, Any]] = None) -> "Segment":
+        """The given answers, else the user's row in the users table, else the defaults.
+
+        ``bundle`` can be anything with ``user_answers``, e.g. a ``DatasetIndex``.
+        """
+        return cls.from_answers(answers or bundle.user_answers(user_id))
+
+    def preferences(self) -> Dict[str, Any]:
+        """As the personalization stage reads them"""
+        return {"diet": self.diet, "favorite_categories": list(self.cuisines), "time_preferences": list(self.times)}
+
+
+def score_answers(segment: Segment, ctx: Context, features, popularity: pd.Series,
+                  formula: Optional[ScoringFormula] = None) -> ScoredItems:
+    """``score_catalogue`` for a user with the segment's answers and no orders"""
+    users = pd.DataFrame([{"user_id": SEGMENT_USER_ID, "diet": segment.diet,
+                           "budget_sensitivity": segment.budget}])
+    content = content_scores(SEGMENT_USER_ID, ctx, users, features, NO_ORDERS,
+                             popularity=popularity, favorites=pd.Series(dtype=float), formula=formula)
+    return ScoredItems.combine(features, content["score"], np.zeros(len(features)), formula)
+
+
+def score_segment(bundle: ModelBundle, segment: Segment, ctx: Context,
+                  formula: Optional[ScoringFormula] = None) -> ScoredItems:
+    """``score_answers`` over the bundle's menu and decayed popularity"""
+    return score_answers(segment, ctx, get_item_features(bundle.items), bundle.decayed_popularity_at(ctx.now),
+                         formula)
+
+
+class SegmentTable:
+    """Cold-start scores and recommendations of one bundle, computed once per segment and context"""
+
+    def __init__(self, bundle: ModelBundle, max_entries: int = SEGMENT_CACHE_SIZE):
+        self.bundle = bundle
+        self.max_entries = max_entries
+        self._scored: "OrderedDict[Hashable, ScoredItems]" = OrderedDict()
+        self._recommendations: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._anonymous: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, kind: str, store: OrderedDict, key: Hashable, compute: Callable[[], T]) -> T:
+        with self._lock:
+            if key in store:
+                store.move_to_end(key)
+                self.hits += 1
+                COLD_START_REQUESTS.labels(kind=kind, result="hit").inc()
+                return store[key]
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            COLD_START_REQUESTS.labels(kind=kind, result="miss").inc()
+            store[key] = value
+            while len(store) > self.max_entries:
+                store.popitem(last=False)
+        return value
+
+    def scored(self, segment: Segment, ctx: Context, formula: Optional[ScoringFormula] = None) -> ScoredItems:
+        """Catalogue scores of the segment under a scoring variant (default: the default variant).
+
+        Only the segment's diet and budget enter the content score.
+        """
+        ctx.ensure()
+        formula = formula or scoring_formula()
+        key = (formula.name, segment.diet, segment.budget, ctx.time_of_day, ctx.budget_level, season_of(ctx.now))
+        return self._cached("scores", self._scored, key, lambda: score_segment(self.bundle, segment, ctx, formula))
+
+    def recommendations(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """Ranked recommendations under ``key`` (segment, context and request options)"""
+        return self._cached("recommendations", self._recommendations, key, compute)
+
+    def precompute(self, ctx: Context, diets: Iterable[str] = DIETS, budgets: Iterable[str] = BUDGETS):
+        """Score every diet x budget segment for ``ctx`` ahead of the first new user"""
+        for diet in diets:
+            for budget in budgets:
+                self.scored(Segment(diet=diet, budget=budget), ctx)
+
+    def materialize(self, kind: str, rank: Callable[[ScoredItems, Context, Segment], T], now=None,
+                    diets: Iterable[str] = DIETS, top_k: int | None = None):
+        """Rank every anonymous (time of day, budget, diet) of the current season with ``rank``"""
+        now = now or pd.Timestamp.now().to_pydatetime()
+        top_k = top_k or anonymous_top_k()
+        season = season_of(now)
+        table = {}
+        for time_of_day in TIMES_OF_DAY:
+            for budget in ANONYMOUS_BUDGETS:
+                for diet in diets:
+                    ctx = Context(user_id=None, now=now, budget_level=budget, time_of_day=time_of_day)
+                    segment = Segment(diet=diet)
+                    key = (kind, time_of_day, season, budget, diet, top_k)
+                    table[key] = rank(self.scored(segment, ctx), ctx, segment)
+        self._anonymous.update(table)
+
+    def anonymous(self, kind: str, ctx: Context, segment: Segment, top_k: int) -> Optional[Any]:
+        """Materialized ``kind`` rows for an anonymous request, None when not materialized"""
+        if segment != Segment(diet=segment.diet):  # answers beyond the diet
+            return None
+        ctx.ensure()
+        rows = self._anonymous.get((kind, ctx.time_of_day, season_of(ctx.now), ctx.budget_level, segment.diet, top_k))
+        COLD_START_REQUESTS.labels(kind="anonymous", result="miss" if rows is None else "hit").inc()
+        return rows
+
+    def stats(self) -> Dict:
+        return {
+            'segments_scored': len(self._scored),
+            'recommendation_entries': len(self._recommendations),
+            'anonymous_entries': len(self._anonymous),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -1,15 +1,28 @@
 from __future__ import annotations
 
+import os
 import numpy as np
 import pandas as pd
-from typing import Tuple
+from dataclasses import dataclass
+from typing import Dict, Tuple, Union
 from pathlib import Path
-from .data_loader import load_orders  # Update import to use relative path
-from .collaborative import user_item_matrix, item_similarity, cf_scores_for_user
+from ..data_loader import load_orders, prepare_orders
+from ..tracing import traced
+from .factorization import ALSModel
+from .ranking import top_k_series
+from .shared_model import SharedModel, SharedModelStore, get_shared_model_store
+from .similarity import sharded_cosine_similarity
 
+# CF backends selectable with SMART_MENU_CF_BACKEND
+CF_BACKENDS = ("item_similarity", "als")
 
-def user_item_matrix() -> pd.DataFrame:
-    orders = load_orders()
+
+# Interaction weight of one added or removed ingredient, on top of the ordered quantity
+CUSTOMIZATION_WEIGHT = 0.2
+
+
+def user_item_matrix(orders: pd.DataFrame | None = None) -> pd.DataFrame:
+    orders = load_orders() if orders is None else orders
     mat = orders.pivot_table(
         index="user_id",
         columns="item_id",
@@ -18,26 +31,55 @@ def user_item_matrix() -> pd.DataFrame:
         fill_value=0,
     ).astype(float)
     
-    # Add weight for customizations (added/removed ingredients)
-    customization_weight = 0.2  # Adjust this value based on how much you want to emphasize modifications
-    
-    for user_id in mat.index:
-        user_orders = orders[orders["user_id"] == user_id]
-        for item_id in mat.columns:
-            item_orders = user_orders[user_orders["item_id"] == item_id]
-            if not item_orders.empty:
-                # Count number of modifications
-                modifications = sum(
-                    len(mods) if isinstance(mods, list) else 0
-                    for mods in item_orders["added_ingredients"].tolist() + 
-                    item_orders["removed_ingredients"].tolist()
-                )
-                # Add weighted modification score to the interaction strength
-                mat.loc[user_id, item_id] += modifications * customization_weight
-    
+    # Count number of modifications per order line, then per (user, item)
+    modifications = line_modifications(orders).groupby([orders["user_id"], orders["item_id"]]).sum()
+    return add_customizations(mat, modifications.unstack(fill_value=0))
+
+
+def line_modifications(orders: pd.DataFrame) -> pd.Series:
+    """Added plus removed ingredients of each order line"""
+    modifications = pd.Series(0, index=orders.index)
+    for col in ["added_ingredients", "removed_ingredients"]:
+        if col in orders.columns:
+            modifications += orders[col].map(lambda mods: len(mods) if isinstance(mods, list) else 0)
+    return modifications
+
+
+def add_customizations(mat: pd.DataFrame, modifications: pd.DataFrame) -> pd.DataFrame:
+    """Add the weighted (user x item) modification counts to the interaction strength"""
+    mat += modifications.reindex(index=mat.index, columns=mat.columns, fill_value=0) * CUSTOMIZATION_WEIGHT
     return mat
 
 
+@dataclass
+class SparseInteractions:
+    """``user_item_matrix`` as COO triples over sorted user and item ids (zeros left out)"""
+    users: np.ndarray   # user ids, one per row
+    items: np.ndarray   # item ids, one per column
+    rows: np.ndarray
+    cols: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_pairs(cls, strengths: pd.Series) -> "SparseInteractions":
+        """From interaction strengths indexed by (user_id, item_id)"""
+        strengths = strengths[strengths.to_numpy() != 0]
+        users, rows = np.unique(strengths.index.get_level_values(0).to_numpy(), return_inverse=True)
+        items, cols = np.unique(strengths.index.get_level_values(1).to_numpy(), return_inverse=True)
+        return cls(users=users, items=items, rows=rows, cols=cols, values=strengths.to_numpy(dtype=float))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.users), len(self.items)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The dense ``user_item_matrix``"""
+        dense = np.zeros(self.shape)
+        dense[self.rows, self.cols] = self.values
+        return pd.DataFrame(dense, index=pd.Index(self.users, name="user_id"),
+                            columns=pd.Index(self.items, name="item_id"))
+
+
 def _cosine_similarity(matrix: np.ndarray) -> np.ndarray:
     norms = np.linalg.norm(matrix, axis=0, keepdims=True) + 1e-9 # Prevent division by zero
     normalized = matrix / norms
@@ -49,48 +91,198 @@ def item_similarity(mat: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Index, pd.Index
     return pd.DataFrame(sim, index=mat.columns, columns=mat.columns), mat.index, mat.columns
 
 
-def cf_scores_for_user(user_id: int, top_k: int | None = None) -> pd.Series:
-    mat = user_item_matrix()
-    if user_id not in mat.index:
-        return pd.Series(dtype=float)
+@dataclass
+class ItemSimilarityModel:
+    """Trained item-item CF model as plain arrays (shareable between workers)"""
+    users: np.ndarray         # user ids, row order of `interactions`
+    items: np.ndarray         # item ids, column order of `interactions`/`similarity`
+    interactions: np.ndarray  # users x items
+    similarity: np.ndarray    # items x items
+    generation: int = 0
+
+    kind = "item_similarity"
+
+    def __post_init__(self):
+        self._user_rows = {u: i for i, u in enumerate(self.users.tolist())}
+
+    @classmethod
+    def from_matrix(cls, mat: pd.DataFrame, workers: int = 1,
+                    neighbours: int | None = None) -> "ItemSimilarityModel":
+        """Train on ``mat``; more than one worker shards the users across processes (see similarity.py)"""
+        if workers > 1 or neighbours is not None:
+            similarity = sharded_cosine_similarity(mat.values, workers=workers, neighbours=neighbours)
+        else:
+            similarity = _cosine_similarity(mat.values)
+        return cls(
+            users=mat.index.to_numpy(),
+            items=mat.columns.to_numpy(),
+            interactions=mat.values,
+            similarity=similarity,
+        )
+
+    @classmethod
+    def from_shared(cls, shared: SharedModel) -> "ItemSimilarityModel":
+        return cls(
+            users=shared["users"],
+            items=shared["items"],
+            interactions=shared["interactions"],
+            similarity=shared["similarity"],
+            generation=shared.generation,
+        )
+
+    def shared_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "users": self.users,
+            "items": self.items,
+            "interactions": self.interactions,
+            "similarity": self.similarity,
+        }
+
+    def shared_metadata(self) -> Dict:
+        return {"kind": self.kind}
 
-    sim, _, items = item_similarity(mat)
+    def _scores(self, weights: np.ndarray) -> np.ndarray:
+        """CF scores of interaction rows (one row per user)"""
+        scores = weights @ self.similarity.T
+        # Do not recommend items already consumed heavily
+        scores = scores - weights * 0.5
+        return np.clip(scores, 0, None)  # remove negative
 
-    user_vector = mat.loc[user_id]
-    weights = user_vector.values
-    if np.all(weights == 0):
+    def score_matrix(self, user_ids) -> np.ndarray:
+        """users x ``items`` scores (``scores_for_user`` for many users); NaN rows for users it cannot score"""
+        rows = np.array([self._user_rows.get(user_id, -1) for user_id in user_ids], dtype=int)
+        known = np.flatnonzero(rows >= 0)
+        weights = self.interactions[rows[known]]
+        scores = np.full((len(rows), len(self.items)), np.nan)
+        scores[known] = self._scores(weights)
+        scores[known[~weights.any(axis=1)]] = np.nan
+        return scores
+
+    def scores_for_user(self, user_id: int, top_k: int | None = None,
+                        history: pd.Series | None = None) -> pd.Series:
+        row = self._user_rows.get(user_id)
+        if row is not None:
+            weights = self.interactions[row]
+        elif history is not None:
+            # Unknown to the model: score from the given (item_id -> interaction) history
+            weights = history.reindex(self.items).fillna(0.0).to_numpy(dtype=float)
+        else:
+            return pd.Series(dtype=float)
+
+        if np.all(weights == 0):
+            return pd.Series(dtype=float)
+
+        scores = pd.Series(self._scores(weights[None, :])[0], index=self.items)
+
+        if top_k:
+            scores = top_k_series(scores, top_k)
+        return scores
+
+
+CFModel = Union[ItemSimilarityModel, ALSModel]
+
+
+def user_history(orders: pd.DataFrame, user_id: int) -> pd.Series:
+    """One user's row of ``user_item_matrix`` (item_id -> interaction strength)"""
+    user_orders = orders.loc[orders["user_id"] == user_id]
+    if user_orders.empty:
         return pd.Series(dtype=float)
+    return user_item_matrix(user_orders).iloc[0]
+
+
+def build_model(orders: pd.DataFrame | None = None, backend: str | None = None,
+                matrix: pd.DataFrame | SparseInteractions | None = None, workers: int | None = None,
+                neighbours: int | None = None) -> CFModel:
+    """Train the CF model; ``backend`` defaults to SMART_MENU_CF_BACKEND (item_similarity).
 
-    scores = sim.values @ weights
-    scores = pd.Series(scores, index=items)
-    # Do not recommend items already consumed heavily
-    scores -= user_vector * 0.5
-    scores = scores.clip(lower=0) #remove negative 
+    ``matrix`` is a precomputed ``user_item_matrix``, dense or sparse (e.g. from
+    streamed orders); ALS trains on a sparse one without densifying it.
+    ``workers`` parallelizes training (processes for item_similarity, threads
+    for ALS); ``neighbours`` prunes item_similarity to each item's top-N.
+    """
+    backend = backend or os.environ.get("SMART_MENU_CF_BACKEND", "item_similarity")
+    if backend not in CF_BACKENDS:
+        raise ValueError(f"Unknown CF backend '{backend}' (choose from {', '.join(CF_BACKENDS)})")
+    matrix = user_item_matrix(orders) if matrix is None else matrix
+    if isinstance(matrix, SparseInteractions):
+        if backend == "als":
+            return ALSModel.from_sparse(matrix.users, matrix.items, matrix.rows, matrix.cols, matrix.values,
+                                        workers=workers)
+        matrix = matrix.to_frame()  # the item-item model keeps the dense interactions
+    if backend == "als":
+        return ALSModel.from_matrix(matrix, workers=workers)
+    return ItemSimilarityModel.from_matrix(matrix, workers=workers or 1, neighbours=neighbours)
 
-    if top_k:
-        scores = scores.nlargest(top_k)
-    return scores
+
+def publish_model(model: CFModel, items: pd.DataFrame | None = None,
+                  store: SharedModelStore | None = None) -> int:
+    """Publish the model (and numeric item features) into shared memory"""
+    store = store or get_shared_model_store()
+    arrays = model.shared_arrays()
+    if items is not None:
+        arrays["feature_item_ids"] = items["item_id"].to_numpy()
+        for col in ["price", "popularity_score", "calories", "preparation_time"]:
+            if col in items.columns:
+                arrays[f"feature_{col}"] = items[col].to_numpy(dtype=float)
+    return store.publish(arrays, metadata=model.shared_metadata())
+
+
+def shared_model(store: SharedModelStore | None = None) -> CFModel | None:
+    """Attach to the published model, swapping when its generation changes"""
+    global _shared_cf_model
+    shared = (store or get_shared_model_store()).get()
+    if shared is None:
+        return None
+    if "item_factors" in shared:
+        model_class = ALSModel
+    elif "similarity" in shared:
+        model_class = ItemSimilarityModel
+    else:
+        return None
+    if _shared_cf_model is None or _shared_cf_model.generation != shared.generation:
+        _shared_cf_model = model_class.from_shared(shared)
+    return _shared_cf_model
+
+
+_shared_cf_model = None
+
+
+@traced()
+def cf_scores_for_user(user_id: int, top_k: int | None = None, model: CFModel | None = None,
+                       history: pd.Series | None = None) -> pd.Series:
+    """CF scores per item; ``history`` folds in users the model was not trained on"""
+    model = model or shared_model() or build_model()
+    return model.scores_for_user(user_id, top_k=top_k, history=history)
 
 
 class CollaborativeFiltering:
     """Wrapper class for collaborative filtering functions"""
     
-    def __init__(self, orders, order_items):
+    def __init__(self, orders, order_items, backend: str | None = None):
         self.orders = orders
         self.order_items = order_items
-        self.matrix = user_item_matrix()
-        self.similarity_matrix, _, self.items = item_similarity(self.matrix)
+        if orders is not None and order_items is not None:
+            # Train on exactly the data given (e.g. an evaluation split)
+            self.model = build_model(prepare_orders(orders, order_items), backend=backend)
+        else:
+            # Attach to the published model when one exists instead of rebuilding
+            self.model = shared_model() or build_model(backend=backend)
+        self.items = pd.Index(self.model.items)
+        # The interaction and similarity matrices only exist for the item-similarity backend
+        self.matrix = self.similarity_matrix = None
+        if isinstance(self.model, ItemSimilarityModel):
+            self.matrix = pd.DataFrame(self.model.interactions, index=self.model.users,
+                                       columns=self.model.items, copy=False)
+            self.similarity_matrix = pd.DataFrame(self.model.similarity, index=self.items,
+                                                  columns=self.items, copy=False)
     
     def recommend(self, user_id: int, k: int = 5) -> pd.Series:
         """Generate recommendations for a user"""
         try:
             # Use existing cf_scores_for_user function
-            scores = cf_scores_for_user(user_id, top_k=k)
+            scores = cf_scores_for_user(user_id, top_k=k, model=self.model)
             return scores
             
         except Exception as e:
             print(f"Error generating recommendations for user {user_id}: {e}")
             return pd.Series()
-
-
-
@@ -1,7 +1,13 @@
 from dataclasses import dataclass
 from datetime import datetime
+import logging
+
 import pandas as pd
 import numpy as np
+from ..utils import season_of
+from .ranking import top_k_indices
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -25,6 +31,40 @@ class Context:
         return self
 
 
+# Context buckets: per-item demand is precomputed for every combination
+TIMES_OF_DAY = ("morning", "lunch", "afternoon", "dinner")
+SEASONS = ("winter", "spring", "summer", "autumn")
+BUDGET_LEVELS = ("low", "mid", "high")
+
+# Season of each month, January first (as ``utils.season_of``)
+MONTH_SEASONS = np.array(["winter", "winter", "spring", "spring", "spring", "summer",
+                          "summer", "summer", "autumn", "autumn", "autumn", "winter"])
+
+# Pseudo-quantity pulling sparse buckets toward the item's overall share
+BUCKET_PRIOR = 10.0
+
+
+def normalize_budget_level(value) -> str:
+    """low | mid | high (``medium`` and unknown values count as mid)"""
+    value = str(value).lower()
+    if value == "medium":
+        return "mid"
+    return value if value in BUDGET_LEVELS else "mid"
+
+
+def times_of_day(timestamps: pd.Series) -> pd.Series:
+    """Vectorized ``Context.ensure`` time-of-day bucketing"""
+    hours = timestamps.dt.hour
+    return pd.Series(np.select(
+        [(hours >= 6) & (hours < 11), (hours >= 11) & (hours < 15), (hours >= 15) & (hours < 18)],
+        ["morning", "lunch", "afternoon"], "dinner"), index=timestamps.index)
+
+
+def seasons(timestamps: pd.Series) -> pd.Series:
+    """Vectorized ``utils.season_of``"""
+    return pd.Series(MONTH_SEASONS[timestamps.dt.month.to_numpy() - 1], index=timestamps.index)
+
+
 class ContextualRecommender:
     """Contextual recommendation system based on user and order context"""
 
@@ -51,35 +91,74 @@ class ContextualRecommender:
             aggfunc="sum",
             fill_value=0,
         )
+        self.items = self.interaction_matrix.columns.to_numpy()
+        self._history = self.interaction_matrix.to_numpy()
+        self._user_rows = {u: i for i, u in enumerate(self.interaction_matrix.index.tolist())}
+        self._user_budgets = (
+            dict(zip(self.users["user_id"], self.users["budget_sensitivity"].map(normalize_budget_level)))
+            if "budget_sensitivity" in self.users.columns else {}
+        )
 
-    def recommend(self, user_id, k=5):
-        """Generate contextual recommendations for a user"""
-        try:
-            # Get user's history
-            user_history = self.interaction_matrix.loc[user_id]
-
-            # Calculate item scores based on context
-            scores = pd.Series(
-                np.zeros(len(self.interaction_matrix.columns)),
-                index=self.interaction_matrix.columns,
-            )
-
-            # Simple scoring based on item popularity and user history
-            for item_id in self.interaction_matrix.columns:
-                if user_history[item_id] == 0:  # Only recommend unordered items
-                    item_popularity = self.interaction_matrix[item_id].mean()
-                    scores[item_id] = item_popularity
-
-            # Return top-k recommendations
-            return scores.nlargest(k)
-
-        except KeyError:
-            print(f"User {user_id} not found in interaction matrix")
-            return pd.Series()
-        except Exception as e:
-            print(f"Error generating recommendations: {e}")
-            return pd.Series()
-
-
-
+        # Mean demand per item over all users (the context-free score)
+        self.item_means = self._history.mean(axis=0) if len(self._history) else np.zeros(len(self.items))
+        self.bucket_scores = self._bucket_scores()
+
+    def _lift(self, values: pd.Series, levels: tuple) -> np.ndarray:
+        """levels x items ratio of each item's demand share within a level to its overall share"""
+        quantity = (self.user_items.groupby([values, self.user_items["item_id"]])["quantity"].sum()
+                    .unstack(fill_value=0)
+                    .reindex(index=list(levels), columns=self.items, fill_value=0)
+                    .to_numpy(dtype=float))
+        overall = quantity.sum(axis=0) / max(quantity.sum(), 1e-9)
+        share = (quantity + BUCKET_PRIOR * overall) / (quantity.sum(axis=1, keepdims=True) + BUCKET_PRIOR)
+        return np.divide(share, overall, out=np.ones_like(share), where=overall > 0)
+
+    def _bucket_scores(self) -> np.ndarray:
+        """Item scores for every (time of day, season, budget) bucket, shape 4 x 4 x 3 x items"""
+        lines = self.user_items
+        time_of_day = lines["time_of_day"] if "time_of_day" in lines.columns else times_of_day(lines["timestamp"])
+        season = seasons(lines["timestamp"])
+        budget = lines["user_id"].map(self._user_budgets).fillna("mid")
+
+        return (self.item_means
+                * self._lift(time_of_day, TIMES_OF_DAY)[:, None, None, :]
+                * self._lift(season, SEASONS)[None, :, None, :]
+                * self._lift(budget, BUDGET_LEVELS)[None, None, :, :])
+
+    def bucket(self, context: Context) -> tuple:
+        """(time of day, season, budget) index of ``context`` into ``bucket_scores``"""
+        context.ensure()
+        budget = context.budget_level or self._user_budgets.get(context.user_id)
+        return (
+            TIMES_OF_DAY.index(context.time_of_day) if context.time_of_day in TIMES_OF_DAY else 3,
+            SEASONS.index(season_of(context.now)),
+            BUDGET_LEVELS.index(normalize_budget_level(budget)),
+        )
 
+    def context_scores(self, context: Context | None = None) -> np.ndarray:
+        """Item scores for the bucket selected by ``context`` (overall means without one)"""
+        if context is None:
+            return self.item_means
+        return self.bucket_scores[self.bucket(context)]
+
+    def score_matrix(self, user_ids, contexts) -> np.ndarray:
+        """users x ``items`` scores in each user's context; -inf for ordered items and unknown users"""
+        rows = np.array([self._user_rows.get(user_id, -1) for user_id in user_ids], dtype=int)
+        known = np.flatnonzero(rows >= 0)
+        scores = np.full((len(rows), len(self.items)), -np.inf)
+        for i in known:
+            scores[i] = self.context_scores(contexts[i])
+        # Only recommend unordered items
+        scores[known] = np.where(self._history[rows[known]] == 0, scores[known], -np.inf)
+        return scores
+
+    def recommend(self, user_id, k=5, context: Context | None = None):
+        """Generate contextual recommendations for a user"""
+        if user_id not in self._user_rows:
+            logger.warning(f"User {user_id} not found in interaction matrix")
+            return pd.Series(dtype=float)
+
+        scores = self.score_matrix([user_id], [context])[0]
+        top = top_k_indices(scores, k)
+        top = top[np.isfinite(scores[top])]
+        return pd.Series(scores[top], index=self.items[top])
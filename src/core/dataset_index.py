@@ -0,0 +1,199 @@
+"""
+Dataset Index - id lookups and per-user order ranges over the dataset frames
+Fetching one user's row (``users.loc[users.user_id == user_id]``), one item's
+row or one user's order lines tests every row of the frame, on every request.
+``DatasetIndex`` hashes the user and item ids to their row positions once and
+keeps the order lines grouped by user: a stable argsort of ``user_id`` plus a
+start/end offset per user, so a user's history is one slice of that
+permutation. The frames themselves are not copied or reordered.
+
+The two per-user features the content score needs from the history are kept
+as rolling values: the sum and count of ordered catalogue prices (for the
+price pull) and the catalogue positions of the last ``RECENT_ITEMS`` ordered
+items (for the recent-purchase penalty). Purchases recorded after the build
+fold into them with ``add_orders``; users first seen then get a slot only when
+they are in the users table, and slots grow by doubling the arrays. The
+model refresher carries these purchases into the next bundle's index.
+
+Model bundles build one (``ModelBundle.index``); the scoring functions take it
+as an optional argument and fall back to scanning the frames without it.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Hashable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Latest order lines per user behind the recent-purchase penalty
+RECENT_ITEMS = 3
+
+
+def _row_positions(frame: pd.DataFrame, column: str) -> Dict[Hashable, int]:
+    """id -> row position (first row for duplicate ids)"""
+    if column not in frame.columns:
+        return {}
+    ids = frame[column].tolist()
+    return {key: row for row, key in reversed(list(enumerate(ids)))}
+
+
+class DatasetIndex:
+    """Hashed user/item rows, user-sorted order ranges and rolling per-user features"""
+
+    def __init__(self, users: pd.DataFrame, items: pd.DataFrame, orders: pd.DataFrame,
+                 recent_items: int = RECENT_ITEMS):
+        self.users = users
+        self.items = items
+        self.orders = orders
+        self.recent_items = recent_items
+        self._user_rows = _row_positions(users, "user_id")
+        self._item_rows = _row_positions(items, "item_id")
+        self._prices = (items["price"].to_numpy(dtype=float) if "price" in items.columns
+                        else np.full(len(items), np.nan))
+        self._lock = threading.Lock()
+        self._added: Dict[Hashable, int] = {}  # order lines folded in per user since the build
+
+        # Order lines sorted by user (ties keep frame order), and each user's [start, end) in it
+        user_ids = orders["user_id"].to_numpy() if "user_id" in orders.columns else np.zeros(0)
+        self._order_rows = np.argsort(user_ids, kind="stable")
+        sorted_ids = user_ids[self._order_rows]
+        boundaries = np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1
+        starts = np.concatenate([[0], boundaries]).astype(int) if len(sorted_ids) else np.zeros(0, dtype=int)
+        ends = np.concatenate([boundaries, [len(sorted_ids)]]).astype(int) if len(sorted_ids) else starts
+        self._slots: Dict[Hashable, int] = {key: slot for slot, key in enumerate(sorted_ids[starts].tolist())}
+        # Published together: lock-free readers never pair one generation's starts with another's ends
+        self._ranges = (starts, ends)
+        self._rolling_features(orders, starts, ends)
+        self._capacity = len(starts)
+
+    def __getstate__(self) -> Dict:
+        # Bundles are sent to evaluation workers; the lock stays behind
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _rolling_features(self, orders: pd.DataFrame, starts: np.ndarray, ends: np.ndarray):
+        """Per-user sums of ordered catalogue prices, and catalogue positions of the last lines"""
+        n_users, n_lines = len(starts), len(self._order_rows)
+        positions = (pd.Index(self.items["item_id"]).get_indexer(orders["item_id"])
+                     if n_lines and "item_id" in orders.columns else np.full(n_lines, -1))
+        line_prices = np.where(positions >= 0, self._prices[positions], np.nan)
+        priced = ~np.isnan(line_prices)
+        line_users = np.repeat(np.arange(n_users), ends - starts)  # slot per line of _order_rows
+        by_user = self._order_rows
+        self._price_sum = np.bincount(line_users, np.where(priced, line_prices, 0.0)[by_user], minlength=n_users)
+        self._price_count = np.bincount(line_users, priced[by_user], minlength=n_users)
+
+        # Latest lines last: by timestamp within the user, ties in frame order
+        if n_lines and "timestamp" in orders.columns:
+            by_time = np.argsort(orders["timestamp"].to_numpy(), kind="stable")
+            by_user = by_time[np.argsort(orders["user_id"].to_numpy()[by_time], kind="stable")]
+        self._recent = np.full((n_users, self.recent_items), -1, dtype=int)
+        for back in range(1, self.recent_items + 1):
+            lines = ends - back
+            has_line = lines >= starts
+            self._recent[has_line, self.recent_items - back] = positions[by_user[lines[has_line]]]
+
+    def _grow(self):
+        """Double the per-slot arrays (new slots: no order lines, no features)"""
+        size = len(self._slots)
+        extra = max(size, 16)
+        starts, ends = self._ranges
+        self._ranges = (np.concatenate([starts[:size], np.zeros(extra, dtype=int)]),
+                        np.concatenate([ends[:size], np.zeros(extra, dtype=int)]))
+        self._price_sum = np.concatenate([self._price_sum[:size], np.zeros(extra)])
+        self._price_count = np.concatenate([self._price_count[:size], np.zeros(extra)])
+        self._recent = np.concatenate([self._recent[:size], np.full((extra, self.recent_items), -1, dtype=int)])
+        self._capacity = size + extra
+
+    def _slot(self, user_id) -> Optional[int]:
+        """The user's slot in the rolling features; users new to the index get one if they are in the users table"""
+        slot = self._slots.get(user_id)
+        if slot is None and user_id in self._user_rows:
+            # Grow the arrays before publishing the slot: has_orders and order_rows do not take the lock
+            slot = len(self._slots)
+            if slot >= self._capacity:
+                self._grow()
+            self._slots[user_id] = slot
+        return slot
+
+    def add_orders(self, user_id, item_ids: Sequence):
+        """Fold newly ordered items (newest last) into the user's rolling features.
+
+        Ignored for users neither in the order lines nor in the users table.
+        """
+        with self._lock:
+            slot = self._slot(user_id)
+            if slot is None:
+                return
+            self._added[user_id] = self._added.get(user_id, 0) + len(item_ids)
+            for item_id in item_ids:
+                position = self._item_rows.get(item_id, -1)
+                if position >= 0 and not np.isnan(self._prices[position]):
+                    self._price_sum[slot] += self._prices[position]
+                    self._price_count[slot] += 1
+                recent = self._recent[slot]
+                recent[:-1] = recent[1:].copy()
+                recent[-1] = position
+
+    def user(self, user_id) -> Optional[pd.Series]:
+        """The user's row of the users table, None for unknown ids"""
+        row = self._user_rows.get(user_id)
+        return None if row is None else self.users.iloc[row]
+
+    def user_answers(self, user_id) -> Optional[Dict]:
+        """The user's row as a dict (questionnaire answers), None for unknown ids"""
+        user = self.user(user_id)
+        return None if user is None else user.to_dict()
+
+    def item(self, item_id) -> Optional[pd.Series]:
+        """The item's row of the menu, None for ids not on it"""
+        row = self._item_rows.get(item_id)
+        return None if row is None else self.items.iloc[row]
+
+    def has_orders(self, user_id) -> bool:
+        """Whether the user has order lines in the frame (purchases added later do not count)"""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return False
+        starts, ends = self._ranges
+        return ends[slot] > starts[slot]
+
+    def order_rows(self, user_id) -> np.ndarray:
+        """Row positions of the user's order lines in the frame, in frame order"""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return self._order_rows[:0]
+        starts, ends = self._ranges
+        return self._order_rows[starts[slot]:ends[slot]]
+
+    def user_orders(self, user_id) -> pd.DataFrame:
+        """The user's order lines (``orders.loc[orders.user_id == user_id]``)"""
+        return self.orders.iloc[self.order_rows(user_id)]
+
+    def added_orders(self, user_id) -> int:
+        """Order lines folded into the user's features since the build (changes whenever they do)"""
+        return self._added.get(user_id, 0)
+
+    def mean_price(self, user_id) -> float:
+        """Mean catalogue price of the items the user ordered, one per order line (NaN without any)"""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return float("nan")
+        with self._lock:
+            total, count = self._price_sum[slot], self._price_count[slot]
+        return float(total / count) if count else float("nan")
+
+    def recent_positions(self, user_id) -> np.ndarray:
+        """Catalogue positions of the user's last ``recent_items`` ordered items (-1: none, or off the menu)"""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return np.full(self.recent_items, -1, dtype=int)
+        with self._lock:
+            return self._recent[slot].copy()
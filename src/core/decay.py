@@ -0,0 +1,138 @@
+"""
+Decay - exponentially decayed sums that move with "now" in closed form
+Recency-decayed popularity used to be recomputed from every order line
+(``0.5 ** (age_days / 30)``) whenever the reference time moved. Here each
+event of weight ``w`` at time ``t`` is stored once, scaled to a fixed
+landmark: ``w * 2 ** ((t - landmark) / half_life)`` ("forward decay"). The
+decayed sum at any later time is then the stored sum times a single factor,
+``2 ** (-(now - landmark) / half_life)``, and a new order is an O(1) update of
+its key's slot. Keys can be anything hashable: item ids, or (user_id, item_id)
+pairs for per-user-item sums.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Hashable, List
+
+import numpy as np
+import pandas as pd
+
+HALF_LIFE_DAYS = 30.0
+
+# Stored values are rebased onto a newer landmark before 2 ** exponent gets near overflow
+MAX_EXPONENT = 256.0
+
+
+class DecayedCounter:
+    """Per-key decayed and undecayed weight sums, queryable at any time"""
+
+    def __init__(self, half_life_days: float = HALF_LIFE_DAYS, landmark: pd.Timestamp | None = None):
+        self.half_life = pd.Timedelta(days=half_life_days)
+        self.landmark = landmark
+        self.latest: pd.Timestamp | None = None  # newest event folded in
+        self._slots: Dict[Hashable, int] = {}
+        self._keys: List[Hashable] = []
+        self._scaled = np.zeros(16)   # sum of w * 2 ** ((t - landmark) / half_life)
+        self._totals = np.zeros(16)   # sum of w
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_events(cls, keys: pd.Series, timestamps: pd.Series, weights: pd.Series | None = None,
+                    half_life_days: float = HALF_LIFE_DAYS) -> "DecayedCounter":
+        counter = cls(half_life_days)
+        counter.add_many(keys, timestamps, weights)
+        return counter
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __getstate__(self) -> Dict:
+        # Bundles are sent to evaluation workers; the lock stays behind
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state.pop("_index_cache", None)
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _slot(self, key: Hashable) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            if slot >= len(self._scaled):
+                self._scaled = np.concatenate([self._scaled, np.zeros(len(self._scaled))])
+                self._totals = np.concatenate([self._totals, np.zeros(len(self._totals))])
+        return slot
+
+    def _prepare(self, earliest: pd.Timestamp, newest: pd.Timestamp):
+        """Set the landmark on first use; rebase it when newer events would overflow"""
+        if self.landmark is None:
+            self.landmark = earliest
+        elif (newest - self.landmark) / self.half_life > MAX_EXPONENT:
+            shift = (newest - self.landmark) / self.half_life
+            self._scaled *= 2.0 ** -shift
+            self.landmark = newest
+        if self.latest is None or newest > self.latest:
+            self.latest = newest
+
+    def add(self, key: Hashable, at, weight: float = 1.0):
+        """Fold in one event of ``weight`` at time ``at``"""
+        at = pd.Timestamp(at)
+        with self._lock:
+            self._prepare(at, at)
+            slot = self._slot(key)
+            self._scaled[slot] += weight * 2.0 ** ((at - self.landmark) / self.half_life)
+            self._totals[slot] += weight
+
+    def add_many(self, keys: pd.Series, timestamps: pd.Series, weights: pd.Series | None = None):
+        """Fold in a batch of events (e.g. order lines: item_id and timestamp columns)"""
+        if len(keys) == 0:
+            return
+        keys, timestamps = pd.Series(keys).reset_index(drop=True), pd.Series(timestamps).reset_index(drop=True)
+        weights = pd.Series(1.0, index=keys.index) if weights is None else pd.Series(weights).reset_index(drop=True)
+        with self._lock:
+            self._prepare(timestamps.min(), timestamps.max())
+            scaled = weights * 2.0 ** ((timestamps - self.landmark) / self.half_life)
+            sums = pd.DataFrame({"scaled": scaled, "total": weights}).groupby(keys.to_numpy()).sum()
+            slots = np.fromiter((self._slot(key) for key in sums.index), dtype=int, count=len(sums))
+            self._scaled[slots] += sums["scaled"].to_numpy()
+            self._totals[slots] += sums["total"].to_numpy(dtype=float)
+
+    def _index(self) -> pd.Index:
+        """The keys as an index, rebuilt only when keys were added"""
+        index = getattr(self, "_index_cache", None)
+        if index is None or len(index) != len(self._keys):
+            if self._keys and isinstance(self._keys[0], tuple):
+                index = pd.MultiIndex.from_tuples(self._keys)
+            else:
+                index = pd.Index(self._keys)
+            self._index_cache = index
+        return index
+
+    def snapshot(self, at=None):
+        """(keys, undecayed sums, decayed sums at ``at``) as an index and two arrays.
+
+        Times before the newest event are evaluated at that event, so no age
+        is negative.
+        """
+        with self._lock:
+            n = len(self._keys)
+            if n == 0:
+                return pd.Index([]), np.zeros(0), np.zeros(0)
+            at = self.latest if at is None else max(pd.Timestamp(at), self.latest)
+            factor = 2.0 ** -((at - self.landmark) / self.half_life)
+            return self._index(), self._totals[:n].copy(), self._scaled[:n] * factor
+
+    def decayed(self, at=None) -> pd.Series:
+        """key -> sum of ``w * 0.5 ** (age_days / half_life_days)`` at ``at``"""
+        index, _, decayed = self.snapshot(at)
+        return pd.Series(decayed, index=index, dtype=float)
+
+    def totals(self) -> pd.Series:
+        """key -> undecayed sum of weights"""
+        index, totals, _ = self.snapshot()
+        return pd.Series(totals, index=index, dtype=float)
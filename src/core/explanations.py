@@ -0,0 +1,125 @@
+"""
+Explanations - recommendation reasons as bit codes, rendered from cached templates
+Explaining a recommendation used to read the row back as a dict and test each
+field against the context, building the sentence piece by piece. The scoring
+stages already know which boosts fired for every candidate, so they record
+them as a small bitmask (``Candidates.reasons``: time of day, budget fit, plus
+static bits of the item such as its dietary tags). A sentence template is
+compiled once per (reason code, context) and only the item's name and
+category are filled in per explanation.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+import numpy as np
+
+# Reason bits of the recommendation stages
+TIME_MATCH = 1        # the item's time preference is the context's time of day
+TIME_ANY = 2          # the item suits any time of day
+BUDGET_FIT = 4        # the item's budget category is the requested budget
+CATEGORY = 8          # the item has a category
+VEGETARIAN = 16
+VEGAN = 32
+
+# Reason bits of a parsed query (SmartQueryProcessor)
+QUERY_DIET = 64       # the item carries the requested dietary tag
+QUERY_PRICE = 128     # the item's budget category is the requested price
+QUERY_MOOD = 256      # the query asked for a mood
+TIME_PREFERENCE = 512  # the item has a time preference
+
+# Phrase per reason bit, in sentence order. Context fields are filled in when a
+# template is compiled; {category} and {time_preference} come from the item.
+RECOMMENDATION_PHRASES: Tuple[Tuple[int, str], ...] = (
+    (TIME_MATCH, "perfect for {time_of_day}"),
+    (TIME_ANY, "great for {time_of_day}"),
+    (BUDGET_FIT, "fits your {budget} budget"),
+    (CATEGORY, "from our popular {category} selection"),
+    (VEGETARIAN, "vegetarian-friendly"),
+    (VEGAN, "vegan option"),
+)
+QUERY_PHRASES: Tuple[Tuple[int, str], ...] = (
+    (QUERY_DIET, "perfect for your {dietary} diet"),
+    (QUERY_PRICE, "fits your {price} budget"),
+    (QUERY_MOOD, "great for a {mood} occasion"),
+    (CATEGORY, "from our {category} selection"),
+    (TIME_PREFERENCE, "perfect for {time_preference}"),
+)
+
+ITEM_FIELDS = ("name", "category", "time_preference")
+
+
+class _ContextFields(dict):
+    """Context values for ``format_map``; item fields stay as placeholders"""
+
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=4096)
+def compile_template(phrases: Tuple[Tuple[int, str], ...], code: int, context: Tuple[Tuple[str, Any], ...]) -> str:
+    """The explanation sentence of ``code`` in ``context``, with the item fields left to fill"""
+    fields = _ContextFields((key, _escape(value)) for key, value in context)
+    parts = [phrase.format_map(fields) for bit, phrase in phrases if code & bit]
+    if parts:
+        return "I recommend {name} because it's " + " and ".join(parts) + "!"
+    return "I recommend {name} - it's a great choice from our menu!"
+
+
+def render(phrases: Tuple[Tuple[int, str], ...], code: int, context: Dict[str, Any], **item: Any) -> str:
+    template = compile_template(phrases, int(code), tuple(sorted(context.items())))
+    return template.format(**{field: item.get(field) for field in ITEM_FIELDS})
+
+
+def item_reasons(dietary_tags: Sequence[np.ndarray], categories: np.ndarray) -> np.ndarray:
+    """Static reason bits per item from its vegetarian/vegan tags and category"""
+    vegetarian, vegan = dietary_tags
+    has_category = np.array([isinstance(c, str) and c != "" for c in categories], dtype=bool)
+    return (np.where(vegetarian, VEGETARIAN, 0) | np.where(vegan, VEGAN, 0)
+            | np.where(has_category, CATEGORY, 0)).astype(np.int32)
+
+
+def _recommendation_context(context) -> Dict[str, Any]:
+    return {"time_of_day": context.time_of_day, "budget": context.budget_level}
+
+
+def explain_top(rows, context) -> str:
+    """Explanation of the first recommendation row.
+
+    Rows built by the stages carry their reason codes and render without
+    touching the items frame; plain row dicts (from a shared cache backend)
+    are coded from their fields.
+    """
+    reasons = getattr(rows, "reasons", None)
+    if reasons is None:
+        return explain_item(rows[0], context)
+    from .item_features import get_item_features
+
+    features = get_item_features(rows.items)
+    position = rows.positions[0]
+    return render(RECOMMENDATION_PHRASES, reasons[0], _recommendation_context(context),
+                  name=features.names[position], category=features.categories[features.category_codes[position]])
+
+
+def explain_item(item: Mapping[str, Any], context) -> str:
+    """Explanation of one recommendation row dict"""
+    code = 0
+    if item.get('time_preference') == context.time_of_day:
+        code |= TIME_MATCH
+    elif item.get('time_preference') in ['any', 'all']:
+        code |= TIME_ANY
+    if context.budget_level and item.get('budget_category') == context.budget_level:
+        code |= BUDGET_FIT
+    if item.get('category'):
+        code |= CATEGORY
+    tags = item.get('dietary_tags')
+    if tags and isinstance(tags, list):
+        code |= (VEGETARIAN if 'vegetarian' in tags else 0) | (VEGAN if 'vegan' in tags else 0)
+    return render(RECOMMENDATION_PHRASES, code, _recommendation_context(context),
+                  name=item['name'], category=item.get('category'))
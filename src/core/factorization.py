@@ -0,0 +1,288 @@
+"""
+Matrix Factorization - implicit-feedback ALS as a CF backend
+Factorizes the quantity + customization interaction matrix from
+``user_item_matrix`` into user and item factors (Hu, Koren & Volinsky:
+confidence ``1 + alpha * r``, binary preference). Each half-step runs a few
+warm-started conjugate-gradient steps for all users (or items) at once,
+touching only non-zero interactions, so a sweep costs O(nnz * f) instead of
+O(nnz * f^2); row blocks are spread over a thread pool (NumPy releases the GIL).
+
+Scoring a user is a single f-dimensional dot product against the cached item
+factors. Users who were not in the training matrix are folded in from their
+order history with one solve against the fixed item factors. Folded vectors
+are kept in an LRU of ``FOLDED_USERS_MAX`` users, each with a fingerprint of
+the history it was solved from, so a changed history is solved again.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .ranking import top_k_series
+from .shared_model import SharedModel
+
+logger = logging.getLogger(__name__)
+
+# Non-zeros (x factors floats) materialized per solver block
+BLOCK_NONZEROS = 2 ** 18
+
+# Folded-in user vectors kept per model (least recently used dropped first)
+FOLDED_USERS_MAX = 10_000
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, values: np.ndarray,
+         n_rows: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row pointers, column indices and values of (row, col, value) non-zeros, row-major"""
+    order = np.lexsort((cols, rows))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_rows))])
+    return indptr, cols[order], values[order]
+
+
+def _row_blocks(indptr: np.ndarray) -> list:
+    """Contiguous row ranges holding roughly BLOCK_NONZEROS non-zeros each"""
+    bounds = np.searchsorted(indptr, np.arange(0, indptr[-1], BLOCK_NONZEROS), side="right") - 1
+    bounds = np.unique(np.concatenate([[0], bounds, [len(indptr) - 1]]))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def _solve_rows(out: np.ndarray, start: int, end: int, indptr: np.ndarray, cols: np.ndarray,
+                values: np.ndarray, fixed: np.ndarray, gram: np.ndarray,
+                regularization: float, alpha: float, cg_steps: int):
+    """Update rows [start, end) with a few conjugate-gradient steps, warm-started.
+
+    Solves A_u x_u = b_u for every row at once, where
+    A_u = Y'Y + Y_u' (C_u - I) Y_u + reg I and b_u = Y_u' C_u p_u,
+    without ever forming A_u: products only touch the row's non-zeros.
+    """
+    lo, hi = indptr[start], indptr[end]
+    counts = np.diff(indptr[start:end + 1])
+    x = out[start:end]
+    if lo == hi:
+        x[:] = 0.0
+        return
+
+    # Non-zeros are laid out column-wise (f x nnz) so segment sums run over contiguous memory
+    y = fixed.T[:, cols[lo:hi]]                           # f x nnz
+    confidence = alpha * values[lo:hi]                    # c - 1
+    owner = np.repeat(np.arange(end - start), counts)     # block row of each non-zero
+    present = counts > 0
+    offsets = indptr[start:end][present] - lo
+
+    def segment_sum(per_nonzero: np.ndarray) -> np.ndarray:
+        total = np.zeros((end - start, per_nonzero.shape[0]), dtype=per_nonzero.dtype)
+        total[present] = np.add.reduceat(per_nonzero, offsets, axis=1).T
+        return total
+
+    def apply_a(v: np.ndarray) -> np.ndarray:
+        weighted = confidence * np.einsum("fn,fn->n", y, v.T[:, owner])
+        return v @ gram + segment_sum(y * weighted) + regularization * v
+
+    b = segment_sum(y * (1.0 + confidence))
+    r = b - apply_a(x)
+    p = r.copy()
+    rs_old = np.einsum("uf,uf->u", r, r)
+    for _ in range(cg_steps):
+        ap = apply_a(p)
+        denom = np.einsum("uf,uf->u", p, ap)
+        step = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 0)
+        x += step[:, None] * p
+        r -= step[:, None] * ap
+        rs_new = np.einsum("uf,uf->u", r, r)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+        p = r + beta[:, None] * p
+        rs_old = rs_new
+
+
+def _half_step(out: np.ndarray, csr, fixed: np.ndarray, regularization: float, alpha: float,
+               cg_steps: int, executor: ThreadPoolExecutor | None):
+    indptr, cols, values = csr
+    gram = fixed.T @ fixed
+    fixed = np.ascontiguousarray(fixed.T).T  # column gathers of fixed.T read contiguous rows
+    args = (indptr, cols, values, fixed, gram, regularization, alpha, cg_steps)
+    blocks = _row_blocks(indptr)
+    if executor is None:
+        for start, end in blocks:
+            _solve_rows(out, start, end, *args)
+    else:
+        list(executor.map(lambda block: _solve_rows(out, block[0], block[1], *args), blocks))
+
+
+def train_als(interactions: np.ndarray, factors: int = 32, regularization: float = 1.0,
+              alpha: float = 1.0, iterations: int = 10, cg_steps: int = 3,
+              workers: int | None = None, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Alternating least squares on an implicit users x items matrix"""
+    interactions = np.asarray(interactions, dtype=np.float32)
+    rows, cols = np.nonzero(interactions)
+    return train_als_sparse(rows, cols, interactions[rows, cols], interactions.shape, factors=factors,
+                            regularization=regularization, alpha=alpha, iterations=iterations,
+                            cg_steps=cg_steps, workers=workers, seed=seed)
+
+
+def train_als_sparse(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: Tuple[int, int],
+                     factors: int = 32, regularization: float = 1.0, alpha: float = 1.0,
+                     iterations: int = 10, cg_steps: int = 3, workers: int | None = None,
+                     seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """``train_als`` on the non-zeros of the matrix (COO triples), never materializing it"""
+    # float32 halves the memory traffic of the solver, which is bandwidth bound
+    values = np.asarray(values, dtype=np.float32)
+    n_users, n_items = shape
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(scale=0.01, size=(n_users, factors)).astype(np.float32)
+    item_factors = rng.normal(scale=0.01, size=(n_items, factors)).astype(np.float32)
+
+    by_user, by_item = _csr(rows, cols, values, n_users), _csr(cols, rows, values, n_items)
+    workers = workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for _ in range(iterations):
+            _half_step(user_factors, by_user, item_factors, regularization, alpha, cg_steps, executor)
+            _half_step(item_factors, by_item, user_factors, regularization, alpha, cg_steps, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return user_factors, item_factors
+
+
+@dataclass
+class ALSModel:
+    """Trained ALS factors (shareable between workers like ItemSimilarityModel)"""
+    users: np.ndarray          # user ids, row order of `user_factors`
+    items: np.ndarray          # item ids, row order of `item_factors`
+    user_factors: np.ndarray   # users x f
+    item_factors: np.ndarray   # items x f
+    regularization: float = 1.0
+    alpha: float = 1.0
+    generation: int = 0
+    max_folded: int = FOLDED_USERS_MAX
+    # user_id -> (history fingerprint, vector), least recently used first
+    folded_users: "OrderedDict[int, Tuple[int, np.ndarray]]" = field(default_factory=OrderedDict, repr=False)
+
+    kind = "als"
+
+    def __post_init__(self):
+        self._user_rows = {u: i for i, u in enumerate(self.users.tolist())}
+        self._gram = self.item_factors.T @ self.item_factors
+        self._folded_lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Locks do not pickle; a fresh one is made on load
+        state = self.__dict__.copy()
+        del state["_folded_lock"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._folded_lock = threading.Lock()
+
+    @classmethod
+    def from_matrix(cls, mat: pd.DataFrame, factors: int = 32, regularization: float = 1.0,
+                    alpha: float = 1.0, iterations: int = 10, workers: int | None = None) -> "ALSModel":
+        user_factors, item_factors = train_als(mat.values, factors=factors, regularization=regularization,
+                                               alpha=alpha, iterations=iterations, workers=workers)
+        return cls(users=mat.index.to_numpy(), items=mat.columns.to_numpy(),
+                   user_factors=user_factors, item_factors=item_factors,
+                   regularization=regularization, alpha=alpha)
+
+    @classmethod
+    def from_sparse(cls, users: np.ndarray, items: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                    values: np.ndarray, factors: int = 32, regularization: float = 1.0,
+                    alpha: float = 1.0, iterations: int = 10, workers: int | None = None) -> "ALSModel":
+        """Train on COO triples of the users x items matrix"""
+        user_factors, item_factors = train_als_sparse(rows, cols, values, (len(users), len(items)),
+                                                      factors=factors, regularization=regularization,
+                                                      alpha=alpha, iterations=iterations, workers=workers)
+        return cls(users=users, items=items, user_factors=user_factors, item_factors=item_factors,
+                   regularization=regularization, alpha=alpha)
+
+    @classmethod
+    def from_shared(cls, shared: SharedModel) -> "ALSModel":
+        return cls(
+            users=shared["users"],
+            items=shared["items"],
+            user_factors=shared["user_factors"],
+            item_factors=shared["item_factors"],
+            regularization=shared.metadata.get("regularization", 1.0),
+            alpha=shared.metadata.get("alpha", 1.0),
+            generation=shared.generation,
+        )
+
+    def shared_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "users": self.users,
+            "items": self.items,
+            "user_factors": self.user_factors,
+            "item_factors": self.item_factors,
+        }
+
+    def shared_metadata(self) -> Dict:
+        return {"kind": self.kind, "regularization": self.regularization, "alpha": self.alpha}
+
+    def fold_in(self, user_id: int, history: pd.Series) -> np.ndarray | None:
+        """Factor vector for a user from their (item_id -> interaction) history (cached per history)"""
+        fingerprint = hash((tuple(history.index.tolist()), tuple(history.tolist())))
+        with self._folded_lock:
+            cached = self.folded_users.get(user_id)
+            if cached is not None and cached[0] == fingerprint:
+                self.folded_users.move_to_end(user_id)
+                return cached[1]
+
+        weights = history.reindex(self.items).fillna(0.0).to_numpy(dtype=float)
+        nonzero = np.flatnonzero(weights)
+        if not len(nonzero):
+            self.forget(user_id)
+            return None
+        y = self.item_factors[nonzero]
+        confidence = self.alpha * weights[nonzero]
+        a = self._gram + (y.T * confidence) @ y + self.regularization * np.eye(self._gram.shape[0])
+        vector = np.linalg.solve(a, y.T @ (1.0 + confidence))
+        with self._folded_lock:
+            self.folded_users[user_id] = (fingerprint, vector)
+            self.folded_users.move_to_end(user_id)
+            while len(self.folded_users) > self.max_folded:
+                self.folded_users.popitem(last=False)
+        return vector
+
+    def forget(self, user_id: int):
+        """Drop the user's folded vector (their interactions changed)"""
+        with self._folded_lock:
+            self.folded_users.pop(user_id, None)
+
+    def user_vector(self, user_id: int, history: pd.Series | None = None) -> np.ndarray | None:
+        row = self._user_rows.get(user_id)
+        if row is not None:
+            return self.user_factors[row]
+        if history is not None and not history.empty:
+            return self.fold_in(user_id, history)
+        with self._folded_lock:
+            cached = self.folded_users.get(user_id)
+        return cached[1] if cached is not None else None
+
+    def score_matrix(self, user_ids) -> np.ndarray:
+        """users x ``items`` scores of the trained users (``scores_for_user`` for many); NaN rows for others"""
+        rows = np.array([self._user_rows.get(user_id, -1) for user_id in user_ids], dtype=int)
+        known = np.flatnonzero(rows >= 0)
+        vectors = self.user_factors[rows[known]]
+        scores = np.full((len(rows), len(self.items)), np.nan)
+        scores[known] = np.clip(vectors @ self.item_factors.T, 0, None)
+        scores[known[~vectors.any(axis=1)]] = np.nan
+        return scores
+
+    def scores_for_user(self, user_id: int, top_k: int | None = None,
+                        history: pd.Series | None = None) -> pd.Series:
+        vector = self.user_vector(user_id, history)
+        if vector is None or not np.any(vector):
+            return pd.Series(dtype=float)
+
+        scores = pd.Series(self.item_factors @ vector, index=self.items).clip(lower=0)
+        if top_k:
+            scores = top_k_series(scores, top_k)
+        return scores
@@ -1,156 +1,305 @@
 from __future__ import annotations
 
 import math
+import numpy as np
 import pandas as pd
-from typing import List, Dict
-from .data_loader import load_all
+from dataclasses import dataclass
+from typing import Dict
+from ..data_loader import load_all
 from .contextual import Context
-from .collaborative import cf_scores_for_user
-from .utils import season_of
+from .item_features import ITEM_COLUMNS, ItemFeatures, get_item_features
+from .collaborative import cf_scores_for_user, user_history
+from .model_refresher import ModelBundle, get_model_refresher
+from .tenants import get_tenant_registry
+from ..utils import season_of
+from ..serialization import RecommendationRows
+from ..tracing import traced
+from .dataset_index import DatasetIndex
+from .decay import DecayedCounter
+from .ranking import top_k_indices, top_k_per_group
+from .scoring import ScoringFormula, scoring_formula
 
 
 def compute_user_favorites(orders: pd.DataFrame) -> pd.Series:
-    return orders.groupby(["user_id", "item_id"]).size().groupby(level=0).apply(
-        lambda s: (s - s.min()) / (s.max() - s.min() + 1e-6)
-    )
+    """(user_id, item_id) -> order count min-max scaled within each user"""
+    return scale_user_favorites(orders.groupby(["user_id", "item_id"]).size())
 
 
-def score_items(user_id: int, ctx: Context, users: pd.DataFrame, items: pd.DataFrame, orders: pd.DataFrame) -> pd.DataFrame:
-    ctx.ensure()
+def scale_user_favorites(counts: pd.Series) -> pd.Series:
+    """Min-max scale (user_id, item_id) -> order line counts within each user"""
+    per_user = counts.groupby(level=0)
+    low, high = per_user.transform("min"), per_user.transform("max")
+    return (counts - low) / (high - low + 1e-6)
+
+
+def compute_decayed_popularity(orders: pd.DataFrame, now: pd.Timestamp | None = None) -> pd.Series:
+    """Recency-decayed item popularity scaled to 0..1 (half-life ~30 days)"""
+    item_decay = DecayedCounter.from_events(orders["item_id"], orders["timestamp"])
+    return decayed_popularity_at(item_decay, now or pd.Timestamp.now())
+
+
+def decayed_popularity_at(item_decay: DecayedCounter, now) -> pd.Series:
+    """Item popularity at ``now``: each order line weighs 0.2 plus its recency decay, scaled to 0..1"""
+    items, lines, decayed = item_decay.snapshot(now)
+    return scale_popularity(pd.Series(0.2 * lines + decayed, index=items, dtype=float))
 
-    # Base score: recency-decayed popularity
-    now = pd.Timestamp.now()
-    orders = orders.assign(_age_days=(now - orders["timestamp"]).dt.days.clip(lower=0))
-    decay = 0.5 ** (orders["_age_days"] / 30.0)  # half-life ~30 days
-    popularity = orders.groupby("item_id").apply(lambda g: (0.2 + decay.loc[g.index]).sum())
-    popularity = (popularity - popularity.min()) / (popularity.max() - popularity.min() + 1e-6)
 
-    df = items.copy()
-    df["base"] = df["item_id"].map(popularity).fillna(0.2)
+def scale_popularity(popularity: pd.Series) -> pd.Series:
+    """Min-max scale summed item weights to 0..1"""
+    values = popularity.to_numpy()
+    if len(values) == 0:
+        return popularity
+    low, high = values.min(), values.max()
+    return pd.Series((values - low) / (high - low + 1e-6), index=popularity.index)
+
+
+BUDGET_MULTIPLIERS = {  # user budget -> (low, mid, high, other) item multiplier
+    "low": (1.2, 1.0, 0.8, 1.0),
+    "medium": (1.1, 1.1, 0.95, 1.0),
+    "mid": (1.1, 1.1, 0.95, 1.0),
+    "high": (0.9, 1.0, 1.2, 1.0),
+}
+
+
+def content_scores(user_id: int, ctx: Context, users: pd.DataFrame, features: ItemFeatures,
+                   orders: pd.DataFrame, popularity: pd.Series | None = None,
+                   favorites: pd.Series | None = None, index: DatasetIndex | None = None,
+                   formula: ScoringFormula | None = None) -> Dict[str, np.ndarray]:
+    """Content/context score of every catalogue item and its factors, as arrays in catalogue order.
+
+    ``index`` (over the same users, items and orders) replaces the scans for
+    the user's row and order lines with hashed lookups, and the price pull and
+    recent-purchase penalty with its rolling per-user features. The factors
+    are combined by ``formula``'s content formula (the default variant's
+    without one).
+    """
+    ctx.ensure()
+    n = len(features)
+
+    # Base score: recency-decayed popularity (precomputed by the model refresher when available)
+    if popularity is None:
+        popularity = compute_decayed_popularity(orders)
+    base = features.lookup(popularity, 0.2)
 
     # Diet filter/boost
-    user = users.loc[users.user_id == user_id].iloc[0]
+    user = index.user(user_id) if index is not None else None
+    if user is None:
+        user = users.loc[users.user_id == user_id].iloc[0]
     diet = str(user.get("diet", "none"))
-    def diet_ok(tags: List[str]) -> float:
-        tags = set(tags or [])
-        if diet == "vegetarian" and "meat" in tags:
-            return 0.0
-        if diet == "vegan" and any(t in tags for t in ["meat", "vegetarian", "dairy", "cheese"]):
-            return 0.0
-        if diet == "chicken" and "meat" in tags and "chicken" not in tags:
-            return 0.5
-        return 1.0
-
-    df["diet_multiplier"] = df["dietary_tags"].apply(diet_ok)
+    tags = features.tags
+    diet_multiplier = np.ones(n)
+    if diet == "vegetarian":
+        diet_multiplier[tags["meat"]] = 0.0
+    elif diet == "vegan":
+        diet_multiplier[tags["meat"] | tags["vegetarian"] | tags["dairy"] | tags["cheese"]] = 0.0
+    elif diet == "chicken":
+        diet_multiplier[tags["meat"] & ~tags["chicken"]] = 0.5
 
     # Time-of-day boosts
-    df["time_multiplier"] = (df["time_preference"].fillna("any").apply(
-        lambda t: 1.2 if t == ctx.time_of_day else (1.05 if t in ["any", "all"] else 1.0)
-    ))
+    time_multiplier = np.where(features.time_matches(ctx.time_of_day), 1.2,
+                               np.where(features.time_any, 1.05, 1.0))
 
     # Seasonality boost (items seasonal == current season)
-    current_season = season_of(ctx.now)
-    if "seasonal" in df.columns:
-        df["season_multiplier"] = df["seasonal"].fillna("all").apply(
-            lambda s: 1.15 if s == current_season or s in ["all", "any"] else 1.0
-        )
+    if features.season_match is not None:
+        in_season = features.season_match.get(season_of(ctx.now), np.zeros(n, dtype=bool))
+        season_multiplier = np.where(in_season | features.season_any, 1.15, 1.0)
     else:
-        df["season_multiplier"] = 1.0
+        season_multiplier = np.ones(n)
 
     # Budget sensitivity
     budget = ctx.budget_level or (str(user.get("budget_sensitivity", "medium")))
-    def budget_mult(cat: str) -> float:
-        if budget in ["low", "high", "mid", "medium"]:
-            mapping = {
-                "low": {"low": 1.2, "mid": 1.0, "high": 0.8},
-                "medium": {"low": 1.1, "mid": 1.1, "high": 0.95},
-                "mid": {"low": 1.1, "mid": 1.1, "high": 0.95},
-                "high": {"low": 0.9, "mid": 1.0, "high": 1.2},
-            }
-            return mapping["medium" if budget == "mid" else budget].get(cat, 1.0)
-        return 1.0
-    df["budget_multiplier"] = df["budget_category"].fillna("mid").apply(budget_mult)
+    budget_multiplier = (features.budget_values(BUDGET_MULTIPLIERS[budget])
+                         if budget in BUDGET_MULTIPLIERS else np.ones(n))
+
+    # The user's own order lines: a slice of the index (only needed without precomputed
+    # favorites), else one mask over the history
+    if index is not None:
+        user_orders = index.user_orders(user_id) if favorites is None else None
+    else:
+        user_orders = orders.loc[orders["user_id"].to_numpy() == user_id]
 
     # User favorites from orders
-    fav_series = compute_user_favorites(orders).get(user_id, pd.Series(dtype=float))
+    if favorites is None:
+        counts = user_orders.groupby("item_id").size()
+        fav_series = (counts - counts.min()) / (counts.max() - counts.min() + 1e-6)
+    else:
+        fav_series = favorites.get(user_id, pd.Series(dtype=float))
     fav_map = fav_series if isinstance(fav_series, pd.Series) else pd.Series(dtype=float)
-    df["favorite_boost"] = df["item_id"].map(fav_map).fillna(0.0) * 0.6 + 1.0
-
-    # Price alignment to user's historical spend (optional gentle pull)
-    user_spend = orders.loc[orders.user_id == user_id]
-    if not user_spend.empty and "price" in df.columns and "item_id" in user_spend.columns:
-        # approximate average ticket from orders if total_amount exists; else skip
-        # here we softly center around user's avg item price inferred from items ordered
-        joined = user_spend.merge(df[["item_id", "price"]], on="item_id", how="left")
-        # Use price_y (from items) or price_x (from orders) depending on what's available
-        price_col = "price_y" if "price_y" in joined.columns else "price_x" if "price_x" in joined.columns else "price"
-        if price_col in joined.columns:
-            target = joined[price_col].dropna().mean()
-        else:
-            target = user_spend["total_amount"].mean() / 2  # Fallback
-        if pd.notna(target):
-            df["price_align"] = (1.0 - (df["price"] - target).abs() / (target + 1e-6)).clip(0.8, 1.2)
-        else:
-            df["price_align"] = 1.0
+    favorite_boost = features.lookup(fav_map, 0.0) * 0.6 + 1.0
+
+    # Price alignment to user's historical spend (optional gentle pull):
+    # softly center around the user's average catalogue price of items ordered
+    price_align = np.ones(n)
+    if index is not None:
+        target = index.mean_price(user_id)
     else:
-        df["price_align"] = 1.0
+        target = np.nan
+        if len(user_orders) and "price" in features.items.columns and "item_id" in user_orders.columns:
+            positions = features.positions_of(user_orders["item_id"])
+            ordered_prices = features.price[positions[positions >= 0]]
+            ordered_prices = ordered_prices[~np.isnan(ordered_prices)]
+            if len(ordered_prices):
+                target = ordered_prices.mean()
+    if not np.isnan(target):
+        price_align = np.clip(1.0 - np.abs(features.price - target) / (target + 1e-6), 0.8, 1.2)
 
     # Recent-purchase penalty: avoid recommending the exact same item immediately
-    recent = orders.sort_values("timestamp").groupby("user_id").tail(3)
-    recent_ids = set(recent.loc[recent.user_id == user_id, "item_id"].tolist())
-    df["recent_penalty"] = df["item_id"].apply(lambda x: 0.85 if x in recent_ids else 1.0)
+    if index is not None:
+        recent = index.recent_positions(user_id)
+        recent_penalty = np.ones(n)
+        recent_penalty[recent[recent >= 0]] = 0.85
+    else:
+        recent = user_orders["item_id"].to_numpy()[
+            np.argsort(user_orders["timestamp"].to_numpy(), kind="stable")[-3:]]
+        recent_penalty = np.where(np.isin(features.item_ids, recent), 0.85, 1.0)
 
     # Final score (content/context)
-    df["score"] = (
-        df["base"]
-        * df["diet_multiplier"]
-        * df["time_multiplier"]
-        * df["season_multiplier"]
-        * df["budget_multiplier"]
-        * df["favorite_boost"]
-        * df["price_align"]
-        * df["recent_penalty"]
-    )
-    return df.sort_values("score", ascending=False)
-
-
-def recommend(user_id: int, top_k: int = 10, ctx: Context | None = None) -> pd.DataFrame:
-    users, items, orders = load_all()
+    factors = {
+        "base": base,
+        "diet_multiplier": diet_multiplier,
+        "time_multiplier": time_multiplier,
+        "season_multiplier": season_multiplier,
+        "budget_multiplier": budget_multiplier,
+        "favorite_boost": favorite_boost,
+        "price_align": price_align,
+        "recent_penalty": recent_penalty,
+    }
+    factors["score"] = (formula or scoring_formula()).content_score(factors)
+    return factors
+
+
+@traced()
+def score_items(user_id: int, ctx: Context, users: pd.DataFrame, items: pd.DataFrame, orders: pd.DataFrame,
+                popularity: pd.Series | None = None, favorites: pd.Series | None = None,
+                sort: bool = True) -> pd.DataFrame:
+    """Content/context score per item, best first (catalogue order with ``sort=False``)"""
+    columns = content_scores(user_id, ctx, users, get_item_features(items), orders,
+                             popularity=popularity, favorites=favorites)
+    df = items.assign(**columns)
+    if not sort:
+        return df
+    return df.iloc[top_k_indices(columns["score"], len(df))]
+
+
+@dataclass
+class ScoredItems:
+    """Content, CF and hybrid score arrays of one request, in catalogue order"""
+    features: ItemFeatures
+    score: np.ndarray
+    cf_score: np.ndarray
+    hybrid_score: np.ndarray
+
+    @classmethod
+    def combine(cls, features: ItemFeatures, score: np.ndarray, cf_score: np.ndarray,
+                formula: ScoringFormula | None = None) -> "ScoredItems":
+        """Hybrid combine by ``formula``'s blend (baseline: weighted geometric mean, content/context dominant)"""
+        hybrid_score = (formula or scoring_formula()).hybrid_score(score, cf_score)
+        return cls(features=features, score=score, cf_score=cf_score, hybrid_score=hybrid_score)
+
+    def diverse_top_k(self, k: int, max_per_category: int = 3) -> np.ndarray:
+        """Positions of the k best hybrid scores, at most ``max_per_category`` per category.
+
+        Greedily walking the ranking with a per-category cap keeps exactly each
+        category's best rows, so select those positions and rank only them.
+        """
+        candidates = np.sort(top_k_per_group(self.hybrid_score, self.features.category_codes, max_per_category))
+        return candidates[top_k_indices(self.hybrid_score[candidates], k)]
+
+    def rows(self, positions: np.ndarray) -> RecommendationRows:
+        """Response rows for the given positions, encoded without a DataFrame round trip"""
+        return self.features.rows(positions, score=self.score[positions], cf_score=self.cf_score[positions],
+                                  hybrid_score=self.hybrid_score[positions])
+
+    def frame(self, positions: np.ndarray) -> pd.DataFrame:
+        """Recommendation rows for the given positions only"""
+        return self.features.items.iloc[positions][ITEM_COLUMNS].assign(
+            score=self.score[positions],
+            cf_score=self.cf_score[positions],
+            hybrid_score=self.hybrid_score[positions],
+        )
+
+
+class NoServingBundle(ValueError):
+    """A request needs a model bundle and none is being served"""
+
+
+def serving_bundle(restaurant_id=None) -> ModelBundle | None:
+    """The restaurant's own bundle, else the refreshed one when the background refresher runs"""
+    if restaurant_id is not None:
+        return get_tenant_registry().get(restaurant_id)
+    return get_model_refresher().current()
+
+
+@traced()
+def score_catalogue(user_id: int | None, ctx: Context | None = None, bundle: ModelBundle | None = None,
+                    restaurant_id=None, answers: Dict | None = None,
+                    formula: ScoringFormula | None = None) -> ScoredItems:
+    """Hybrid score of every catalogue item (of one restaurant's menu) for one user and context.
+
+    Users without orders in the bundle get their segment's precomputed scores
+    (``cold_start``), keyed by ``answers`` or their row in the users table;
+    without a bundle, their segment is scored against the loaded frames.
+    ``user_id=None`` is an anonymous request, scored from ``answers`` alone.
+    ``formula`` defaults to the scoring variant serving the user (``scoring``).
+    """
     ctx = ctx or Context(user_id=user_id, now=pd.Timestamp.now()).ensure()
-    content_scored = score_items(user_id, ctx, users, items, orders)
+    formula = formula or scoring_formula(user_id)
+
+    # Serve from the given bundle, the restaurant's own, or the refreshed one
+    bundle = bundle or serving_bundle(restaurant_id)
+    if bundle is None and user_id is None:
+        raise NoServingBundle("Anonymous recommendations are served from a model bundle; enable the model refresher")
+    if bundle is not None and not bundle.has_history(user_id):
+        from .cold_start import Segment
+        return bundle.segments.scored(Segment.for_user(bundle, user_id, answers), ctx, formula)
+    if bundle is not None:
+        orders = bundle.orders
+        features = get_item_features(bundle.items)
+        content = content_scores(user_id, ctx, bundle.users, features, orders,
+                                 popularity=bundle.decayed_popularity_at(ctx.now), favorites=bundle.favorites,
+                                 index=bundle.index, formula=formula)
+        cf_model = bundle.cf_model
+    else:
+        users, items, orders = load_all()
+        features = get_item_features(items)
+        index = DatasetIndex(users, items, orders)
+        if not index.has_orders(user_id):
+            # Cold start without a bundle (e.g. users only known to the Django questionnaire)
+            from .cold_start import Segment, score_answers
+            return score_answers(Segment.for_user(index, user_id, answers), ctx, features,
+                                 compute_decayed_popularity(orders), formula)
+        content = content_scores(user_id, ctx, users, features, orders, index=index, formula=formula)
+        cf_model = None
+    score = content["score"]
 
-    # Collaborative filtering scores
-    cf = cf_scores_for_user(user_id)
+    # Collaborative filtering scores; users newer than the model are folded in from their orders
+    cf = cf_scores_for_user(user_id, model=cf_model)
+    if cf.empty:
+        history = user_history((bundle.index if bundle is not None else index).user_orders(user_id), user_id)
+        if not history.empty:
+            cf = cf_scores_for_user(user_id, model=cf_model, history=history)
     if not cf.empty:
         # Normalize CF to 0..1
-        cf_norm = (cf - cf.min()) / (cf.max() - cf.min() + 1e-6)
-        content_scored["cf_score"] = content_scored["item_id"].map(cf_norm).fillna(0.0)
+        cf_score = features.lookup((cf - cf.min()) / (cf.max() - cf.min() + 1e-6), 0.0)
     else:
-        content_scored["cf_score"] = 0.0
+        cf_score = np.zeros(len(features))
+
+    return ScoredItems.combine(features, score, cf_score, formula)
 
-    # Hybrid combine: weighted geometric mean (robust to scale), with content/context dominant
-    content_scored["hybrid_score"] = (
-        (content_scored["score"] + 1e-6) ** 0.7 * (content_scored["cf_score"] + 1e-6) ** 0.3
-    )
-    scored = content_scored.sort_values("hybrid_score", ascending=False)
 
+@traced()
+def recommend(user_id: int, top_k: int = 10, ctx: Context | None = None,
+              bundle: ModelBundle | None = None, restaurant_id=None,
+              formula: ScoringFormula | None = None, answers: Dict | None = None) -> pd.DataFrame:
+    scored = score_catalogue(user_id, ctx, bundle, restaurant_id, answers, formula)
     # Simple diversity re-ranking: limit top-N per category
-    max_per_category = 3
-    seen = {}
-    diversified = []
-    for _, row in scored.iterrows():
-        cat = row.get("category")
-        count = seen.get(cat, 0)
-        if count < max_per_category:
-            diversified.append(row)
-            seen[cat] = count + 1
-        if len(diversified) >= 100:
-            break
-    scored = pd.DataFrame(diversified) if diversified else scored
-    cols = [
-        "item_id", "name", "category", "subcategory", "price", "dietary_tags", "time_preference", "budget_category", "score"
-    ]
-    cols += ["cf_score", "hybrid_score"]
-    return scored[cols].head(top_k)
+    return scored.frame(scored.diverse_top_k(min(top_k, 100)))
 
 
+@traced()
+def recommend_rows(user_id: int | None, top_k: int = 10, ctx: Context | None = None,
+                   bundle: ModelBundle | None = None, restaurant_id=None,
+                   answers: Dict | None = None, formula: ScoringFormula | None = None) -> RecommendationRows:
+    """``recommend`` as response rows, for serving without building a DataFrame"""
+    scored = score_catalogue(user_id, ctx, bundle, restaurant_id, answers, formula)
+    return scored.rows(scored.diverse_top_k(min(top_k, 100)))
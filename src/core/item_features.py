@@ -0,0 +1,163 @@
+"""
+Item Features - the menu catalogue encoded once as NumPy arrays
+Scoring stages used to copy the items frame and test every row with a Python
+lambda (``'meat' in tags``, ``t == ctx.time_of_day``) on every request. The
+answers only depend on the catalogue, so they are computed once per items
+frame here, and a request combines them with vectorized operations into a
+few float arrays of catalogue length.
+
+Positions are catalogue row positions (``items.iloc`` order); ``positions_of``
+maps item ids onto them.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..serialization import ItemFragments, RecommendationRows
+from .contextual import SEASONS, TIMES_OF_DAY
+
+# Item columns of a recommendation row; score columns are appended
+ITEM_COLUMNS = [
+    "item_id", "name", "category", "subcategory", "price", "dietary_tags", "time_preference", "budget_category"
+]
+
+# Dietary tags the scoring stages test for
+TAGS = ("meat", "chicken", "vegetarian", "vegan", "dairy", "cheese", "gluten")
+
+BUDGET_CATEGORIES = ("low", "mid", "high")
+
+# Items frames whose features are cached (most recent last): the global menu
+# plus one per resident tenant (see tenants.py)
+CACHE_SLOTS = 32
+
+
+@dataclass
+class ItemFeatures:
+    """Per-item arrays derived from an items frame, in catalogue order"""
+    items: pd.DataFrame
+    item_ids: np.ndarray
+    tags: Dict[str, np.ndarray]          # tag -> bool per item (False unless dietary_tags is a list)
+    time_match: Dict[str, np.ndarray]    # time of day -> time_preference equals it
+    time_any: np.ndarray                 # time_preference is any/all (or missing)
+    season_match: Dict[str, np.ndarray] | None  # None without a ``seasonal`` column
+    season_any: np.ndarray | None
+    budget_category: np.ndarray          # budget_category, missing as "mid"
+    budget_codes: np.ndarray             # index into BUDGET_CATEGORIES, len(...) for anything else
+    category_codes: np.ndarray           # codes into ``categories``
+    categories: np.ndarray
+    price: np.ndarray
+
+    @classmethod
+    def from_items(cls, items: pd.DataFrame) -> "ItemFeatures":
+        tag_sets = [set(tags) if isinstance(tags, list) else set() for tags in items["dietary_tags"]]
+        tags = {tag: np.fromiter((tag in s for s in tag_sets), dtype=bool, count=len(items)) for tag in TAGS}
+
+        time_preference = items["time_preference"].fillna("any").to_numpy()
+        if "seasonal" in items.columns:
+            seasonal = items["seasonal"].fillna("all").to_numpy()
+            season_match = {season: seasonal == season for season in SEASONS}
+            season_any = np.isin(seasonal, ["all", "any"])
+        else:
+            season_match = season_any = None
+
+        budget_category = items["budget_category"].fillna("mid").to_numpy()
+        budget = pd.Categorical(budget_category, categories=BUDGET_CATEGORIES)
+        budget_codes = np.where(budget.codes < 0, len(BUDGET_CATEGORIES), budget.codes)
+        category_codes, categories = pd.factorize(items["category"], use_na_sentinel=False)
+
+        return cls(
+            items=items,
+            item_ids=items["item_id"].to_numpy(),
+            tags=tags,
+            time_match={tod: time_preference == tod for tod in TIMES_OF_DAY},
+            time_any=np.isin(time_preference, ["any", "all"]),
+            season_match=season_match,
+            season_any=season_any,
+            budget_category=budget_category,
+            budget_codes=budget_codes,
+            category_codes=category_codes,
+            categories=np.asarray(categories, dtype=object),
+            price=items["price"].to_numpy(dtype=float) if "price" in items.columns else np.full(len(items), np.nan),
+        )
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def index(self) -> pd.Index:
+        if not hasattr(self, "_index"):
+            self._index = pd.Index(self.item_ids)
+        return self._index
+
+    def positions_of(self, item_ids) -> np.ndarray:
+        """Catalogue position per item id, -1 for ids not on the menu"""
+        return self.index.get_indexer(item_ids)
+
+    def lookup(self, values: pd.Series, default: float) -> np.ndarray:
+        """An item_id -> value Series spread over the catalogue (``item_id.map(values).fillna``)"""
+        out = np.full(len(self), default, dtype=float)
+        if len(values):
+            positions = self.positions_of(values.index)
+            found = positions >= 0
+            out[positions[found]] = values.to_numpy(dtype=float)[found]
+            out[np.isnan(out)] = default
+        return out
+
+    def time_matches(self, time_of_day: str) -> np.ndarray:
+        match = self.time_match.get(time_of_day)
+        if match is None:  # a context time outside TIMES_OF_DAY
+            match = self.items["time_preference"].fillna("any").to_numpy() == time_of_day
+        return match
+
+    def budget_values(self, table: Sequence[float]) -> np.ndarray:
+        """Per-item value from a (low, mid, high, other) table"""
+        return np.asarray(table, dtype=float)[self.budget_codes]
+
+    @property
+    def names(self) -> np.ndarray:
+        if not hasattr(self, "_names"):
+            self._names = self.items["name"].to_numpy(dtype=object)
+        return self._names
+
+    @property
+    def reasons(self) -> np.ndarray:
+        """Explanation reason bits that depend on the item alone (see explanations.py)"""
+        if not hasattr(self, "_reasons"):
+            from .explanations import item_reasons
+            self._reasons = item_reasons((self.tags["vegetarian"], self.tags["vegan"]),
+                                         self.categories[self.category_codes])
+        return self._reasons
+
+    @property
+    def fragments(self) -> ItemFragments:
+        """Pre-encoded JSON of every item's ITEM_COLUMNS, built on first use"""
+        if not hasattr(self, "_fragments"):
+            self._fragments = ItemFragments(self.items, ITEM_COLUMNS)
+        return self._fragments
+
+    def rows(self, positions: np.ndarray, reasons: np.ndarray | None = None,
+             **scores: np.ndarray) -> RecommendationRows:
+        """Response rows for the given positions only, with per-row score arrays appended"""
+        return RecommendationRows(self.items, self.fragments, positions, scores, reasons=reasons)
+
+
+_features_lock = threading.Lock()
+_features_cache: List[ItemFeatures] = []
+
+
+def get_item_features(items: pd.DataFrame) -> ItemFeatures:
+    """Features for an items frame, cached by frame identity for the last CACHE_SLOTS frames"""
+    with _features_lock:
+        for features in _features_cache:
+            if features.items is items:
+                return features
+    features = ItemFeatures.from_items(items)
+    with _features_lock:
+        _features_cache[:] = _features_cache[-(CACHE_SLOTS - 1):] + [features]
+    return features
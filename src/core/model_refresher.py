@@ -0,0 +1,395 @@
+"""
+Model Refresher - retrain models off the request path
+A background thread rebuilds popularity, decayed popularity, user favorites and
+the CF similarity model on a schedule, or early once enough new orders were
+recorded, and swaps the finished bundle in with a single reference assignment.
+Requests always see one complete bundle, never a half-built one.
+
+Configuration (environment):
+- ``SMART_MENU_REFRESH_SECONDS``: rebuild interval, 0 disables the refresher
+- ``SMART_MENU_REFRESH_ORDERS``: rebuild early after this many new orders
+- ``SMART_MENU_PUBLISH_MODEL``: ``1`` also publishes the CF model to the shared store
+- ``SMART_MENU_STREAM_CHUNK``: build from streamed order chunks (see streaming.py)
+- ``SMART_MENU_ORDER_JOURNAL``: journal of recorded orders (default: recorded_orders.csv
+  in the data directory)
+- ``SMART_MENU_COMPACT_JOURNAL``: ``0`` keeps the journal instead of folding it into the
+  order files after each build
+
+Recorded purchases are appended to the order journal, which every build loads
+together with the order files, so the rebuild they trigger learns from them.
+Purchases recorded while a build runs, after it read the journal, are folded
+into the new bundle before it is swapped in.
+Every worker process runs its own refresher: the early-rebuild threshold counts
+the orders recorded by that worker, while the journal is shared, so each
+worker's next build includes the orders recorded by all of them. After a
+successful build the journal is folded into the order files and emptied
+(``data_loader.compact_journal``), so it only holds what was recorded since.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from ..data_loader import compact_journal, load_all, load_items, record_order_lines
+from ..metrics import (MODEL_AGE, MODEL_BUILD_SECONDS, MODEL_PENDING_ORDERS,
+                       MODEL_REQUESTS, MODEL_VERSION)
+from .collaborative import CFModel, build_model, publish_model
+from .dataset_index import DatasetIndex
+from .decay import DecayedCounter
+
+logger = logging.getLogger(__name__)
+
+
+# Bundle versions are unique per process across the refresher and the tenant registry
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    return next(_versions)
+
+
+@dataclass
+class ModelBundle:
+    """Everything the hybrid recommender needs, built together"""
+    version: int
+    built_at: float
+    build_seconds: float
+    users: pd.DataFrame
+    items: pd.DataFrame
+    orders: pd.DataFrame
+    popularity: pd.Series           # raw order counts per item
+    decayed_popularity: pd.Series   # recency-decayed, scaled to 0..1
+    favorites: pd.Series            # (user_id, item_id) -> normalized preference
+    cf_model: CFModel               # backend chosen by SMART_MENU_CF_BACKEND
+    metadata: Dict = field(default_factory=dict)
+    item_decay: Optional[DecayedCounter] = None  # decayed order lines per item, see decay.py
+
+    def __post_init__(self):
+        # Hashed user/item rows and per-user order ranges, see dataset_index.py
+        self.index = DatasetIndex(self.users, self.items, self.orders)
+        self._segments = None
+
+    def __getstate__(self) -> Dict:
+        # The segment table holds a lock and is rebuilt on demand
+        state = self.__dict__.copy()
+        state["_segments"] = None
+        return state
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.built_at
+
+    def has_history(self, user_id) -> bool:
+        """Whether the user has order lines in this bundle"""
+        return self.index.has_orders(user_id)
+
+    def revision(self, user_id) -> str:
+        """This bundle's version and the user's purchases folded in since (keys cached results)"""
+        return f"v{self.version}.{self.index.added_orders(user_id)}"
+
+    def user_answers(self, user_id) -> Optional[Dict]:
+        """The user's row of the users table (questionnaire answers), None for unknown users"""
+        return self.index.user_answers(user_id)
+
+    @property
+    def segments(self):
+        """Cold-start recommendations per questionnaire segment (``cold_start.SegmentTable``)"""
+        if self._segments is None:
+            from .cold_start import SegmentTable
+            self._segments = SegmentTable(self)
+        return self._segments
+
+    def decayed_popularity_at(self, now) -> pd.Series:
+        """Decayed popularity as of ``now``, including orders recorded since the build"""
+        from .hybrid import decayed_popularity_at
+
+        if self.item_decay is None:
+            return self.decayed_popularity
+        return decayed_popularity_at(self.item_decay, now)
+
+
+def build_bundle(version: int, data: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame] | None = None,
+                 now: pd.Timestamp | None = None) -> ModelBundle:
+    """Train every model for one bundle version.
+
+    ``data`` is a (users, items, orders) triple as returned by ``load_all``;
+    it is loaded from disk when omitted. ``now`` fixes the reference time of
+    the recency decay (offline evaluation replays the past). Without ``data``
+    and with SMART_MENU_STREAM_CHUNK set, the orders are streamed in chunks
+    instead (see streaming.py).
+    """
+    from .hybrid import compute_user_favorites, decayed_popularity_at
+
+    chunksize = int(os.environ.get("SMART_MENU_STREAM_CHUNK", 0))
+    if data is None and chunksize > 0:
+        from .streaming import build_streaming_bundle
+        return build_streaming_bundle(version, chunksize=chunksize, now=now)
+
+    start = time.perf_counter()
+    users, items, orders = data if data is not None else load_all()
+    popularity = orders.groupby("item_id").size().sort_values(ascending=False)
+    item_decay = DecayedCounter.from_events(orders["item_id"], orders["timestamp"])
+    decayed_popularity = decayed_popularity_at(item_decay, now or pd.Timestamp.now())
+    favorites = compute_user_favorites(orders)
+    cf_model = build_model(orders)
+    build_seconds = time.perf_counter() - start
+
+    return ModelBundle(
+        version=version,
+        built_at=time.time(),
+        build_seconds=build_seconds,
+        users=users,
+        items=items,
+        orders=orders,
+        popularity=popularity,
+        decayed_popularity=decayed_popularity,
+        favorites=favorites,
+        cf_model=cf_model,
+        item_decay=item_decay,
+    )
+
+
+class ModelRefresher:
+    """Periodically rebuilds the model bundle in a daemon thread"""
+
+    def __init__(self, interval_seconds: float = 300.0, order_threshold: int = 100,
+                 builder: Callable[[int], ModelBundle] = build_bundle,
+                 publish: bool = False, compact: bool = False):
+        self.interval_seconds = interval_seconds
+        self.order_threshold = order_threshold
+        self.builder = builder
+        self.publish = publish  # also publish the CF model to the shared store
+        self.compact = compact  # fold the order journal into the order files after each build
+
+        self._bundle: Optional[ModelBundle] = None
+        self._version = 0
+        self._pending_orders = 0
+        self._orders_lock = threading.Lock()  # guards _pending_orders, _folded and folding; builds do not hold it
+        self._folded: Optional[List[Tuple]] = None  # (event_id, user_id, item_id, at) folded in during a build
+        self._builds = 0
+        self._failures = 0
+        self._last_error: Optional[str] = None
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._build_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._on_build: List[Callable[[ModelBundle], None]] = []
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background thread; the first build begins immediately unless a bundle exists"""
+        if self.running or self.interval_seconds <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-refresher", daemon=True)
+        self._thread.start()
+        logger.info(f"Model refresher started (every {self.interval_seconds}s "
+                    f"or {self.order_threshold} new orders)")
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def on_build(self, callback: Callable[[ModelBundle], None]):
+        """Run ``callback`` on every new bundle before it is served (and now on the current one)"""
+        self._on_build.append(callback)
+        bundle = self._bundle
+        if bundle is not None:  # the hooks registered before it already ran on this bundle
+            self._run_hook(callback, bundle)
+
+    def _prepare(self, bundle: ModelBundle):
+        for callback in self._on_build:
+            self._run_hook(callback, bundle)
+
+    @staticmethod
+    def _run_hook(callback: Callable[[ModelBundle], None], bundle: ModelBundle):
+        try:
+            callback(bundle)
+        except Exception as e:
+            logger.error(f"Preparing model bundle v{bundle.version} failed in {callback}: {e}")
+
+    def _run(self):
+        if self._bundle is not None:  # built before start() (warm-up): counts as the first build
+            self._wait()
+        while not self._stop.is_set():
+            self.refresh()
+            self._wait()
+
+    def _wait(self):
+        self._wake.wait(self.interval_seconds)
+        self._wake.clear()
+
+    def refresh(self) -> Optional[ModelBundle]:
+        """Build a new bundle now and swap it in; returns it (None on failure)"""
+        with self._build_lock:
+            version = next_version()
+            with self._orders_lock:
+                pending = self._pending_orders
+                self._folded = []
+            try:
+                bundle = self.builder(version)
+                if self.publish:
+                    bundle.metadata['shared_generation'] = publish_model(bundle.cf_model, items=bundle.items)
+            except Exception as e:
+                with self._orders_lock:
+                    self._folded = None
+                self._failures += 1
+                self._last_error = str(e)
+                logger.error(f"Model refresh failed: {e}")
+                return None
+            self._prepare(bundle)
+
+            with self._orders_lock:
+                # Orders recorded during the build that it did not read from the journal
+                built = (set(bundle.orders["event_id"].dropna())
+                         if "event_id" in bundle.orders.columns else set())
+                for event_id, user_id, item_id, at in self._folded:
+                    if event_id is None or event_id not in built:
+                        self._fold(bundle, user_id, item_id, at)
+                self._folded = None
+
+                # Single reference assignment: readers see the old or the new bundle
+                previous, self._bundle = self._bundle, bundle
+                self._pending_orders = max(0, self._pending_orders - pending)
+            self._version = version
+            self._builds += 1
+            self._retire_versions(bundle, previous)
+            logger.info(f"Model bundle v{version} built in {bundle.build_seconds:.2f}s")
+            if self.compact:
+                self._compact_journal()
+            return bundle
+
+    @staticmethod
+    def _retire_versions(bundle: ModelBundle, previous: Optional[ModelBundle]):
+        """Keep request counts for the new and the previous bundle only (bounded /metrics series)"""
+        live = {str(bundle.version)} | ({str(previous.version)} if previous is not None else set())
+        for (version,) in list(MODEL_REQUESTS.values()):
+            if version not in live:
+                MODEL_REQUESTS.remove(version)
+
+    @staticmethod
+    def _compact_journal():
+        # The lines the build read are in its bundle, the rest were folded in above
+        try:
+            folded = compact_journal()
+        except Exception as e:
+            logger.error(f"Compacting the order journal failed: {e}")
+            return
+        if folded:
+            logger.info(f"Folded {folded} journaled order lines into the order files")
+
+    def record_orders(self, count: int = 1, item_ids: Sequence = (), at=None, user_id=None):
+        """Note new orders; wakes the refresher once the threshold is crossed.
+
+        ``user_id``'s ``item_ids`` are appended to the order journal, which the
+        next build loads. They also fold into the served bundle's decayed
+        popularity, and into the user's price and recent-item features, right
+        away, without waiting for the rebuild. Raises ValueError for item ids
+        that are not on the menu.
+        """
+        self._check_items(item_ids)
+        at = pd.Timestamp(at or pd.Timestamp.now())
+        with self._orders_lock:
+            event_ids = (record_order_lines(user_id, item_ids, at) if user_id is not None and item_ids
+                         else [None] * len(item_ids))
+            bundle = self._bundle
+            for event_id, item_id in zip(event_ids, item_ids):
+                if bundle is not None:
+                    self._fold(bundle, user_id, item_id, at)
+                if self._folded is not None:  # a build is running: replayed into its bundle
+                    self._folded.append((event_id, user_id, item_id, at))
+            self._pending_orders += count
+            wake = self._pending_orders >= self.order_threshold
+        if wake:
+            self._wake.set()
+
+    def _check_items(self, item_ids: Sequence):
+        bundle = self._bundle
+        if not item_ids:
+            return
+        if bundle is not None:
+            unknown = [item_id for item_id in item_ids if bundle.index.item(item_id) is None]
+        else:
+            unknown = list(pd.Index(item_ids).difference(load_items()["item_id"]))
+        if unknown:
+            raise ValueError(f"Unknown item ids {unknown}")
+
+    @staticmethod
+    def _fold(bundle: ModelBundle, user_id, item_id, at):
+        """One recorded order line into the bundle's decayed popularity and the user's features"""
+        if bundle.item_decay is not None:
+            bundle.item_decay.add(item_id, at)
+        if user_id is not None:
+            bundle.index.add_orders(user_id, [item_id])
+            forget = getattr(bundle.cf_model, "forget", None)  # ALS caches folded-in users
+            if forget is not None:
+                forget(user_id)
+
+    @property
+    def latest(self) -> Optional[ModelBundle]:
+        """The newest bundle, for callers that do not serve a request from it (not counted)"""
+        return self._bundle
+
+    def current(self) -> Optional[ModelBundle]:
+        """Bundle to serve this request from (None until the first build)"""
+        bundle = self._bundle
+        if bundle is not None:
+            MODEL_REQUESTS.labels(version=bundle.version).inc()
+        return bundle
+
+    def stats(self) -> Dict:
+        """Model age, build duration and requests served per model version"""
+        bundle = self._bundle
+        return {
+            'running': self.running,
+            'model_version': bundle.version if bundle else None,
+            'model_age_seconds': bundle.age_seconds if bundle else None,
+            'last_build_seconds': bundle.build_seconds if bundle else None,
+            'builds': self._builds,
+            'build_failures': self._failures,
+            'last_error': self._last_error,
+            'pending_orders': self._pending_orders,
+            'requests_served_by_version': {
+                int(version): int(count) for (version,), count in MODEL_REQUESTS.values().items()
+            },
+        }
+
+
+def _register_metrics(refresher: ModelRefresher):
+    """Expose the served bundle's version, age and build time at scrape time"""
+    MODEL_VERSION.set_function(lambda: refresher._bundle.version if refresher._bundle else None)
+    MODEL_AGE.set_function(lambda: refresher._bundle.age_seconds if refresher._bundle else None)
+    MODEL_BUILD_SECONDS.set_function(lambda: refresher._bundle.build_seconds if refresher._bundle else None)
+    MODEL_PENDING_ORDERS.set_function(lambda: refresher._pending_orders)
+
+
+# Global instance
+_model_refresher = None
+
+def get_model_refresher() -> ModelRefresher:
+    """Get global model refresher instance"""
+    global _model_refresher
+    if _model_refresher is None:
+        _model_refresher = ModelRefresher(
+            interval_seconds=float(os.environ.get("SMART_MENU_REFRESH_SECONDS", 300)),
+            order_threshold=int(os.environ.get("SMART_MENU_REFRESH_ORDERS", 100)),
+            publish=os.environ.get("SMART_MENU_PUBLISH_MODEL", "0") == "1",
+            compact=os.environ.get("SMART_MENU_COMPACT_JOURNAL", "1") != "0",
+        )
+        _register_metrics(_model_refresher)
+    return _model_refresher
@@ -0,0 +1,344 @@
+"""
+Pipeline - recommendation stages over preallocated candidate arrays
+The smart and hybrid recommenders re-rank the base recommendations in stages
+(query filters, personalization, diversity, smart scoring). Each stage used
+to copy the candidate frame and add a column; here the candidates are a
+fixed set of arrays allocated once per request (catalogue positions, a
+keep-mask, content and smart scores) that every stage updates in place.
+Only the final top-k rows are materialized, as ``RecommendationRows``.
+
+Stages also record which boosts fired in ``reasons``, a bitmask per
+candidate that the explanation is rendered from (see explanations.py).
+
+``StagedRecommender`` is what the two recommenders share around the stages:
+the result-cache key and lookup, cold-start or warm ranking, the response
+format, preferences and feedback.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .contextual import Context
+from .explanations import BUDGET_FIT, TIME_ANY, TIME_MATCH, explain_top
+from ..cache import fingerprint, get_cache, get_recommendation_cache
+from ..serialization import RecommendationRows, detached
+from ..tracing import traced
+from ..utils import season_of
+from .hybrid import ScoredItems, score_catalogue
+from .model_refresher import ModelBundle, get_model_refresher
+from .ranking import top_k_indices
+from .scoring import ScoringFormula
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CATEGORIES = {
+    "healthy": ["salad", "soup", "juice", "smoothie"],
+    "comfort": ["pizza", "burger", "pasta", "dessert"],
+}
+
+
+@dataclass
+class Candidates:
+    """Base recommendations of one request; stages update the arrays in place"""
+    scored: ScoredItems
+    positions: np.ndarray     # catalogue positions, best hybrid score first
+    score: np.ndarray         # content score, boosted by personalization
+    smart_score: np.ndarray
+    keep: np.ndarray          # cleared by filters and the diversity cap
+    reasons: np.ndarray       # explanation reason bits, starting from the item's own
+
+    @classmethod
+    def top(cls, scored: ScoredItems, k: int) -> "Candidates":
+        """The same rows as ``recommend(user_id, k)``"""
+        positions = scored.diverse_top_k(min(k, 100))
+        return cls(scored=scored, positions=positions, score=scored.score[positions],
+                   smart_score=np.zeros(len(positions)), keep=np.ones(len(positions), dtype=bool),
+                   reasons=scored.features.reasons[positions].copy())
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def tag(self, tag: str) -> np.ndarray:
+        return self.scored.features.tags[tag][self.positions]
+
+    def categories(self) -> np.ndarray:
+        features = self.scored.features
+        return features.categories[features.category_codes[self.positions]]
+
+    def top_k_rows(self, k: int) -> RecommendationRows:
+        """The k kept candidates with the best smart score, as response rows"""
+        kept = np.flatnonzero(self.keep)
+        chosen = kept[top_k_indices(self.smart_score[kept], k)]
+        positions = self.positions[chosen]
+        return self.scored.features.rows(
+            positions,
+            reasons=self.reasons[chosen],
+            score=self.score[chosen],
+            cf_score=self.scored.cf_score[positions],
+            hybrid_score=self.scored.hybrid_score[positions],
+            smart_score=self.smart_score[chosen],
+        )
+
+
+def time_preference_at(hour: int) -> str:
+    if 6 <= hour < 11:  # Morning
+        return 'morning'
+    if 11 <= hour < 15:  # Lunch
+        return 'lunch'
+    if 15 <= hour < 18:  # Afternoon
+        return 'afternoon'
+    return 'dinner'  # Evening
+
+
+def apply_smart_filters(candidates: Candidates, filters: Dict[str, Any]):
+    """Clear candidates that do not match the query filters"""
+    keep = candidates.keep
+    features = candidates.scored.features
+
+    # Dietary filters
+    dietary = filters.get('dietary')
+    if dietary == 'vegetarian':
+        keep &= ~candidates.tag('meat')
+    elif dietary == 'vegan':
+        keep &= ~(candidates.tag('meat') | candidates.tag('dairy') | candidates.tag('cheese'))
+    elif dietary == 'gluten_free':
+        keep &= ~candidates.tag('gluten')
+
+    # Price filters
+    if filters.get('price') in ('low', 'high'):
+        keep &= features.budget_category[candidates.positions] == filters['price']
+
+    # Health filters (based on category)
+    if filters.get('health') in HEALTH_CATEGORIES:
+        keep &= np.isin(candidates.categories(), HEALTH_CATEGORIES[filters['health']])
+
+
+def apply_personalization_boost(candidates: Candidates, user_prefs: Dict[str, Any], hour: int):
+    """Boost the content score by stored user preferences"""
+    score = candidates.score
+
+    # Boost based on favorite categories
+    if 'favorite_categories' in user_prefs:
+        categories = candidates.categories()
+        for category in user_prefs['favorite_categories']:
+            score[categories == category] *= 1.2
+
+    # Boost based on dietary preferences
+    if user_prefs.get('diet') in ('vegetarian', 'vegan'):
+        score[candidates.tag(user_prefs['diet'])] *= 1.15
+
+    # Boost based on time preferences
+    if 'time_preferences' in user_prefs:
+        time_pref = time_preference_at(hour)
+        if time_pref in user_prefs['time_preferences']:
+            features = candidates.scored.features
+            fits = features.time_matches(time_pref) | features.time_any
+            score[fits[candidates.positions]] *= 1.1
+
+
+def apply_diversity_enhancement(candidates: Candidates, top_k: int):
+    """Cap each category at a third of top_k, overflowing while fewer than top_k are kept"""
+    codes = candidates.scored.features.category_codes[candidates.positions]
+    max_per_category = max(1, top_k // 3)  # Max 1/3 of recommendations per category
+    category_counts: Dict[int, int] = {}
+    kept = 0
+    for i in np.flatnonzero(candidates.keep):
+        count = category_counts.get(codes[i], 0)
+        if count < max_per_category:
+            category_counts[codes[i]] = count + 1
+        elif kept >= top_k:  # Allow some overflow
+            candidates.keep[i] = False
+            continue
+        kept += 1
+
+
+def add_smart_scoring(candidates: Candidates, context: Context):
+    """Smart score from the content score, time of day and budget fit"""
+    features = candidates.scored.features
+    positions = candidates.positions
+    smart_score = candidates.smart_score
+
+    # Base score from original algorithm
+    smart_score[:] = np.nan_to_num(candidates.score, nan=0.5)
+
+    # Time-based boost
+    time_match = features.time_matches(context.time_of_day)[positions]
+    time_any = ~time_match & features.time_any[positions]
+    smart_score *= np.where(time_match, 1.2, np.where(time_any, 1.05, 1.0))
+    candidates.reasons |= np.where(time_match, TIME_MATCH, 0) | np.where(time_any, TIME_ANY, 0)
+
+    # Price alignment boost
+    budget_category = features.budget_category[positions]
+    smart_score *= np.where(budget_category == (context.budget_level or 'mid'), 1.2,
+                            np.where(budget_category == 'mid', 1.0, 0.9))
+    if context.budget_level:
+        candidates.reasons |= np.where(budget_category == context.budget_level, BUDGET_FIT, 0)
+
+
+class StagedRecommender:
+    """Result cache, ranking stages and response format shared by the smart and hybrid recommenders"""
+
+    # Result-cache namespace and cold-start segment key prefix of the subclass
+    cache_namespace = 'recommendations'
+    segment_kind = 'staged'
+
+    def __init__(self):
+        # Shared caches (see src/cache.py); backend chosen by SMART_MENU_CACHE_BACKEND
+        self.user_preferences = get_cache('preferences')  # Cache user preferences
+        self.recommendation_cache = get_recommendation_cache(self.cache_namespace)  # Expiring, keyed by bundle version
+        self.feedback_data = get_cache('feedback', max_entries=100000)  # Store user feedback
+        self.impression_count = 0
+
+    def _cache_key(self, user_id, context: Optional[Context], top_k: int, restaurant_id,
+                   include_explanation: bool, bundle: Optional[ModelBundle],
+                   preferences: Optional[Dict[str, Any]], user_query: Optional[str] = None) -> str:
+        """Everything the cached result depends on: the request, the bundle version and the
+        user's purchases folded in since (no result of an older model or stale rolling
+        features), and the answers or stored preferences it was ranked for"""
+        return (f"{user_id}_{context.time_of_day if context else 'default'}_"
+                f"{context.budget_level if context else 'default'}_{top_k}_{user_query or ''}_{restaurant_id}_"
+                f"{include_explanation:d}_{bundle.revision(user_id) if bundle is not None else None}_"
+                f"{fingerprint(preferences)}")
+
+    def _cached(self, cache_key: str, start_time: datetime) -> Optional[Dict[str, Any]]:
+        """The cached response for ``cache_key`` marked as such, or None"""
+        cached_result = self.recommendation_cache.get(cache_key)
+        if cached_result is None:
+            return None
+        # Never mutate the stored entry; in-process backends hand back the same object
+        cached_result = dict(cached_result)
+        cached_result['metadata'] = dict(cached_result['metadata'],
+                                         from_cache=True,
+                                         processing_time_seconds=(datetime.now() - start_time).total_seconds())
+        return cached_result
+
+    def _store(self, cache_key: str, result: Dict[str, Any]):
+        self.recommendation_cache.set(cache_key, detached(result))
+
+    def _recommend(self, bundle: Optional[ModelBundle], user_id, context: Context,
+                   preferences: Optional[Dict[str, Any]], user_prefs: Optional[Dict[str, Any]], top_k: int,
+                   formula: ScoringFormula, search_filters: Optional[Dict[str, Any]] = None) -> RecommendationRows:
+        """Rank the catalogue for the user; users without history share their segment's ranking"""
+        if bundle is not None and not bundle.has_history(user_id):
+            # Cold start: every user of the segment gets the same ranking in this context
+            from .cold_start import Segment
+            segment = Segment.for_user(bundle, user_id, preferences)
+            key = (self.segment_kind, formula.name, segment, context.time_of_day, context.budget_level,
+                   season_of(context.now), time_preference_at(datetime.now().hour), top_k,
+                   tuple(sorted((search_filters or {}).items())))
+            return bundle.segments.recommendations(key, lambda: self._rank(
+                bundle.segments.scored(segment, context, formula), context, segment.preferences(), top_k,
+                search_filters))
+        return self._rank(score_catalogue(user_id, context, bundle=bundle, answers=preferences, formula=formula),
+                          context, user_prefs, top_k, search_filters)
+
+    def _rank(self, scored: ScoredItems, context: Context, user_prefs: Optional[Dict[str, Any]], top_k: int,
+              search_filters: Optional[Dict[str, Any]] = None) -> RecommendationRows:
+        """Re-rank the base recommendations through the stages (query filters only when given)"""
+        # Get base recommendations
+        candidates = Candidates.top(scored, top_k * 2)
+
+        # Apply smart filters
+        if search_filters is not None:
+            self._apply_smart_filters(candidates, search_filters)
+
+        # Apply personalization boost
+        self._apply_personalization_boost(candidates, user_prefs)
+
+        # Apply diversity enhancement
+        self._apply_diversity_enhancement(candidates, top_k)
+
+        # Add smart scoring
+        self._add_smart_scoring(candidates, context)
+
+        # Sort and get top-k
+        return candidates.top_k_rows(top_k)
+
+    @traced("apply_smart_filters")
+    def _apply_smart_filters(self, candidates: Candidates, filters: Dict[str, Any]):
+        """Apply smart filters based on user query"""
+        if filters:
+            apply_smart_filters(candidates, filters)
+
+    @traced("apply_personalization_boost")
+    def _apply_personalization_boost(self, candidates: Candidates, user_prefs: Optional[Dict[str, Any]]):
+        """Apply personalization based on user preferences and feedback"""
+        if user_prefs:
+            apply_personalization_boost(candidates, user_prefs, datetime.now().hour)
+
+    @traced("apply_diversity_enhancement")
+    def _apply_diversity_enhancement(self, candidates: Candidates, top_k: int):
+        """Apply diversity enhancement to ensure variety"""
+        apply_diversity_enhancement(candidates, top_k)
+
+    @traced("add_smart_scoring")
+    def _add_smart_scoring(self, candidates: Candidates, context: Context):
+        """Add smart scoring based on multiple factors"""
+        add_smart_scoring(candidates, context)
+
+    @traced("format_response")
+    def _format_response(self, recommendations: Sequence[Dict[str, Any]], context: Context,
+                         include_explanation: bool, processing_time: float,
+                         scoring_variant: str = 'baseline') -> Dict[str, Any]:
+        """Format response with metadata and explanation"""
+        response = {
+            'recommendations': recommendations,
+            'metadata': {
+                'user_id': context.user_id,
+                'time_of_day': context.time_of_day,
+                'budget_level': context.budget_level,
+                'total_recommendations': len(recommendations),
+                'from_cache': False,
+                'processing_time_seconds': processing_time,
+                'scoring_variant': scoring_variant,
+                'timestamp': datetime.now().isoformat(),
+                'system_version': '2.0.0'
+            }
+        }
+
+        # Add explanation if requested (rendered from the top row's reason codes)
+        if include_explanation and recommendations:
+            response['explanation'] = explain_top(recommendations, context)
+
+        return response
+
+    def set_user_preferences(self, user_id: int, preferences: Dict[str, Any]):
+        """Set user preferences for personalization"""
+        self.user_preferences.set(user_id, preferences)
+        logger.info(f"Updated preferences for user {user_id}")
+
+    def record_feedback(self, user_id: int, item_id: int, rating: float, feedback_type: str = 'rating'):
+        """Record user feedback for learning"""
+        feedback = {
+            'user_id': user_id,
+            'item_id': item_id,
+            'rating': rating,
+            'feedback_type': feedback_type,
+            'timestamp': datetime.now()
+        }
+        if feedback_type == 'purchase':
+            # Purchases are new orders: counted in the decayed popularity and the user's
+            # rolling features at once, and enough of them trigger an early retrain
+            # (raises ValueError for items not on the menu, before anything is stored)
+            get_model_refresher().record_orders(item_ids=[item_id], at=feedback['timestamp'], user_id=user_id)
+        feedback_key = f"{user_id}:{item_id}:{feedback['timestamp'].isoformat()}"
+        self.feedback_data.set(feedback_key, feedback)
+        logger.info(f"Recorded {feedback_type} feedback for user {user_id}, item {item_id}")
+
+    def get_system_stats(self) -> Dict[str, Any]:
+        """Get system statistics"""
+        return {
+            'total_impressions': self.impression_count,
+            'cached_recommendations': self.recommendation_cache.size(),
+            'users_with_preferences': self.user_preferences.size(),
+            'total_feedback': self.feedback_data.size(),
+            'cache_backend': self.recommendation_cache.backend_name,
+            'model': get_model_refresher().stats(),
+            'system_version': '2.0.0'
+        }
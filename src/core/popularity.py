@@ -1,14 +1,198 @@
+from __future__ import annotations
+
 import pandas as pd
 import numpy as np
-from .data_loader import load_orders
+from datetime import datetime
+from typing import Dict, List, Sequence
+from ..data_loader import load_orders
+from .contextual import (BUDGET_LEVELS, SEASONS, TIMES_OF_DAY, Context, normalize_budget_level,
+                         seasons, times_of_day)
+from .model_refresher import get_model_refresher
+from .ranking import top_k_indices, top_k_series
+from ..utils import season_of
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class PopularityCube:
+    """Ordered quantity per (time of day, weekday, season, location, budget, item)
+
+    A dense float32 array, so a fully specified slice is a view and a partially
+    specified one a sum over the free axes. ``location`` is the order's
+    restaurant when orders carry ``restaurant_id``, else the user's location;
+    ``budget`` is the user's budget sensitivity.
+
+    With ``window_days`` set the cube only counts recent orders: added lines are
+    kept sorted by time and ``advance(now)`` subtracts exactly the lines that
+    left the window, so rolling updates cost O(new + expired lines).
+    """
+
+    def __init__(self, items: Sequence = (), locations: Sequence = (), window_days: float | None = None):
+        self.window_days = window_days
+        self.items = np.asarray(items)
+        self.locations: List[str] = [str(loc) for loc in locations] or ["unknown"]
+        self._item_positions: Dict = {item: i for i, item in enumerate(self.items.tolist())}
+        self._location_positions: Dict[str, int] = {loc: i for i, loc in enumerate(self.locations)}
+        self.counts = np.zeros(self._shape(len(self.locations), len(self.items)), dtype=np.float32)
+        self.now: pd.Timestamp | None = None
+
+        # Lines inside the window, sorted by timestamp (only kept when windowed)
+        self._timestamps = np.empty(0, dtype="datetime64[ns]")
+        self._cells = np.empty(0, dtype=np.int64)
+        self._quantities = np.empty(0, dtype=np.float32)
+
+    @staticmethod
+    def _shape(n_locations: int, n_items: int) -> tuple:
+        return (len(TIMES_OF_DAY), len(WEEKDAYS), len(SEASONS), n_locations, len(BUDGET_LEVELS), n_items)
+
+    @classmethod
+    def from_orders(cls, orders: pd.DataFrame, users: pd.DataFrame | None = None,
+                    window_days: float | None = None, now: datetime | None = None) -> "PopularityCube":
+        """Build from order lines (``load_orders`` output or orders merged with order_items)"""
+        cube = cls(items=np.sort(orders["item_id"].dropna().unique()), window_days=window_days)
+        cube.add(orders, users)
+        if window_days is not None:
+            cube.advance(now or orders["timestamp"].max())
+        return cube
+
+    def _grow(self, locations: Sequence[str], items: Sequence):
+        """Add axis slots for unseen locations/items"""
+        new_locations = [loc for loc in dict.fromkeys(locations) if loc not in self._location_positions]
+        new_items = [item for item in dict.fromkeys(items) if item not in self._item_positions]
+        if not new_locations and not new_items:
+            return
+        old_shape = self.counts.shape
+        for loc in new_locations:
+            self._location_positions[loc] = len(self.locations)
+            self.locations.append(loc)
+        for item in new_items:
+            self._item_positions[item] = len(self._item_positions)
+        self.items = np.array(list(self._item_positions))
+
+        counts = np.zeros(self._shape(len(self.locations), len(self.items)), dtype=np.float32)
+        counts[..., :old_shape[3], :, :old_shape[5]] = self.counts
+        # Retained cells were flattened against the old shape
+        if len(self._cells):
+            self._cells = np.ravel_multi_index(np.unravel_index(self._cells, old_shape), counts.shape)
+        self.counts = counts
+
+    def add(self, orders: pd.DataFrame, users: pd.DataFrame | None = None):
+        """Count new order lines"""
+        lines = orders.dropna(subset=["item_id"])
+        if lines.empty:
+            return
+        timestamps = lines["timestamp"]
+        if "restaurant_id" in lines.columns:
+            locations = lines["restaurant_id"].astype(str)
+        elif users is not None and "location" in users.columns:
+            locations = lines["user_id"].map(users.set_index("user_id")["location"]).fillna("unknown").astype(str)
+        else:
+            locations = pd.Series("unknown", index=lines.index)
+        if users is not None and "budget_sensitivity" in users.columns:
+            budgets = lines["user_id"].map(users.set_index("user_id")["budget_sensitivity"]).map(normalize_budget_level)
+        else:
+            budgets = pd.Series("mid", index=lines.index)
+        self._grow(locations.unique().tolist(), lines["item_id"].unique().tolist())
+
+        time_of_day = times_of_day(timestamps)
+        if "time_of_day" in lines.columns:
+            # Recorded buckets win; values outside TIMES_OF_DAY fall back to the timestamp's
+            time_of_day = lines["time_of_day"].where(lines["time_of_day"].isin(TIMES_OF_DAY), time_of_day)
+        coords = (
+            time_of_day.map({t: i for i, t in enumerate(TIMES_OF_DAY)}).to_numpy(),
+            timestamps.dt.weekday.to_numpy(),
+            seasons(timestamps).map({s: i for i, s in enumerate(SEASONS)}).to_numpy(),
+            locations.map(self._location_positions).to_numpy(),
+            budgets.map({b: i for i, b in enumerate(BUDGET_LEVELS)}).to_numpy(),
+            lines["item_id"].map(self._item_positions).to_numpy(),
+        )
+        cells = np.ravel_multi_index(coords, self.counts.shape)
+        quantities = (lines["quantity"].fillna(1).to_numpy(dtype=np.float32)
+                      if "quantity" in lines.columns else np.ones(len(lines), dtype=np.float32))
+        np.add.at(self.counts.reshape(-1), cells, quantities)
+
+        if self.window_days is not None:
+            ts = timestamps.to_numpy(dtype="datetime64[ns]")
+            order = np.argsort(ts, kind="stable")
+            overlaps = len(self._timestamps) and ts[order[0]] < self._timestamps[-1]
+            self._timestamps = np.concatenate([self._timestamps, ts[order]])
+            self._cells = np.concatenate([self._cells, cells[order]])
+            self._quantities = np.concatenate([self._quantities, quantities[order]])
+            if overlaps:  # late lines: re-sort the retained window
+                order = np.argsort(self._timestamps, kind="stable")
+                self._timestamps, self._cells, self._quantities = (
+                    self._timestamps[order], self._cells[order], self._quantities[order])
+            if self.now is not None:
+                self.advance(self.now)
+
+    def advance(self, now: datetime):
+        """Move the window end to ``now``, uncounting lines older than the window"""
+        self.now = pd.Timestamp(now)
+        if self.window_days is None:
+            return
+        cutoff = np.datetime64(self.now - pd.Timedelta(days=self.window_days), "ns")
+        expired = int(np.searchsorted(self._timestamps, cutoff, side="left"))
+        if expired:
+            np.subtract.at(self.counts.reshape(-1), self._cells[:expired], self._quantities[:expired])
+            self._timestamps = self._timestamps[expired:]
+            self._cells = self._cells[expired:]
+            self._quantities = self._quantities[expired:]
+
+    def slice(self, time_of_day: str | None = None, weekday: int | str | None = None,
+              season: str | None = None, location: str | None = None,
+              budget: str | None = None) -> np.ndarray:
+        """Quantity per item for the given filters; ``None`` sums over that axis"""
+        index, free_axes = [], []  # summed axes are the leading axes of the view
+        for value, levels in [
+            (time_of_day, TIMES_OF_DAY),
+            (WEEKDAYS[weekday] if isinstance(weekday, int) else weekday, WEEKDAYS),
+            (season, SEASONS),
+            (None if location is None else str(location), None),
+            (None if budget is None else normalize_budget_level(budget), BUDGET_LEVELS),
+        ]:
+            if value is None:
+                index.append(slice(None))
+                free_axes.append(len(free_axes))
+            elif levels is None:
+                position = self._location_positions.get(value)
+                if position is None:
+                    return np.zeros(len(self.items), dtype=np.float32)
+                index.append(position)
+            else:
+                index.append(levels.index(value))
+        view = self.counts[tuple(index)]
+        return view.sum(axis=tuple(free_axes)) if free_axes else view
+
+    def context_slice(self, context: Context, location: str | None = None) -> np.ndarray:
+        """Slice for the time of day, weekday, season and budget of ``context``.
+
+        Backs off to coarser slices (dropping budget, weekday, season, then
+        time of day) while the selected slice has no orders at all.
+        """
+        context.ensure()
+        filters = {"time_of_day": context.time_of_day, "weekday": context.now.weekday(),
+                   "season": season_of(context.now), "location": location, "budget": context.budget_level}
+        for dropped in ((), ("budget",), ("budget", "weekday"), ("budget", "weekday", "season"),
+                        ("budget", "weekday", "season", "time_of_day")):
+            scores = self.slice(**{**filters, **dict.fromkeys(dropped)})
+            if scores.any():
+                break
+        return scores
+
+    def top_k(self, k: int = 10, **filters) -> pd.Series:
+        """The k most ordered items (item_id -> quantity) for the filters of ``slice``"""
+        return _positive_top_k(self.slice(**filters), self.items, k)
 
 
 class PopularityRecommender:
     """Popularity-based recommendation system"""
 
-    def __init__(self, orders, order_items):
+    def __init__(self, orders, order_items, users=None, window_days: float | None = None):
         self.orders = orders
         self.order_items = order_items
+        self.users = users
+        self.window_days = window_days
+        self._cube = None
         self._calculate_popularity()
 
     def _calculate_popularity(self):
@@ -26,19 +210,42 @@ class PopularityRecommender:
         # Normalize scores
         self.popularity_scores = self.popularity_scores / self.popularity_scores.max()
 
-    def recommend(self, user_id, k=5):
-        """Get top-k popular items"""
+    @property
+    def cube(self) -> PopularityCube:
+        """Time-sliced counts for contextual requests, built on first use (the dense array is large)"""
+        if self._cube is None:
+            merged = pd.merge(self.orders, self.order_items, on="order_id")
+            self._cube = PopularityCube.from_orders(merged, self.users, window_days=self.window_days)
+        return self._cube
+
+    def recommend(self, user_id, k=5, context: Context | None = None, location: str | None = None):
+        """Get top-k popular items, sliced to the context's time and budget when given"""
         try:
-            # Return top-k popular items
-            return self.popularity_scores.nlargest(k)
+            if context is None and location is None:
+                # Return top-k popular items
+                return top_k_series(self.popularity_scores, k)
+            if context is not None:
+                scores = self.cube.context_slice(context, location=location)
+            else:
+                scores = self.cube.slice(location=location)
+            # Normalized within the slice, like popularity_scores
+            return _positive_top_k(scores / max(float(scores.max()), 1e-9), self.cube.items, k)
         except Exception as e:
             print(f"Error generating recommendations: {e}")
             return pd.Series()
 
-def item_popularity() -> pd.Series:
-    orders = load_orders()
-    return orders.groupby("item_id").size().sort_values(ascending=False)
-
 
+def _positive_top_k(scores: np.ndarray, items: np.ndarray, k: int) -> pd.Series:
+    """Largest positive scores as an item_id -> score Series"""
+    top = top_k_indices(scores, k)
+    top = top[scores[top] > 0]
+    return pd.Series(scores[top], index=items[top])
 
 
+def item_popularity() -> pd.Series:
+    # The refreshed model bundle already holds these counts; only load orders without one
+    bundle = get_model_refresher().latest
+    if bundle is not None:
+        return bundle.popularity
+    orders = load_orders()
+    return orders.groupby("item_id").size().sort_values(ascending=False)
@@ -0,0 +1,59 @@
+"""
+Ranking - partial top-k selection shared by the recommenders
+Returning 10 items should not cost a full O(n log n) sort of the catalogue.
+These helpers select with ``np.argpartition`` (O(n)) and only sort the k
+winners. Ties are broken by position, like a stable ``sort_values`` or
+``nlargest(keep="first")``, so results do not depend on partition order.
+NaN scores rank last.
+
+Stages can pass a candidate position array (``top_k_indices`` output) along
+instead of a sorted copy of the frame and materialize rows once with
+``frame.iloc[positions]``.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def top_k_indices(scores, k: int, ascending: bool = False) -> np.ndarray:
+    """Positions of the k best scores, best first, ties in position order"""
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Rank on a key where larger is better and NaN is worst
+    key = -scores if ascending else scores.copy()
+    key[np.isnan(key)] = -np.inf
+    if k < n:
+        kth = np.partition(key, n - k)[n - k]
+        # Everything above the k-th value wins; tied values compete by position
+        above = np.flatnonzero(key > kth)
+        tied = np.flatnonzero(key == kth)[:k - len(above)]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, -key[candidates]))]
+
+
+def top_k_per_group(scores, groups, k: int) -> np.ndarray:
+    """Positions of the k best scores within each group (unordered across groups)"""
+    scores = np.asarray(scores, dtype=float)
+    codes, _ = pd.factorize(pd.Series(groups), use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")  # radix sort on small integer codes
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    picked = [group[top_k_indices(scores[group], k)] for group in np.split(order, bounds) if len(group)]
+    return np.concatenate(picked) if picked else np.empty(0, dtype=np.intp)
+
+
+def top_k(frame: pd.DataFrame, column: str, k: int, ascending: bool = False) -> pd.DataFrame:
+    """``frame.sort_values(column, ascending).head(k)`` without the full sort"""
+    return frame.iloc[top_k_indices(frame[column].to_numpy(), k, ascending=ascending)]
+
+
+def top_k_series(series: pd.Series, k: int, ascending: bool = False) -> pd.Series:
+    """``series.nlargest(k)`` (or ``nsmallest``) via partial selection"""
+    return series.iloc[top_k_indices(series.to_numpy(), k, ascending=ascending)]
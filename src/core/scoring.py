@@ -0,0 +1,242 @@
+"""
+Scoring - declarative scoring formulas compiled into one array expression
+The content score (a product of per-item multipliers) and the hybrid blend
+(a weighted geometric mean of the content and CF scores) used to be written
+out in ``content_scores`` and ``ScoredItems``. Here each is a ``Formula``: a
+list of features with weights, optional per-feature transforms and a
+combination rule. A formula is compiled once into a single expression over
+the feature arrays (a Python code object evaluated with NumPy, or numexpr
+for large catalogues when it is installed), so a variant costs the same per
+request as the hard-coded version did.
+
+``ScoringFormula`` pairs a content and a blend formula under a variant name.
+A JSON config can define more variants and route a share of users to each
+(stable per user id), for A/B serving; ``python -m src.evaluation
+--scoring-variants`` compares them offline.
+
+Configuration (environment):
+- ``SMART_MENU_SCORING``: JSON file of scoring variants, e.g.
+  ``{"default": "baseline", "traffic": {"linear": 0.1}, "variants": {"linear":
+  {"blend": {"rule": "linear", "features": {"score": 0.6, "cf_score": 0.4}}}}}``
+- ``SMART_MENU_SCORING_VARIANT``: variant served outside the traffic splits
+  (default: the config's ``default``, else ``baseline``)
+
+The config is loaded and every variant test-evaluated at API startup, so a
+bad file stops the worker instead of failing its first scored request.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numexpr
+except ImportError:  # optional
+    numexpr = None
+
+# Features each formula can combine (arrays in catalogue order)
+CONTENT_FEATURES = ("base", "diet_multiplier", "time_multiplier", "season_multiplier", "budget_multiplier",
+                    "favorite_boost", "price_align", "recent_penalty")
+BLEND_FEATURES = ("score", "cf_score")
+
+# Per-feature transforms, as expression templates valid for NumPy and numexpr
+TRANSFORMS = {
+    "identity": "{x}",
+    "log1p": "log1p({x})",
+    "sqrt": "sqrt({x})",
+    "square": "{x} ** 2",
+    "clip01": "where({x} < 0.0, 0.0, where({x} > 1.0, 1.0, {x}))",
+}
+
+# product: x1 ** w1 * x2 ** w2 ...; geometric: (x1 + eps) ** w1 * ...; linear: w1 * x1 + ...
+RULES = ("product", "geometric", "linear")
+
+# numexpr only pays off once the arrays are this long
+NUMEXPR_MIN_ITEMS = 20_000
+
+_NAMESPACE = {"log1p": np.log1p, "sqrt": np.sqrt, "where": np.where, "__builtins__": {}}
+
+
+@dataclass(frozen=True)
+class Formula:
+    """Weighted features combined by one rule"""
+    features: Tuple[Tuple[str, float], ...]
+    rule: str = "product"
+    transforms: Tuple[Tuple[str, str], ...] = ()
+    epsilon: float = 0.0
+    _code: Any = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not self.features:
+            raise ValueError("Scoring formula without features")
+        for name, weight in self.features:
+            if not math.isfinite(weight):
+                raise ValueError(f"Scoring weight of {name} is not a finite number: {weight}")
+        if not math.isfinite(self.epsilon):
+            raise ValueError(f"Scoring epsilon is not a finite number: {self.epsilon}")
+        if self.rule not in RULES:
+            raise ValueError(f"Unknown scoring rule '{self.rule}' (choose from {', '.join(RULES)})")
+        for name, transform in self.transforms:
+            if transform not in TRANSFORMS:
+                raise ValueError(f"Unknown transform '{transform}' for {name} "
+                                 f"(choose from {', '.join(TRANSFORMS)})")
+        object.__setattr__(self, "_code", compile(self.expression(), "<scoring formula>", "eval"))
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any], allowed: Tuple[str, ...]) -> "Formula":
+        if not config.get("features"):
+            raise ValueError(f"Scoring formula without features (choose from {', '.join(allowed)})")
+        features = tuple((str(name), float(weight)) for name, weight in config["features"].items())
+        unknown = [name for name, _ in features if name not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown scoring features {unknown} (choose from {', '.join(allowed)})")
+        return cls(features=features, rule=config.get("rule", "product"),
+                   transforms=tuple(config.get("transforms", {}).items()),
+                   epsilon=float(config.get("epsilon", 0.0)))
+
+    def expression(self) -> str:
+        """The formula as one expression over the feature names"""
+        transforms = dict(self.transforms)
+        terms = []
+        for name, weight in self.features:
+            x = TRANSFORMS[transforms.get(name, "identity")].format(x=name)
+            if self.rule == "linear":
+                terms.append(x if weight == 1.0 else f"{weight!r} * {x}")
+                continue
+            if self.rule == "geometric":
+                x = f"({x} + {self.epsilon!r})"
+            elif x != name:
+                x = f"({x})"
+            terms.append(x if weight == 1.0 else f"{x} ** {weight!r}")
+        return (" + " if self.rule == "linear" else " * ").join(terms) or "0.0"
+
+    def evaluate(self, arrays: Mapping[str, np.ndarray]) -> np.ndarray:
+        n = len(next(iter(arrays.values()))) if arrays else 0
+        if numexpr is not None and n >= NUMEXPR_MIN_ITEMS:
+            return numexpr.evaluate(self.expression(), local_dict={name: arrays[name] for name, _ in self.features})
+        result = eval(self._code, _NAMESPACE, arrays)
+        return np.broadcast_to(result, n).astype(float) if np.ndim(result) == 0 else result
+
+
+BASELINE_CONTENT = Formula(features=tuple((name, 1.0) for name in CONTENT_FEATURES))
+BASELINE_BLEND = Formula(features=(("score", 0.7), ("cf_score", 0.3)), rule="geometric", epsilon=1e-6)
+
+
+@dataclass(frozen=True)
+class ScoringFormula:
+    """One scoring variant: the content score and the content/CF blend"""
+    name: str = "baseline"
+    content: Formula = BASELINE_CONTENT
+    blend: Formula = BASELINE_BLEND
+
+    @classmethod
+    def from_config(cls, name: str, config: Mapping[str, Any]) -> "ScoringFormula":
+        """A variant from its config; an omitted content or blend keeps the baseline's"""
+        return cls(
+            name=name,
+            content=(Formula.from_config(config["content"], CONTENT_FEATURES)
+                     if "content" in config else BASELINE_CONTENT),
+            blend=Formula.from_config(config["blend"], BLEND_FEATURES) if "blend" in config else BASELINE_BLEND,
+        )
+
+    def content_score(self, factors: Mapping[str, np.ndarray]) -> np.ndarray:
+        return self.content.evaluate(factors)
+
+    def hybrid_score(self, score: np.ndarray, cf_score: np.ndarray) -> np.ndarray:
+        return self.blend.evaluate({"score": score, "cf_score": cf_score})
+
+
+BASELINE = ScoringFormula()
+
+
+class ScoringConfig:
+    """Scoring variants and the share of users routed to each"""
+
+    def __init__(self, variants: Optional[Dict[str, ScoringFormula]] = None, default: str = "baseline",
+                 traffic: Optional[Dict[str, float]] = None):
+        self.variants = {"baseline": BASELINE, **(variants or {})}
+        self.traffic = dict(traffic or {})
+        for name in [default, *self.traffic]:
+            if name not in self.variants:
+                raise ValueError(f"Unknown scoring variant '{name}' (defined: {', '.join(self.variants)})")
+        if any(share < 0 for share in self.traffic.values()):
+            raise ValueError("Scoring traffic shares must not be negative")
+        if sum(self.traffic.values()) > 1.0:
+            raise ValueError("Scoring traffic shares add up to more than 1")
+        self.default = self.variants[default]
+
+    @classmethod
+    def from_file(cls, path: str, default: Optional[str] = None) -> "ScoringConfig":
+        """Variants from a JSON file, each evaluated once; any problem is a ValueError naming the file"""
+        try:
+            with open(path) as f:
+                config = json.load(f)
+            variants = {name: ScoringFormula.from_config(name, variant)
+                        for name, variant in config.get("variants", {}).items()}
+            scoring = cls(variants, default=default or config.get("default", "baseline"),
+                          traffic=config.get("traffic"))
+            scoring.validate()
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid scoring config {path}: {e}") from e
+        return scoring
+
+    def validate(self):
+        """Evaluate every variant on unit features; raises ValueError if one does not give finite scores"""
+        ones = np.ones(2)
+        for name, formula in self.variants.items():
+            with np.errstate(all="ignore"):  # overflow shows up as a non-finite score below
+                content = formula.content_score({feature: ones for feature in CONTENT_FEATURES})
+                blend = formula.hybrid_score(ones, ones)
+            for part, scores in (("content", content), ("blend", blend)):
+                if np.shape(scores) != ones.shape or not np.isfinite(scores).all():
+                    raise ValueError(f"Scoring variant '{name}' gives no finite {part} scores")
+
+    def formula(self, name: Optional[str] = None) -> ScoringFormula:
+        """A variant by name, the default without one"""
+        if name is None:
+            return self.default
+        if name not in self.variants:
+            raise ValueError(f"Unknown scoring variant '{name}' (defined: {', '.join(self.variants)})")
+        return self.variants[name]
+
+    def formula_for(self, user_id) -> ScoringFormula:
+        """The user's variant: a stable bucket of the user id picks a traffic split, else the default"""
+        if user_id is None or not self.traffic:
+            return self.default
+        bucket = zlib.crc32(str(user_id).encode()) % 10_000 / 10_000
+        for name, share in self.traffic.items():
+            if bucket < share:
+                return self.variants[name]
+            bucket -= share
+        return self.default
+
+
+# Global instance
+_scoring_config = None
+
+def get_scoring_config() -> ScoringConfig:
+    """Get global scoring config (SMART_MENU_SCORING, else the baseline alone)"""
+    global _scoring_config
+    if _scoring_config is None:
+        path = os.environ.get("SMART_MENU_SCORING")
+        default = os.environ.get("SMART_MENU_SCORING_VARIANT")
+        _scoring_config = ScoringConfig.from_file(path, default) if path else ScoringConfig(default=default or "baseline")
+        if path:
+            logger.info(f"Scoring variants from {path}: {', '.join(_scoring_config.variants)} "
+                        f"(default {_scoring_config.default.name})")
+    return _scoring_config
+
+
+def scoring_formula(user_id=None) -> ScoringFormula:
+    """The scoring variant serving ``user_id``"""
+    return get_scoring_config().formula_for(user_id)
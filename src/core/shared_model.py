@@ -0,0 +1,169 @@
+"""
+Shared Model Store - publish trained arrays once, map them in every worker
+Models are written as ``.npy`` files into a generation directory and attached
+by readers with ``np.load(mmap_mode='r')``: pages are shared through the OS
+page cache, so memory per host no longer scales with the worker count.
+
+Layout under the store root (``SMART_MENU_MODEL_DIR``, default ``data/models``)::
+
+    CURRENT              # generation number of the live model
+    gen-000001/          # one directory per published generation
+        similarity.npy
+        ...
+        metadata.json
+
+Publishing writes a new generation directory and then swaps ``CURRENT`` with
+``os.replace``, so readers either see the old or the new model, never a mix.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+DEFAULT_MODEL_DIR = "data/models"
+CURRENT_FILE = "CURRENT"
+
+
+@dataclass
+class SharedModel:
+    """Read-only, memory-mapped arrays of one published generation"""
+    generation: int
+    arrays: Dict[str, np.ndarray]
+    metadata: Dict = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+
+class SharedModelStore:
+    """Publishes and attaches generation-numbered model arrays"""
+
+    def __init__(self, root: Optional[str] = None, keep_generations: int = 2):
+        self.root = root or os.environ.get("SMART_MENU_MODEL_DIR", DEFAULT_MODEL_DIR)
+        self.keep_generations = keep_generations
+        self._current_path = os.path.join(self.root, CURRENT_FILE)
+        self._attached: Optional[SharedModel] = None
+        self._current_stat = None
+
+    def _generation_dir(self, generation: int) -> str:
+        return os.path.join(self.root, f"gen-{generation:06d}")
+
+    @contextmanager
+    def _publish_lock(self):
+        """Serialize publishers (e.g. two workers retraining at once)"""
+        os.makedirs(self.root, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_generation(self) -> int:
+        """Generation number of the live model, 0 if nothing was published"""
+        try:
+            with open(self._current_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def publish(self, arrays: Dict[str, np.ndarray], metadata: Optional[Dict] = None) -> int:
+        """Write ``arrays`` as a new generation and make it current"""
+        with self._publish_lock():
+            generation = self.current_generation() + 1
+            final_dir = self._generation_dir(generation)
+            tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+            meta = dict(metadata or {})
+            meta.update({'generation': generation, 'published_at': time.time(),
+                         'arrays': sorted(arrays)})
+            with open(os.path.join(tmp_dir, "metadata.json"), "w") as f:
+                json.dump(meta, f)
+
+            os.rename(tmp_dir, final_dir)
+            tmp_current = f"{self._current_path}.tmp-{os.getpid()}"
+            with open(tmp_current, "w") as f:
+                f.write(str(generation))
+            os.replace(tmp_current, self._current_path)
+
+            self._remove_old_generations(generation)
+
+        logger.info(f"Published shared model generation {generation} to {self.root}")
+        return generation
+
+    def _remove_old_generations(self, current: int):
+        # Unlinking is safe on POSIX even while readers still map the files
+        for generation in range(current - self.keep_generations, 0, -1):
+            path = self._generation_dir(generation)
+            if not os.path.isdir(path):
+                break
+            shutil.rmtree(path, ignore_errors=True)
+
+    def attach(self, generation: Optional[int] = None) -> Optional[SharedModel]:
+        """Memory-map a generation (the current one by default) read-only"""
+        generation = generation or self.current_generation()
+        if not generation:
+            return None
+        directory = self._generation_dir(generation)
+        try:
+            with open(os.path.join(directory, "metadata.json")) as f:
+                metadata = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                for name in metadata['arrays']
+            }
+        except FileNotFoundError:
+            # Pruned between reading CURRENT and opening the files; retry on next call
+            return None
+        return SharedModel(generation=generation, arrays=arrays, metadata=metadata)
+
+    def get(self) -> Optional[SharedModel]:
+        """Current model, re-attaching only when a new generation was published"""
+        try:
+            stat = os.stat(self._current_path)
+        except FileNotFoundError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if self._attached is None or stat_key != self._current_stat:
+            model = self.attach()
+            if model is not None:
+                self._attached = model
+                self._current_stat = stat_key
+        return self._attached
+
+
+# Global instance
+_shared_model_store = None
+
+def get_shared_model_store() -> SharedModelStore:
+    """Get global shared model store instance"""
+    global _shared_model_store
+    if _shared_model_store is None:
+        _shared_model_store = SharedModelStore()
+    return _shared_model_store
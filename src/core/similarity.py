@@ -0,0 +1,132 @@
+"""
+Sharded Similarity - item-item cosine trained across a process pool
+``item_similarity`` normalizes the whole users x items interaction matrix and
+multiplies it by itself in one process. The product splits by item rows: the
+similarities of items [start, end) are their interaction columns times the
+whole matrix, divided by the column norms (computed once up front). Each
+worker computes one item row block, normalizes it, applies the optional
+per-item top-N pruning and writes it straight into the result.
+
+The interaction matrix and the result live in shared memory: workers attach
+to both through the pool initializer, so a task ships two integers and
+nothing of size items x items crosses a process boundary. With one worker
+everything runs in-process. Pin BLAS to one thread per worker
+(``OPENBLAS_NUM_THREADS=1``) or the processes compete for the same cores.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tasks per worker: a few more than one keeps the pool balanced
+TASKS_PER_WORKER = 2
+
+_worker_state: Dict = {}
+
+
+def _attach(name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """An array over an existing shared memory block (kept open while the worker lives)"""
+    shm = SharedMemory(name=name)
+    _worker_state.setdefault("shm", []).append(shm)
+    return np.ndarray(shape, dtype=float, buffer=shm.buf)
+
+
+def _init_worker(matrix: Tuple[str, Tuple[int, int]], similarity: Tuple[str, Tuple[int, int]],
+                 norms: np.ndarray, neighbours: int | None):
+    _worker_state["matrix"] = _attach(*matrix)
+    _worker_state["similarity"] = _attach(*similarity)
+    _worker_state["norms"] = norms
+    _worker_state["neighbours"] = neighbours
+
+
+def _init_worker_local(matrix: np.ndarray, similarity: np.ndarray, norms: np.ndarray, neighbours: int | None):
+    """In-process equivalent of ``_init_worker``: the arrays themselves, no shared memory"""
+    _worker_state.update(matrix=matrix, similarity=similarity, norms=norms, neighbours=neighbours)
+
+
+def _similarity_block(start: int, end: int):
+    """Cosine rows of items [start, end), pruned to their top neighbours, written into the result"""
+    matrix, norms = _worker_state["matrix"], _worker_state["norms"]
+    block = matrix[:, start:end].T @ matrix
+    block /= np.outer(norms[start:end], norms)
+    neighbours = _worker_state["neighbours"]
+    if neighbours is not None:
+        block = prune_neighbours(block, start, neighbours)
+    _worker_state["similarity"][start:end] = block
+
+
+def prune_neighbours(block: np.ndarray, start: int, neighbours: int) -> np.ndarray:
+    """Keep each row's ``neighbours`` largest off-diagonal similarities (and the diagonal)"""
+    if neighbours < 1:
+        raise ValueError(f"neighbours must be at least 1, got {neighbours}")
+    if neighbours >= block.shape[1] - 1:
+        return block
+    rows = np.arange(len(block))
+    diagonal = block[rows, start + rows].copy()
+    candidates = block.copy()
+    candidates[rows, start + rows] = -np.inf
+    dropped = np.argpartition(candidates, -neighbours, axis=1)[:, :-neighbours]
+    np.put_along_axis(block, dropped, 0.0, axis=1)
+    block[rows, start + rows] = diagonal
+    return block
+
+
+def _bounds(n: int, parts: int) -> List[Tuple[int, int]]:
+    edges = np.linspace(0, n, min(parts, max(n, 1)) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def _shared(shape: Tuple[int, int]) -> SharedMemory:
+    """A new shared memory block for a float array of ``shape`` (zero-filled)"""
+    return SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+
+
+def sharded_cosine_similarity(matrix: np.ndarray, workers: int = 1,
+                              neighbours: int | None = None) -> np.ndarray:
+    """``_cosine_similarity(matrix)`` computed in item row blocks on ``workers`` processes.
+
+    ``neighbours`` prunes every item's row to its top-N most similar items
+    (the item's own similarity is kept), so scoring a candidate only draws
+    on its nearest neighbours.
+    """
+    if neighbours is not None and neighbours < 1:
+        raise ValueError(f"neighbours must be at least 1, got {neighbours}")
+    start_time = time.perf_counter()
+    matrix = np.ascontiguousarray(matrix, dtype=float)
+    n_users, n_items = matrix.shape
+    norms = np.linalg.norm(matrix, axis=0) + 1e-9  # column norms, as in _cosine_similarity
+    blocks = _bounds(n_items, max(1, workers) * TASKS_PER_WORKER)
+
+    if workers <= 1 or len(blocks) <= 1:
+        similarity = np.zeros((n_items, n_items))
+        _init_worker_local(matrix, similarity, norms, neighbours)
+        try:
+            for start, end in blocks:
+                _similarity_block(start, end)
+        finally:
+            _worker_state.clear()
+    else:
+        segments = [_shared(matrix.shape), _shared((n_items, n_items))]
+        try:
+            np.ndarray(matrix.shape, dtype=float, buffer=segments[0].buf)[...] = matrix
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=((segments[0].name, matrix.shape),
+                                               (segments[1].name, (n_items, n_items)), norms, neighbours)) as executor:
+                list(executor.map(_similarity_block, *zip(*blocks)))
+            similarity = np.ndarray((n_items, n_items), dtype=float, buffer=segments[1].buf).copy()
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+    logger.info(f"Item similarity of {n_users} users x {n_items} items on {workers} worker(s) "
+                f"in {time.perf_counter() - start_time:.2f}s")
+    return similarity
@@ -0,0 +1,172 @@
+"""
+Streaming - model aggregates folded from order chunks in bounded memory
+``build_bundle`` normally merges the whole order history into one frame and
+runs its pivots and groupbys over it, so the history has to fit in RAM. The
+aggregates it needs are all sums, though: interaction quantities and
+customization counts per (user, item), order lines per (user, item) for
+favorites and popularity, and decayed order lines per item. ``OrderAggregates``
+folds chunks of order lines (``iter_order_chunks``) into those sums, so memory
+follows the number of distinct (user, item) pairs rather than the number of
+orders. The interaction matrix is handed to the CF model as sparse triples
+(``SparseInteractions``). Only the last ``RECENT_LINES`` lines of each user are
+kept as the bundle's ``orders`` (the recent-purchase penalty and price pull at
+serving): each chunk's own latest lines are merged into that bounded buffer
+for the users the chunk touches only.
+
+Configuration (environment):
+- ``SMART_MENU_STREAM_CHUNK``: order lines per chunk; when set, ``build_bundle``
+  streams the order files instead of loading them (default: in memory)
+
+Usage:
+    SMART_MENU_STREAM_CHUNK=200000 uvicorn src.api:app
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from ..data_loader import iter_order_chunks, journal_lock, load_items, load_recorded_orders, load_users
+from ..metrics import DATASET_ROWS
+from ..tracing import traced
+from .collaborative import CUSTOMIZATION_WEIGHT, SparseInteractions, build_model, line_modifications
+from .decay import DecayedCounter
+from .hybrid import decayed_popularity_at, scale_user_favorites
+from .model_refresher import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+# Order lines kept per user for serving: the recent-purchase penalty looks at
+# the last 3, the price pull averages over all that are kept
+RECENT_LINES = 10
+
+# Columns of the kept lines (what content_scores and user_history read; event_id marks journaled lines)
+RECENT_COLUMNS = ["user_id", "item_id", "timestamp", "quantity", "event_id"]
+
+# Partial sums collected before they are merged into one
+COMPACT_EVERY = 8
+
+
+class OrderAggregates:
+    """Running sums over chunks of merged order lines (``load_orders`` rows)"""
+
+    def __init__(self, now: pd.Timestamp | None = None, recent_lines: int = RECENT_LINES):
+        self.now = now or pd.Timestamp.now()  # reference time of decayed_popularity()
+        self.recent_lines = recent_lines
+        self._pairs: List[pd.DataFrame] = []   # (user_id, item_id) -> lines, quantity, modifications
+        self.item_decay = DecayedCounter()     # item_id -> decayed order lines
+        self._recent: pd.DataFrame | None = None
+        self.chunks = 0
+        self.lines = 0
+
+    def add(self, lines: pd.DataFrame):
+        """Fold one chunk of order lines into the sums"""
+        lines = lines[lines["item_id"].notna()]
+        if lines.empty:
+            return
+        keys = [lines["user_id"], lines["item_id"]]
+        self._pairs.append(pd.DataFrame({
+            "lines": 1,
+            "quantity": lines["quantity"],
+            "modifications": line_modifications(lines),
+        }).groupby(keys).sum())
+        self.item_decay.add_many(lines["item_id"], lines["timestamp"])
+
+        # Keep each user's latest lines (ties in file order, as a stable sort of the full history would):
+        # the chunk's own, merged with the buffered lines of the users it touches
+        recent = self._latest(lines[[col for col in RECENT_COLUMNS if col in lines.columns]]
+                              .assign(_line=np.arange(self.lines, self.lines + len(lines))))
+        if self._recent is not None:
+            touched = self._recent["user_id"].isin(recent["user_id"].unique())
+            recent = pd.concat([self._recent[~touched], self._latest(pd.concat([self._recent[touched], recent]))],
+                               ignore_index=True)
+        self._recent = recent
+
+        self.chunks += 1
+        self.lines += len(lines)
+        if len(self._pairs) >= COMPACT_EVERY:
+            self._compact()
+
+    def _latest(self, lines: pd.DataFrame) -> pd.DataFrame:
+        """Each user's last ``recent_lines`` lines by timestamp (ties keep the order of ``lines``)"""
+        lines = lines.iloc[lines["timestamp"].argsort(kind="stable")]
+        return lines.groupby("user_id", sort=False).tail(self.recent_lines)
+
+    def _compact(self):
+        if len(self._pairs) > 1:
+            self._pairs = [pd.concat(self._pairs).groupby(level=[0, 1]).sum()]
+
+    def _pair_sums(self) -> pd.DataFrame:
+        self._compact()
+        if not self._pairs:
+            index = pd.MultiIndex.from_arrays([[], []], names=["user_id", "item_id"])
+            return pd.DataFrame({"lines": [], "quantity": [], "modifications": []}, index=index)
+        return self._pairs[0]
+
+    def interactions(self) -> SparseInteractions:
+        """``user_item_matrix`` of every line folded in, as sparse triples"""
+        pairs = self._pair_sums()
+        return SparseInteractions.from_pairs(pairs["quantity"] + pairs["modifications"] * CUSTOMIZATION_WEIGHT)
+
+    def popularity(self) -> pd.Series:
+        """Order lines per item, most ordered first"""
+        counts = self._pair_sums()["lines"].groupby(level="item_id").sum()
+        return counts.sort_values(ascending=False).rename(None)
+
+    def decayed_popularity(self) -> pd.Series:
+        return decayed_popularity_at(self.item_decay, self.now)
+
+    def favorites(self) -> pd.Series:
+        return scale_user_favorites(self._pair_sums()["lines"].rename(None))
+
+    def recent_orders(self) -> pd.DataFrame:
+        """The last ``recent_lines`` order lines of every user, oldest first"""
+        if self._recent is None:
+            return pd.DataFrame(columns=RECENT_COLUMNS)
+        recent = self._recent.iloc[np.lexsort((self._recent["_line"], self._recent["timestamp"]))]
+        return recent.drop(columns="_line").reset_index(drop=True)
+
+
+@traced()
+def aggregate_orders(chunksize: int = 100_000, now: pd.Timestamp | None = None,
+                     recent_lines: int = RECENT_LINES) -> OrderAggregates:
+    """Stream the order files once into an ``OrderAggregates``, then the recorded-orders journal"""
+    aggregates = OrderAggregates(now=now, recent_lines=recent_lines)
+    with journal_lock():  # no compaction between the order files and the journal
+        for lines in iter_order_chunks(chunksize):
+            aggregates.add(lines)
+        aggregates.add(load_recorded_orders())
+    return aggregates
+
+
+def build_streaming_bundle(version: int, chunksize: int = 100_000,
+                           now: pd.Timestamp | None = None) -> ModelBundle:
+    """``build_bundle`` from streamed orders: same models, bounded memory"""
+    start = time.perf_counter()
+    users, items = load_users(), load_items()
+    aggregates = aggregate_orders(chunksize, now=now)
+    DATASET_ROWS.set(len(users), table="users")
+    DATASET_ROWS.set(len(items), table="items")
+    DATASET_ROWS.set(aggregates.lines, table="order_lines")
+
+    bundle = ModelBundle(
+        version=version,
+        built_at=time.time(),
+        build_seconds=0.0,
+        users=users,
+        items=items,
+        orders=aggregates.recent_orders(),
+        popularity=aggregates.popularity(),
+        decayed_popularity=aggregates.decayed_popularity(),
+        favorites=aggregates.favorites(),
+        cf_model=build_model(matrix=aggregates.interactions()),
+        item_decay=aggregates.item_decay,
+        metadata={"streamed_chunks": aggregates.chunks},
+    )
+    bundle.build_seconds = time.perf_counter() - start
+    logger.info(f"Streamed {aggregates.lines} order lines in {aggregates.chunks} chunks")
+    return bundle
@@ -0,0 +1,223 @@
+"""
+Tenants - per-restaurant catalogues and models, loaded on demand
+A customer of one restaurant is only ever scored against that restaurant's
+menu. Each tenant gets its own ModelBundle (menu, order shard, popularity,
+favorites, CF model) built from its shard on first use, and an LRU keeps at
+most ``max_tenants`` of them resident, so the cost of a request follows the
+restaurant's menu and order volume rather than the whole chain's. Requested
+ids are checked against the known restaurants (shard directories, or the
+restaurant_id column of items.csv), read once, so an unknown id costs a set
+lookup rather than a data load. Every model refresh rebuilds, in the
+refresher thread, the resident tenants whose files changed since they were
+built (shard, users table or order journal); requests keep the old bundle
+until its replacement is swapped in.
+
+Configuration (environment):
+- ``SMART_MENU_MAX_TENANTS``: resident tenant bundles (default 16)
+- ``SMART_MENU_TENANT_DIR``: shard root (default ``<data dir>/tenants``)
+
+Usage:
+    python -m src.core.tenants partition [--out DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import logging
+
+import pandas as pd
+
+from ..data_loader import load_tenant, load_users, partition_tenants, tenant_ids, tenant_sources
+from ..metrics import TENANT_EVICTIONS, TENANT_REQUESTS, TENANTS_RESIDENT
+from .model_refresher import ModelBundle, build_bundle, get_model_refresher, next_version
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownTenant(KeyError):
+    """No menu items for the requested restaurant"""
+
+
+class SingleTenantData(ValueError):
+    """A restaurant was requested but the dataset has no restaurant_id column"""
+
+
+def _sources_signature(restaurant_id) -> Tuple:
+    """Modification time and size of every file the tenant is built from"""
+    signature = []
+    for path in tenant_sources(restaurant_id):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append((path, None, None))
+        else:
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class TenantRegistry:
+    """LRU of per-restaurant model bundles, built on first request"""
+
+    def __init__(self, max_tenants: int = 16):
+        self.max_tenants = max_tenants
+        self._bundles: "OrderedDict[object, ModelBundle]" = OrderedDict()
+        self._loading: Dict[object, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._users: Optional[pd.DataFrame] = None
+        self._known: Optional[set] = None  # restaurant ids with a menu, as strings
+        self.loads = 0
+        self.evictions = 0
+
+    def users(self) -> pd.DataFrame:
+        """Customers are shared by every restaurant; loaded once"""
+        if self._users is None:
+            self._users = load_users()
+        return self._users
+
+    def known(self, restaurant_id) -> bool:
+        """Whether the restaurant has a menu (the id list is read once, until ``invalidate()``)"""
+        known = self._known
+        if known is None:
+            try:
+                known = self._known = tenant_ids()
+            except ValueError as e:
+                raise SingleTenantData(str(e)) from e
+        return str(restaurant_id) in known
+
+    def get(self, restaurant_id) -> ModelBundle:
+        """The tenant's bundle, loading it (and evicting the least recently used) on a miss"""
+        if not self.known(restaurant_id):
+            TENANT_REQUESTS.labels(result="unknown").inc()
+            raise UnknownTenant(restaurant_id)
+        with self._lock:
+            bundle = self._bundles.get(restaurant_id)
+            if bundle is not None:
+                self._bundles.move_to_end(restaurant_id)
+                TENANT_REQUESTS.labels(result="hit").inc()
+                return bundle
+            load_lock = self._loading.setdefault(restaurant_id, threading.Lock())
+
+        # One build per tenant; concurrent requests for it wait for that build
+        with load_lock:
+            with self._lock:
+                bundle = self._bundles.get(restaurant_id)
+            if bundle is not None:
+                TENANT_REQUESTS.labels(result="hit").inc()
+                return bundle
+            TENANT_REQUESTS.labels(result="load").inc()
+            try:
+                bundle = self._build(restaurant_id)
+                with self._lock:
+                    self._bundles[restaurant_id] = bundle
+                    while len(self._bundles) > self.max_tenants:
+                        evicted, _ = self._bundles.popitem(last=False)
+                        self.evictions += 1
+                        TENANT_EVICTIONS.inc()
+                        logger.info(f"Evicted tenant {evicted}")
+            finally:
+                # Failed loads (unknown restaurants) must not leave their lock behind
+                with self._lock:
+                    self._loading.pop(restaurant_id, None)
+        return bundle
+
+    def _build(self, restaurant_id) -> ModelBundle:
+        sources = _sources_signature(restaurant_id)  # before reading: a later change rebuilds again
+        items, orders = load_tenant(restaurant_id)
+        if items.empty:
+            raise UnknownTenant(restaurant_id)
+        self.loads += 1
+        bundle = build_bundle(next_version(), data=(self.users(), items, orders))
+        bundle.metadata["restaurant_id"] = restaurant_id
+        bundle.metadata["sources"] = sources
+        logger.info(f"Loaded tenant {restaurant_id}: {len(items)} items, {len(orders)} order lines "
+                    f"in {bundle.build_seconds:.2f}s")
+        return bundle
+
+    def refresh(self, users: Optional[pd.DataFrame] = None) -> List:
+        """Rebuild the resident tenants whose files changed; returns their ids.
+
+        Runs on the model refresher's thread when it builds a new bundle
+        (``users`` is that bundle's users table): requests keep being served
+        from the old tenant bundle until its replacement is built.
+        """
+        with self._lock:
+            if users is not None:
+                self._users = users
+            self._known = None
+            resident = list(self._bundles.items())
+        rebuilt = []
+        for restaurant_id, bundle in resident:
+            if bundle.metadata.get("sources") == _sources_signature(restaurant_id):
+                continue
+            try:
+                if not self.known(restaurant_id):
+                    self.invalidate(restaurant_id)
+                    continue
+                replacement = self._build(restaurant_id)
+            except Exception as e:
+                logger.error(f"Rebuilding tenant {restaurant_id} failed, keeping its bundle: {e}")
+                continue
+            with self._lock:
+                if restaurant_id in self._bundles:  # not evicted while it was rebuilt
+                    self._bundles[restaurant_id] = replacement
+                    rebuilt.append(restaurant_id)
+        return rebuilt
+
+    def invalidate(self, restaurant_id=None):
+        """Drop one tenant (or all) so the next request reloads it from its shard"""
+        with self._lock:
+            if restaurant_id is None:
+                self._bundles.clear()
+                self._users = None
+                self._known = None
+            else:
+                self._bundles.pop(restaurant_id, None)
+
+    def resident(self) -> List:
+        """Resident tenants, least recently used first"""
+        with self._lock:
+            return list(self._bundles)
+
+    def stats(self) -> Dict:
+        return {
+            'resident': self.resident(),
+            'max_tenants': self.max_tenants,
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
+
+
+# Global instance
+_tenant_registry = None
+
+def get_tenant_registry() -> TenantRegistry:
+    """Get global tenant registry instance"""
+    global _tenant_registry
+    if _tenant_registry is None:
+        _tenant_registry = TenantRegistry(max_tenants=int(os.environ.get("SMART_MENU_MAX_TENANTS", 16)))
+        TENANTS_RESIDENT.set_function(lambda: len(_tenant_registry._bundles))
+        # A refresh means the data may have moved on: rebuild the tenants it touched
+        get_model_refresher().on_build(lambda bundle: _tenant_registry.refresh(bundle.users))
+    return _tenant_registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-restaurant data shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    partition = subparsers.add_parser("partition", help="Split the dataset into one shard per restaurant")
+    partition.add_argument("--out", type=str, default=None,
+                           help="Shard root (default: $SMART_MENU_TENANT_DIR or <data dir>/tenants)")
+    args = parser.parse_args()
+
+    if args.command == "partition":
+        tenants = partition_tenants(args.out)
+        print(f"Wrote {len(tenants)} restaurant shards")
+
+
+if __name__ == "__main__":
+    main()
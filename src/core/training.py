@@ -0,0 +1,47 @@
+"""
+Model training entry point
+Builds the collaborative model off the request path and publishes it to the
+shared model store so every worker maps the same arrays.
+
+Item-item training can split the item rows across worker processes and
+prune each item to its top-N neighbours (see similarity.py).
+
+Usage:
+    python -m src.core.training [--backend als]
+    OPENBLAS_NUM_THREADS=1 python -m src.core.training --workers 8 --neighbours 50
+"""
+
+import argparse
+
+from ..data_loader import load_items
+from .collaborative import CF_BACKENDS, build_model, publish_model
+from .shared_model import SharedModelStore
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish the CF model")
+    parser.add_argument("--model-dir", type=str, default=None,
+                        help="Shared model store root (default: $SMART_MENU_MODEL_DIR or data/models)")
+    parser.add_argument("--backend", type=str, default=None, choices=CF_BACKENDS,
+                        help="CF backend (default: $SMART_MENU_CF_BACKEND or item_similarity)")
+    parser.add_argument("--workers", type=_positive_int, default=1,
+                        help="Training processes (item_similarity) or threads (als)")
+    parser.add_argument("--neighbours", type=_positive_int, default=None,
+                        help="Keep each item's top-N similar items only (item_similarity)")
+    args = parser.parse_args()
+
+    model = build_model(backend=args.backend, workers=args.workers, neighbours=args.neighbours)
+    generation = publish_model(model, items=load_items(), store=SharedModelStore(args.model_dir))
+    print(f"Published {model.kind} CF model generation {generation} "
+          f"({len(model.users)} users x {len(model.items)} items)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,65 @@
+import os
+import tempfile
+import threading
+import uuid
+import numpy as np
 import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Tuple
+from typing import Iterator, List, Sequence, Tuple
+from .tracing import traced
+from .metrics import DATASET_ROWS
 
+try:
+    import fcntl
+except ImportError:  # not on Windows: the journal lock is per process there
+    fcntl = None
 
-def load_users(path: str = "data/raw/users.csv") -> pd.DataFrame:
-    users = pd.read_csv(path)
+
+DEFAULT_DATA_DIR = "data/raw"
+
+# Order lines recorded while serving (purchases posted to /feedback)
+JOURNAL_COLUMNS = ["event_id", "user_id", "item_id", "quantity", "timestamp"]
+# One timestamp format per file: pandas only parses a column whose rows share one
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+_journal_lock = threading.Lock()
+
+
+def data_path(filename: str) -> str:
+    """Path of a dataset file; the directory can be overridden with SMART_MENU_DATA_DIR"""
+    return os.path.join(os.environ.get("SMART_MENU_DATA_DIR", DEFAULT_DATA_DIR), filename)
+
+
+def journal_path() -> str:
+    """Recorded-orders journal; can be overridden with SMART_MENU_ORDER_JOURNAL"""
+    return os.environ.get("SMART_MENU_ORDER_JOURNAL") or data_path("recorded_orders.csv")
+
+
+def tenant_root() -> str:
+    """Root of the per-restaurant shards; can be overridden with SMART_MENU_TENANT_DIR"""
+    return os.environ.get("SMART_MENU_TENANT_DIR") or data_path("tenants")
+
+
+def tenant_dir(restaurant_id) -> str:
+    """Shard directory of one restaurant"""
+    return os.path.join(tenant_root(), str(restaurant_id))
+
+
+def tenant_ids() -> set:
+    """Restaurant ids with a menu, as strings: the shard directories when the data is
+    partitioned, else the restaurant_id column of items.csv (read without parsing)"""
+    root = tenant_root()
+    if os.path.isdir(root):
+        return {name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))}
+    items = pd.read_csv(data_path("items.csv"), nrows=0)
+    if "restaurant_id" not in items.columns:
+        raise ValueError("items have no restaurant_id column; the dataset is single-tenant")
+    restaurants = pd.read_csv(data_path("items.csv"), usecols=["restaurant_id"])["restaurant_id"]
+    return {str(r) for r in restaurants.dropna().unique()}
+
+
+def load_users(path: str | None = None) -> pd.DataFrame:
+    users = pd.read_csv(path or data_path("users.csv"))
     # Normalize list-like fields if present
     for col in [
         "favorite_categories",
@@ -19,8 +74,8 @@ def load_users(path: str = "data/raw/users.csv") -> pd.DataFrame:
     return users
 
 
-def load_items(path: str = "data/raw/items.csv") -> pd.DataFrame:
-    items = pd.read_csv(path)
+def load_items(path: str | None = None) -> pd.DataFrame:
+    items = pd.read_csv(path or data_path("items.csv"))
     # Ensure types
     if "dietary_tags" in items.columns:
         items["dietary_tags"] = items["dietary_tags"].fillna("").apply(
@@ -40,31 +95,316 @@ def _infer_time_of_day(ts: datetime) -> str:
     return "dinner"
 
 
-def load_orders(orders_path: str = "data/raw/orders.csv", 
-                order_items_path: str = "data/raw/order_items.csv") -> pd.DataFrame:
-    orders = pd.read_csv(orders_path, parse_dates=["timestamp"], dayfirst=False)
-    order_items = pd.read_csv(order_items_path)
+def load_order_tables(orders_path: str | None = None,
+                      order_items_path: str | None = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Raw orders and order_items frames, before merging"""
+    orders = pd.read_csv(orders_path or data_path("orders.csv"), parse_dates=["timestamp"], dayfirst=False)
+    order_items = pd.read_csv(order_items_path or data_path("order_items.csv"))
+    return orders, order_items
+
+
+def load_orders(orders_path: str | None = None,
+                order_items_path: str | None = None) -> pd.DataFrame:
+    return prepare_orders(*load_order_tables(orders_path, order_items_path))
+
+
+def prepare_orders(orders: pd.DataFrame, order_items: pd.DataFrame, how: str = "left") -> pd.DataFrame:
+    """Parse and merge raw orders/order_items frames into one row per order line"""
+    order_items = order_items.copy()
     
     # Parse list-like fields
     for col in ['added_ingredients', 'removed_ingredients']:
         if col in order_items.columns:
-            order_items[col] = order_items[col].fillna("").apply(
+            order_items[col] = order_items[col].fillna("").astype(str).apply(
                 lambda x: [v.strip() for v in str(x).split(",") if v.strip()]
             )
     
     # Add derived fields
     if "time_of_day" not in orders.columns:
+        orders = orders.copy()
         orders["time_of_day"] = orders["timestamp"].apply(_infer_time_of_day)
     
     # Merge orders with order_items to get complete information
-    complete_orders = pd.merge(orders, order_items, on="order_id", how="left")
+    complete_orders = pd.merge(orders, order_items, on="order_id", how=how)
     return complete_orders
 
 
+def _read_chunks(path: str, chunksize: int, **csv_kwargs) -> Iterator[pd.DataFrame]:
+    """A CSV file in chunks of ``chunksize`` rows, or a Parquet file batch by batch"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, **csv_kwargs)
+
+
+def _check_sorted(order_ids, previous, path: str):
+    if (previous is not None and order_ids[0] < previous) or (order_ids[1:] < order_ids[:-1]).any():
+        raise ValueError(f"{path} is not sorted by order_id; streaming needs both order files in order_id order")
+
+
+def iter_order_chunks(chunksize: int = 100_000, orders_path: str | None = None,
+                      order_items_path: str | None = None) -> Iterator[pd.DataFrame]:
+    """``load_orders`` as a stream of merged chunks of about ``chunksize`` order lines.
+
+    Neither file is read whole: both must be sorted by order_id (as
+    generate_mock_data writes them), and each order_items chunk is joined with
+    the orders read up to its last order_id. Orders without any line are
+    skipped; they carry no item to aggregate.
+    """
+    orders_path = orders_path or data_path("orders.csv")
+    order_items_path = order_items_path or data_path("order_items.csv")
+    orders_reader = _read_chunks(orders_path, chunksize, parse_dates=["timestamp"])
+    pending = None  # orders read but not joined yet
+    last_order = last_line = None
+    for lines in _read_chunks(order_items_path, chunksize):
+        if lines.empty:
+            continue
+        line_ids = lines["order_id"].to_numpy()
+        _check_sorted(line_ids, last_line, order_items_path)
+        last_line = high = line_ids[-1]
+
+        # Read orders until they cover this chunk's last order_id
+        while pending is None or pending.empty or pending["order_id"].iloc[-1] < high:
+            orders = next(orders_reader, None)
+            if orders is None:
+                break
+            if orders.empty:
+                continue
+            order_ids = orders["order_id"].to_numpy()
+            _check_sorted(order_ids, last_order, orders_path)
+            last_order = order_ids[-1]
+            pending = orders if pending is None else pd.concat([pending, orders], ignore_index=True)
+        if pending is None:
+            return
+
+        # The last order's lines may continue in the next chunk, so it stays pending
+        pending_ids = pending["order_id"].to_numpy()
+        yield prepare_orders(pending[pending_ids <= high], lines, how="inner")
+        pending = pending[pending_ids >= high]
+
+
+@contextmanager
+def journal_lock(exclusive: bool = False):
+    """File lock shared by every process using the journal (``<journal>.lock``).
+
+    Appends and the builds reading the order files plus the journal hold it
+    shared; ``compact_journal`` holds it exclusively, so a build never sees a
+    line both in the order files and in the journal, or in neither. Without
+    ``fcntl`` this is a no-op and the journal is not compacted.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = journal_path() + ".lock"
+    try:
+        f = open(path, "a")
+    except OSError:  # read-only data directory: nothing can be journaled or compacted either
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _create_journal(path: str):
+    """Create the journal with its header in one step; a no-op when it exists"""
+    if os.path.exists(path):
+        return
+    fd, staged = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(",".join(JOURNAL_COLUMNS) + "\n")
+        try:
+            os.link(staged, path)  # appears complete, header included; fails if another worker won
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(staged)
+
+
+def record_order_lines(user_id, item_ids: Sequence, at=None) -> List[str]:
+    """Append one line per ordered item to the journal; returns their event ids.
+
+    The journal is created with its header atomically, and each append is a
+    single ``O_APPEND`` write, so workers sharing the data directory can
+    append to the same journal.
+    """
+    at = pd.Timestamp(at or datetime.now())
+    event_ids = [uuid.uuid4().hex for _ in item_ids]
+    lines = pd.DataFrame({"event_id": event_ids, "user_id": user_id, "item_id": list(item_ids),
+                          "quantity": 1, "timestamp": at}, columns=JOURNAL_COLUMNS)
+    data = lines.to_csv(header=False, index=False, date_format=TIMESTAMP_FORMAT).encode()
+    path = journal_path()
+    with _journal_lock, journal_lock():
+        _create_journal(path)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    return event_ids
+
+
+def _append_csv(path: str, rows: pd.DataFrame):
+    """Append ``rows`` to a CSV file in the file's column order (missing columns empty)"""
+    head = pd.read_csv(path, nrows=1, dtype=str)
+    date_format = TIMESTAMP_FORMAT
+    if "timestamp" in head.columns and len(head) and "." not in head["timestamp"].iloc[0]:
+        date_format = "%Y-%m-%d %H:%M:%S"  # the file's own format, without fractions
+    rows.reindex(columns=head.columns).to_csv(path, mode="a", header=False, index=False,
+                                              date_format=date_format)
+
+
+def compact_journal() -> int:
+    """Fold the journaled lines into the order files and empty the journal; returns the lines folded.
+
+    Each line becomes one order (as ``load_recorded_orders`` reads it) with the
+    next order ids, so the files stay sorted by order_id; per-restaurant
+    shards get their lines too. Their event ids are dropped. Run after a
+    successful build, so the journal only holds what was recorded since.
+    """
+    path = journal_path()
+    orders_path, order_items_path = data_path("orders.csv"), data_path("order_items.csv")
+    if fcntl is None or not os.path.exists(path):
+        return 0
+    if not (os.path.exists(orders_path) and os.path.exists(order_items_path)):
+        return 0
+    with journal_lock(exclusive=True):
+        if not os.path.exists(path):
+            return 0
+        lines = pd.read_csv(path, parse_dates=["timestamp"])
+        if lines.empty:
+            os.remove(path)
+            return 0
+        items = pd.read_csv(data_path("items.csv"))
+        prices = items.set_index("item_id")["price"] if "price" in items.columns else pd.Series(dtype=float)
+        last = max(pd.read_csv(target, usecols=["order_id"])["order_id"].max()
+                   for target in (orders_path, order_items_path))
+        lines["order_id"] = (0 if pd.isna(last) else int(last)) + np.arange(1, len(lines) + 1)
+        lines["price"] = lines["item_id"].map(prices)
+        lines["total_amount"] = lines["price"] * lines["quantity"]
+
+        targets = [(orders_path, order_items_path, lines)]
+        if os.path.isdir(tenant_root()) and "restaurant_id" in items.columns:
+            restaurants = lines["item_id"].map(items.set_index("item_id")["restaurant_id"])
+            for restaurant_id, shard in lines.groupby(restaurants.to_numpy()):
+                directory = tenant_dir(restaurant_id)
+                if os.path.isdir(directory):
+                    targets.append((os.path.join(directory, "orders.csv"),
+                                    os.path.join(directory, "order_items.csv"), shard))
+        for target_orders, target_order_items, rows in targets:
+            # Lines first: an order whose append failed leaves lines no order joins
+            _append_csv(target_order_items, rows)
+            _append_csv(target_orders, rows)
+        os.remove(path)
+    return len(lines)
+
+
+def load_recorded_orders(path: str | None = None) -> pd.DataFrame:
+    """Journaled order lines as ``load_orders`` rows (one order each, with negative order ids)"""
+    path = path or journal_path()
+    if not os.path.exists(path):
+        return prepare_orders(pd.DataFrame({"order_id": pd.Series(dtype="int64"), "user_id": pd.Series(dtype="int64"),
+                                            "timestamp": pd.Series(dtype="datetime64[ns]")}),
+                              pd.DataFrame(columns=["order_id", "event_id", "item_id", "quantity"]), how="inner")
+    lines = pd.read_csv(path, parse_dates=["timestamp"])
+    lines["order_id"] = -np.arange(1, len(lines) + 1)
+    return prepare_orders(lines[["order_id", "user_id", "timestamp"]],
+                          lines[["order_id", "event_id", "item_id", "quantity"]])
+
+
+def with_recorded_orders(orders: pd.DataFrame, items: pd.DataFrame | None = None) -> pd.DataFrame:
+    """``orders`` plus the journaled lines (only those of ``items`` when given)"""
+    recorded = load_recorded_orders()
+    if items is not None:
+        recorded = recorded[recorded["item_id"].isin(items["item_id"])]
+    if recorded.empty:
+        return orders
+    return pd.concat([orders, recorded], ignore_index=True)
+
+
+@traced()
 def load_all() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    return load_users(), load_items(), load_orders()
+    users, items = load_users(), load_items()
+    with journal_lock():  # the order files and the journal as of one instant
+        orders = with_recorded_orders(load_orders())
+    DATASET_ROWS.set(len(users), table="users")
+    DATASET_ROWS.set(len(items), table="items")
+    DATASET_ROWS.set(len(orders), table="order_lines")
+    return users, items, orders
+
+
+def _order_restaurants(orders: pd.DataFrame, order_items: pd.DataFrame, items: pd.DataFrame) -> pd.Series:
+    """restaurant_id per order: the orders column, else the restaurant of the order's first item"""
+    if "restaurant_id" in orders.columns:
+        return orders["restaurant_id"]
+    item_restaurants = items.set_index("item_id")["restaurant_id"]
+    first_items = order_items.drop_duplicates("order_id").set_index("order_id")["item_id"]
+    return orders["order_id"].map(first_items).map(item_restaurants)
+
+
+def partition_tenants(root: str | None = None) -> List:
+    """Split items, orders and order_items into one shard directory per restaurant"""
+    items = pd.read_csv(data_path("items.csv"))  # raw, so shards are written back verbatim
+    if "restaurant_id" not in items.columns:
+        raise ValueError("items.csv has no restaurant_id column; nothing to partition")
+    orders, order_items = load_order_tables()
+    restaurants = _order_restaurants(orders, order_items, items)
+    line_restaurants = order_items["order_id"].map(pd.Series(restaurants.to_numpy(), index=orders["order_id"]))
+    order_groups = dict(list(orders.groupby(restaurants.to_numpy())))
+    line_groups = dict(list(order_items.groupby(line_restaurants.to_numpy())))
+
+    tenant_ids = []
+    for restaurant_id, menu in items.groupby("restaurant_id"):
+        directory = os.path.join(root, str(restaurant_id)) if root else tenant_dir(restaurant_id)
+        os.makedirs(directory, exist_ok=True)
+        menu.to_csv(os.path.join(directory, "items.csv"), index=False)
+        order_groups.get(restaurant_id, orders.iloc[:0]).to_csv(os.path.join(directory, "orders.csv"), index=False)
+        line_groups.get(restaurant_id, order_items.iloc[:0]).to_csv(
+            os.path.join(directory, "order_items.csv"), index=False)
+        tenant_ids.append(restaurant_id)
+    return tenant_ids
+
+
+@traced()
+def tenant_sources(restaurant_id) -> List[str]:
+    """Files a restaurant's bundle is built from: its shard (else the global tables), users, the journal"""
+    directory = tenant_dir(restaurant_id)
+    if not os.path.isdir(directory):
+        directory = os.path.dirname(data_path("items.csv"))
+    return ([os.path.join(directory, name) for name in ("items.csv", "orders.csv", "order_items.csv")]
+            + [data_path("users.csv"), journal_path()])
 
 
+def load_tenant(restaurant_id) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """One restaurant's menu and order lines, from its shard when the data is partitioned"""
+    with journal_lock():
+        return _load_tenant(restaurant_id)
 
 
+def _load_tenant(restaurant_id) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    directory = tenant_dir(restaurant_id)
+    if os.path.isdir(directory):
+        items = load_items(os.path.join(directory, "items.csv"))
+        orders = load_orders(os.path.join(directory, "orders.csv"), os.path.join(directory, "order_items.csv"))
+        return items, with_recorded_orders(orders, items)
+    if os.path.isdir(tenant_root()):
+        # Partitioned, and this restaurant has no shard: no menu, without touching the global tables
+        return pd.DataFrame(columns=["item_id", "restaurant_id"]), pd.DataFrame(columns=JOURNAL_COLUMNS)
 
+    # Not partitioned: filter the global tables (reads the whole chain's data)
+    items = load_items()
+    if "restaurant_id" not in items.columns:
+        raise ValueError("items have no restaurant_id column; the dataset is single-tenant")
+    orders, order_items = load_order_tables()
+    restaurants = _order_restaurants(orders, order_items, items)
+    orders = orders[(restaurants == restaurant_id).to_numpy()]
+    order_items = order_items[order_items["order_id"].isin(orders["order_id"])]
+    items = items[items["restaurant_id"] == restaurant_id].reset_index(drop=True)
+    return items, with_recorded_orders(prepare_orders(orders, order_items), items)
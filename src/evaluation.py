@@ -0,0 +1,328 @@
+"""
+Offline Evaluation - time-split replay of the order log
+Orders are split at a timestamp quantile: every recommender is trained on the
+past and asked for top-k items for each user who orders in the future. The
+items a user actually ordered in the test period are the ground truth for
+precision/recall/NDCG@k; catalog coverage and throughput are reported too.
+
+Users are scored in chunks of score matrices (one row per user) spread over a
+process pool; the matrices come from the recommenders' own batch entry points
+(``popularity_scores``, ``ContextualRecommender.score_matrix`` and the CF
+models' ``score_matrix``), so evaluation and serving share one scoring path.
+The hybrid ``recommend`` pipeline scores one user at a time, so it is the
+slow entry; ``--max-users`` samples a subset for quick runs.
+``--scoring-variants`` evaluates the hybrid once per scoring variant
+(``core/scoring.py``, from ``SMART_MENU_SCORING``), reported as
+``hybrid[<variant>]``.
+
+Usage:
+    python -m src.evaluation --k 10 --test-fraction 0.2 --workers 4
+    python -m src.evaluation --recommenders popularity,cf --max-users 2000 --output eval.json
+    SMART_MENU_SCORING=scoring.json python -m src.evaluation --recommenders hybrid --scoring-variants baseline,linear
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import load_items, load_order_tables, load_users, prepare_orders
+from .core.collaborative import CollaborativeFiltering
+from .core.contextual import Context, ContextualRecommender
+from .core.hybrid import recommend
+from .core.model_refresher import build_bundle
+from .core.popularity import PopularityRecommender
+from .core.scoring import get_scoring_config
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDERS = ("popularity", "contextual", "cf", "als", "hybrid")
+
+
+@dataclass
+class TimeSplit:
+    """Orders before/after ``cutoff`` as raw orders + order_items frames"""
+    cutoff: pd.Timestamp
+    train_orders: pd.DataFrame
+    train_order_items: pd.DataFrame
+    test_orders: pd.DataFrame
+    test_order_items: pd.DataFrame
+
+
+def time_split(orders: pd.DataFrame, order_items: pd.DataFrame, test_fraction: float = 0.2) -> TimeSplit:
+    """Split at the timestamp quantile leaving ``test_fraction`` of the orders for testing"""
+    cutoff = orders["timestamp"].quantile(1.0 - test_fraction)
+    is_train = orders["timestamp"] < cutoff
+    train_ids = orders.loc[is_train, "order_id"]
+    in_train = order_items["order_id"].isin(train_ids)
+    return TimeSplit(
+        cutoff=cutoff,
+        train_orders=orders[is_train],
+        train_order_items=order_items[in_train],
+        test_orders=orders[~is_train],
+        test_order_items=order_items[~in_train],
+    )
+
+
+# Evaluation state, set in the parent and in every worker by _init_worker
+_state: Dict = {}
+
+
+def _init_worker(state: Dict):
+    global _state
+    _state = state
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores per row, -1 where a row has fewer candidates"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top[~np.isfinite(np.take_along_axis(top_scores, order, axis=1))] = -1
+    return top
+
+
+def _catalogue_top_k(scores: np.ndarray, items: np.ndarray, k: int) -> np.ndarray:
+    """Top k of a users x ``items`` score matrix, as positions in the evaluated catalogue"""
+    full = np.full((len(scores), len(_state["item_ids"])), -np.inf)
+    full[:, _state["item_positions"].reindex(items).to_numpy(dtype=int)] = np.where(np.isnan(scores), -np.inf, scores)
+    return _top_k(full, k)
+
+
+def _popularity_top_k(rows: np.ndarray, k: int) -> np.ndarray:
+    """PopularityRecommender: the same best sellers for everyone"""
+    scores = _state["popularity"].popularity_scores
+    top = _catalogue_top_k(scores.to_numpy(dtype=float)[None, :], scores.index.to_numpy(), k)
+    return np.repeat(top, len(rows), axis=0)
+
+
+def _contextual_top_k(rows: np.ndarray, k: int) -> np.ndarray:
+    """ContextualRecommender: scored in each user's context at their first test order"""
+    contextual = _state["contextual"]
+    user_ids = _state["user_ids"][rows]
+    contexts = [Context(user_id=int(user_id), now=_state["first_test_order"][row])
+                for user_id, row in zip(user_ids, rows)]
+    return _catalogue_top_k(contextual.score_matrix(user_ids, contexts), contextual.items, k)
+
+
+def _cf_top_k(rows: np.ndarray, k: int) -> np.ndarray:
+    """CollaborativeFiltering: item-item similarity over the user's interactions"""
+    model = _state["cf_model"]
+    return _catalogue_top_k(model.score_matrix(_state["user_ids"][rows]), model.items, k)
+
+
+def _als_top_k(rows: np.ndarray, k: int) -> np.ndarray:
+    """CollaborativeFiltering with the ALS backend: user factors against item factors"""
+    model = _state["als_model"]
+    return _catalogue_top_k(model.score_matrix(_state["user_ids"][rows]), model.items, k)
+
+
+def _hybrid_top_k(rows: np.ndarray, k: int, variant: str | None = None) -> np.ndarray:
+    """Hybrid ``recommend`` per user, at the time of the user's first test order.
+
+    ``variant`` scores every user with that scoring variant instead of the one serving them.
+    """
+    top = np.full((len(rows), k), -1)
+    item_positions = _state["item_positions"]
+    formula = get_scoring_config().formula(variant) if variant else None
+    for i, row in enumerate(rows):
+        user_id = int(_state["user_ids"][row])
+        ctx = Context(user_id=user_id, now=_state["first_test_order"][row]).ensure()
+        recommended = recommend(user_id, top_k=k, ctx=ctx, bundle=_state["bundle"], formula=formula)["item_id"]
+        positions = item_positions.reindex(recommended).dropna().to_numpy(dtype=int)
+        top[i, :len(positions)] = positions
+    return top
+
+
+TOP_K: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    "popularity": _popularity_top_k,
+    "contextual": _contextual_top_k,
+    "cf": _cf_top_k,
+    "als": _als_top_k,
+    "hybrid": _hybrid_top_k,
+}
+
+
+def _evaluate_chunk(name: str, rows: np.ndarray, k: int, variant: str | None = None) -> Dict:
+    """Metric sums over one chunk of evaluated users (``variant``: hybrid scoring variant)"""
+    top = TOP_K[name](rows, k) if variant is None else _hybrid_top_k(rows, k, variant)
+
+    # Dense ground truth for the chunk only, from the CSR-style index
+    indptr, indices = _state["truth_indptr"], _state["truth_indices"]
+    truth = np.zeros((len(rows), len(_state["item_ids"])), dtype=bool)
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    chunk_rows = np.repeat(np.arange(len(rows)), lengths)
+    positions = np.concatenate([indices[s:e] for s, e in zip(starts, ends)]) if len(rows) else indices[:0]
+    truth[chunk_rows, positions] = True
+
+    valid = top >= 0
+    hits = truth[np.arange(len(rows))[:, None], np.maximum(top, 0)] & valid
+    n_hits = hits.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, top.shape[1] + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    idcg = np.cumsum(discounts)[np.minimum(lengths, top.shape[1]) - 1]
+
+    return {
+        "users": len(rows),
+        "precision": float((n_hits / k).sum()),
+        "recall": float((n_hits / lengths).sum()),
+        "ndcg": float((dcg / idcg).sum()),
+        "recommended": np.unique(top[valid]),
+    }
+
+
+def prepare(data_dir: str | None = None, test_fraction: float = 0.2,
+            recommenders: Tuple[str, ...] = RECOMMENDERS, max_users: int | None = None,
+            seed: int = 0) -> Dict:
+    """Split the order log, train the requested recommenders and index the ground truth"""
+    if data_dir:
+        os.environ["SMART_MENU_DATA_DIR"] = data_dir
+    users, items = load_users(), load_items()
+    orders, order_items = load_order_tables()
+    split = time_split(orders, order_items, test_fraction)
+    logger.info(f"Split at {split.cutoff}: {len(split.train_orders)} train / {len(split.test_orders)} test orders")
+
+    # Ground truth: items each known user ordered after the cutoff
+    test_lines = split.test_order_items.merge(split.test_orders[["order_id", "user_id", "timestamp"]], on="order_id")
+    test_lines = test_lines[test_lines["user_id"].isin(users["user_id"])].dropna(subset=["item_id"])
+    item_ids = np.union1d(items["item_id"].to_numpy(), order_items["item_id"].dropna().to_numpy()).astype(int)
+    item_positions = pd.Series(np.arange(len(item_ids)), index=item_ids)
+
+    user_ids = np.sort(test_lines["user_id"].unique())
+    if max_users and len(user_ids) > max_users:
+        user_ids = np.sort(np.random.default_rng(seed).choice(user_ids, size=max_users, replace=False))
+        test_lines = test_lines[test_lines["user_id"].isin(user_ids)]
+    truth = (test_lines.assign(row=np.searchsorted(user_ids, test_lines["user_id"]),
+                               position=item_positions.reindex(test_lines["item_id"].astype(int)).to_numpy())
+             .drop_duplicates(["row", "position"]).sort_values(["row", "position"]))
+    truth_indptr = np.concatenate([[0], np.cumsum(np.bincount(truth["row"], minlength=len(user_ids)))])
+
+    state = {
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "item_positions": item_positions,
+        "truth_indptr": truth_indptr,
+        "truth_indices": truth["position"].to_numpy(),
+        "first_test_order": test_lines.groupby("user_id")["timestamp"].min().reindex(user_ids).tolist(),
+        "train_seconds": {},
+    }
+
+    train_orders, train_order_items = split.train_orders, split.train_order_items
+    for name in recommenders:
+        start = time.perf_counter()
+        if name == "popularity":
+            state["popularity"] = PopularityRecommender(train_orders, train_order_items)
+        elif name == "contextual":
+            state["contextual"] = ContextualRecommender(train_orders, train_order_items, users)
+        elif name == "cf":
+            state["cf_model"] = CollaborativeFiltering(train_orders, train_order_items,
+                                                       backend="item_similarity").model
+        elif name == "als":
+            state["als_model"] = CollaborativeFiltering(train_orders, train_order_items, backend="als").model
+        elif name == "hybrid":
+            train_lines = prepare_orders(train_orders, train_order_items)
+            state["bundle"] = build_bundle(0, data=(users, items, train_lines), now=split.cutoff)
+        else:
+            raise ValueError(f"Unknown recommender '{name}' (choose from {', '.join(RECOMMENDERS)})")
+        state["train_seconds"][name] = time.perf_counter() - start
+    return state
+
+
+def evaluate(state: Dict, recommenders: Tuple[str, ...] = RECOMMENDERS, k: int = 10,
+             workers: int = 1, chunk_size: int = 1024, scoring_variants: Tuple[str, ...] = ()) -> List[Dict]:
+    """Quality metrics and throughput per recommender (and per hybrid scoring variant)"""
+    n_users = len(state["user_ids"])
+    for variant in scoring_variants:
+        get_scoring_config().formula(variant)  # unknown names fail before any scoring
+    runs = [(name, variant) for name in recommenders
+            for variant in (scoring_variants if name == "hybrid" and scoring_variants else (None,))]
+    executor = (ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,))
+                if workers > 1 else None)
+    if executor is None:
+        _init_worker(state)
+
+    results = []
+    try:
+        for name, variant in runs:
+            # The hybrid pipeline is per user; smaller chunks keep the workers balanced
+            size = max(1, chunk_size // 32) if name == "hybrid" else chunk_size
+            chunks = [np.arange(start, min(start + size, n_users)) for start in range(0, n_users, size)]
+
+            start = time.perf_counter()
+            if executor is not None:
+                parts = list(executor.map(_evaluate_chunk, [name] * len(chunks), chunks, [k] * len(chunks),
+                                          [variant] * len(chunks)))
+            else:
+                parts = [_evaluate_chunk(name, chunk, k, variant) for chunk in chunks]
+            elapsed = time.perf_counter() - start
+
+            recommended = np.unique(np.concatenate([p["recommended"] for p in parts])) if parts else []
+            results.append({
+                "recommender": f"{name}[{variant}]" if variant else name,
+                "k": k,
+                "users": n_users,
+                f"precision@{k}": sum(p["precision"] for p in parts) / max(n_users, 1),
+                f"recall@{k}": sum(p["recall"] for p in parts) / max(n_users, 1),
+                f"ndcg@{k}": sum(p["ndcg"] for p in parts) / max(n_users, 1),
+                "coverage": len(recommended) / len(state["item_ids"]),
+                "train_seconds": state["train_seconds"][name],
+                "eval_seconds": elapsed,
+                "users_per_second": n_users / elapsed if elapsed > 0 else float("inf"),
+            })
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline time-split evaluation of the recommenders")
+    parser.add_argument("--data-dir", type=str, default=None, help="Dataset directory (default: SMART_MENU_DATA_DIR)")
+    parser.add_argument("--k", type=int, default=10, help="Recommendation list length")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Most recent fraction of orders held out")
+    parser.add_argument("--recommenders", type=str, default=",".join(RECOMMENDERS),
+                        help=f"Comma-separated recommenders ({', '.join(RECOMMENDERS)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Users scored per task")
+    parser.add_argument("--max-users", type=int, default=None, help="Evaluate a random sample of test users")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --max-users sampling")
+    parser.add_argument("--scoring-variants", type=str, default="",
+                        help="Comma-separated hybrid scoring variants to compare (defined in SMART_MENU_SCORING)")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    recommenders = tuple(args.recommenders.split(","))
+    state = prepare(args.data_dir, args.test_fraction, recommenders, args.max_users, args.seed)
+    scoring_variants = tuple(v for v in args.scoring_variants.split(",") if v)
+    results = evaluate(state, recommenders, k=args.k, workers=args.workers, chunk_size=args.chunk_size,
+                       scoring_variants=scoring_variants)
+
+    k = args.k
+    print(f"{'recommender':<18} {'users':>8} {f'P@{k}':>8} {f'R@{k}':>8} {f'NDCG@{k}':>8} "
+          f"{'coverage':>9} {'train s':>8} {'users/s':>10}")
+    for r in results:
+        print(f"{r['recommender']:<18} {r['users']:>8} {r[f'precision@{k}']:>8.4f} {r[f'recall@{k}']:>8.4f} "
+              f"{r[f'ndcg@{k}']:>8.4f} {r['coverage']:>9.3f} {r['train_seconds']:>8.2f} "
+              f"{r['users_per_second']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cutoff_quantile": 1.0 - args.test_fraction, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
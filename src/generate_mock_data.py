@@ -1,42 +1,27 @@
+"""
+Mock Data Generator - realistic restaurant data at any scale
+Generates users, menu items across restaurants, orders and order lines with
+Zipf-skewed item popularity, time-of-day and seasonal ordering patterns and
+ingredient customizations. Orders are produced and written chunk by chunk,
+so multi-million-order datasets never have to fit in memory.
 
-import pandas as pd
-import random
-from datetime import datetime, timedelta
+Usage:
+    python -m src.generate_mock_data                      # demo dataset in data/raw
+    python -m src.generate_mock_data --users 100000 --items 5000 \\
+        --restaurants 200 --orders 2000000 --out data/scale --format parquet
+"""
 
-# Generate users with realistic restaurant customer data
-user_data = []
-names = ["Sarah Johnson", "Ahmed Benali", "Fatima Zahra", "Omar Cherif", "Emma Wilson", 
-         "Carlos Rodriguez", "Priya Patel", "David Kim", "Lisa Chen", "Michael Brown",
-         "Anna Schmidt", "James Taylor", "Maria Garcia", "John Smith", "Jennifer Lee",
-         "Robert Davis", "Amanda White", "Christopher Jones", "Jessica Miller", "Daniel Wilson"]
+from __future__ import annotations
 
-for i in range(20):
-    user_data.append({
-        "user_id": i + 1,
-        "name": names[i],
-        "age": random.randint(18, 65),
-        "gender": random.choice(["male", "female"]),
-        "diet": random.choice(["vegetarian", "vegan", "chicken", "none"]),
-        "allergies": random.choice(["", "nuts", "dairy", "eggs", "shellfish", "nuts,dairy"]),
-        "budget_sensitivity": random.choice(["low", "mid", "high"]),
-        "favorite_categories": random.choice(["pizza,burger", "salad,healthy", "dessert", "pasta,italian", "seafood"]),
-        "disliked_categories": random.choice(["", "spicy", "seafood", "dessert"]),
-        "time_preferences": random.choice(["morning,lunch", "lunch,dinner", "dinner", "morning"]),
-        "spice_tolerance": random.choice(["low", "medium", "high"]),
-        "health_conscious": random.choice([True, False]),
-        "location": random.choice(["downtown", "suburbs", "university", "business district"]),
-        "registration_date": "2023-01-01",
-        "last_visit": "2024-01-15",
-        "visit_frequency": random.choice(["daily", "weekly", "monthly"]),
-        "avg_order_value": round(random.uniform(15, 50), 2),
-        "loyalty_tier": random.choice(["bronze", "silver", "gold", "platinum"]),
-        "preferred_payment": random.choice(["card", "cash", "mobile"]),
-        "special_occasions": random.choice(["birthday", "anniversary", "business", "none"])
-    })
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional
 
-users = pd.DataFrame(user_data)
+import numpy as np
+import pandas as pd
 
-# Generate items with proper restaurant data
+# Curated demo menu; larger menus are variations of these dishes
 restaurant_items = [
     {"name": "Margherita Pizza", "category": "pizza", "subcategory": "classic", "price": 15.99, "dietary_tags": "vegetarian", "time_preference": "dinner", "budget_category": "mid"},
     {"name": "Pepperoni Pizza", "category": "pizza", "subcategory": "meat", "price": 17.99, "dietary_tags": "meat", "time_preference": "dinner", "budget_category": "mid"},
@@ -60,60 +45,292 @@ restaurant_items = [
     {"name": "Veggie Wrap", "category": "wrap", "subcategory": "healthy", "price": 9.99, "dietary_tags": "vegetarian,healthy", "time_preference": "lunch", "budget_category": "low"}
 ]
 
-items = pd.DataFrame(restaurant_items)
-items['item_id'] = range(1, len(items) + 1)
-items['description'] = items['name'] + " - Delicious " + items['category']
-items['calories'] = [random.randint(200, 800) for _ in range(len(items))]
-items['preparation_time'] = [random.randint(5, 25) for _ in range(len(items))]
-items['popularity_score'] = [round(random.uniform(0.3, 0.9), 2) for _ in range(len(items))]
-items['seasonal'] = [random.choice(['all', 'spring', 'summer', 'autumn', 'winter']) for _ in range(len(items))]
-items['image_url'] = [f"images/{items.iloc[i]['category']}/{items.iloc[i]['name'].lower().replace(' ', '_')}.jpg" for i in range(len(items))]
-
-# Generate orders
-orders = []
-order_items = []
-order_id = 1
-
-for _ in range(100):
-    # Generate an order with multiple items
-    num_items = random.randint(1, 4)  # Each order has 1-4 items
-    user_id = random.choice(users["user_id"])
-    timestamp = datetime.now() - timedelta(days=random.randint(0, 30))
-    
-    for _ in range(num_items):
-        item_id = random.choice(items["item_id"])
-        item_info = items[items["item_id"] == item_id].iloc[0]
-        
-        # Generate random modifications
-        added_ingredients = random.sample(["cheese", "mushrooms", "onions", "olives", "peppers"], 
-                                       k=random.randint(0, 2))
-        removed_ingredients = random.sample(["cheese", "mushrooms", "onions", "olives", "peppers"], 
-                                         k=random.randint(0, 2))
-        
-        order_items.append({
-            "order_id": order_id,
-            "item_id": item_id,
-            "quantity": random.randint(1, 3),
-            "price": item_info["price"],
-            "added_ingredients": ",".join(added_ingredients) if added_ingredients else "",
-            "removed_ingredients": ",".join(removed_ingredients) if removed_ingredients else ""
-        })
-    
-    orders.append({
-        "order_id": order_id,
-        "user_id": user_id,
-        "timestamp": timestamp,
-        "total_amount": sum(item["price"] * item["quantity"] for item in order_items[-num_items:])
+names = ["Sarah Johnson", "Ahmed Benali", "Fatima Zahra", "Omar Cherif", "Emma Wilson",
+         "Carlos Rodriguez", "Priya Patel", "David Kim", "Lisa Chen", "Michael Brown",
+         "Anna Schmidt", "James Taylor", "Maria Garcia", "John Smith", "Jennifer Lee",
+         "Robert Davis", "Amanda White", "Christopher Jones", "Jessica Miller", "Daniel Wilson"]
+
+VARIANTS = ["House", "Classic", "Spicy", "Deluxe", "Rustic", "Garden", "Smoky", "Signature",
+            "Mini", "Family", "Street", "Chef's"]
+INGREDIENTS = ["cheese", "mushrooms", "onions", "olives", "peppers"]
+TIMES_OF_DAY = ["morning", "lunch", "afternoon", "dinner"]
+SEASONS = ["winter", "spring", "summer", "autumn"]
+
+# Share of orders per time of day and the hour range each covers
+# (same boundaries as data_loader._infer_time_of_day)
+TIME_OF_DAY_SHARE = np.array([0.2, 0.35, 0.1, 0.35])
+TIME_OF_DAY_HOURS = [(6, 11), (11, 15), (15, 18), (18, 24)]
+
+# Relative order volume per calendar month (busier in summer and December)
+MONTH_VOLUME = np.array([0.85, 0.8, 0.9, 0.95, 1.0, 1.1, 1.2, 1.15, 1.0, 0.95, 1.0, 1.3])
+
+ZIPF_EXPONENT = 1.1
+TIME_MATCH_BOOST = 3.0
+SEASON_MATCH_BOOST = 1.5
+
+
+def _season_index(months: np.ndarray) -> np.ndarray:
+    # winter: 12,1,2  spring: 3-5  summer: 6-8  autumn: 9-11 (as utils.season_of)
+    return ((months % 12) // 3).astype(np.int8)
+
+
+def _zipf_weights(n: int, exponent: float = ZIPF_EXPONENT) -> np.ndarray:
+    return 1.0 / np.arange(1, n + 1) ** exponent
+
+
+def generate_users(n_users: int, rng: np.random.Generator, start_id: int = 1) -> pd.DataFrame:
+    """Users with the same columns as data/raw/users.csv"""
+    if start_id == 1 and n_users <= len(names):
+        user_names = np.array(names[:n_users])
+    else:
+        first = np.array([n.split()[0] for n in names])
+        last = np.array([n.split()[1] for n in names])
+        user_names = np.char.add(np.char.add(rng.choice(first, n_users), " "), rng.choice(last, n_users))
+
+    def pick(options):
+        return rng.choice(np.array(options, dtype=object), n_users)
+
+    return pd.DataFrame({
+        "user_id": np.arange(start_id, start_id + n_users),
+        "name": user_names,
+        "age": rng.integers(18, 66, n_users),
+        "gender": pick(["male", "female"]),
+        "diet": pick(["vegetarian", "vegan", "chicken", "none"]),
+        "allergies": pick(["", "nuts", "dairy", "eggs", "shellfish", "nuts,dairy"]),
+        "budget_sensitivity": pick(["low", "mid", "high"]),
+        "favorite_categories": pick(["pizza,burger", "salad,healthy", "dessert", "pasta,italian", "seafood"]),
+        "disliked_categories": pick(["", "spicy", "seafood", "dessert"]),
+        "time_preferences": pick(["morning,lunch", "lunch,dinner", "dinner", "morning"]),
+        "spice_tolerance": pick(["low", "medium", "high"]),
+        "health_conscious": rng.random(n_users) < 0.5,
+        "location": pick(["downtown", "suburbs", "university", "business district"]),
+        "registration_date": "2023-01-01",
+        "last_visit": "2024-01-15",
+        "visit_frequency": pick(["daily", "weekly", "monthly"]),
+        "avg_order_value": np.round(rng.uniform(15, 50, n_users), 2),
+        "loyalty_tier": pick(["bronze", "silver", "gold", "platinum"]),
+        "preferred_payment": pick(["card", "cash", "mobile"]),
+        "special_occasions": pick(["birthday", "anniversary", "business", "none"]),
     })
-    order_id += 1
 
-orders = pd.DataFrame(orders)
-order_items = pd.DataFrame(order_items)
 
-# Saving 
-users.to_csv("data/raw/users.csv", index=False)
-items.to_csv("data/raw/items.csv", index=False)
-orders.to_csv("data/raw/orders.csv", index=False)
-order_items.to_csv("data/raw/order_items.csv", index=False)
+def generate_items(n_items: int, n_restaurants: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Menu items spread across restaurants, built from the curated dishes"""
+    base = pd.DataFrame(restaurant_items)
+    picks = np.arange(n_items) % len(base)
+    items = base.iloc[picks].reset_index(drop=True)
+
+    # Beyond the curated menu, dishes become variants with jittered prices
+    variant = np.arange(n_items) // len(base)
+    is_variant = variant > 0
+    prefixes = np.array(VARIANTS, dtype=object)[(variant - 1) % len(VARIANTS)]
+    items.loc[is_variant, "name"] = prefixes[is_variant] + " " + items.loc[is_variant, "name"]
+    jitter = np.where(is_variant, rng.uniform(0.85, 1.2, n_items), 1.0)
+    items["price"] = np.round(items["price"].to_numpy() * jitter, 2)
+
+    items["item_id"] = np.arange(1, n_items + 1)
+    items["restaurant_id"] = np.sort(rng.integers(1, n_restaurants + 1, n_items)) if n_restaurants > 1 else 1
+    items["description"] = items["name"] + " - Delicious " + items["category"]
+    items["calories"] = rng.integers(200, 801, n_items)
+    items["preparation_time"] = rng.integers(5, 26, n_items)
+    items["popularity_score"] = np.round(rng.uniform(0.3, 0.9, n_items), 2)
+    items["seasonal"] = rng.choice(np.array(["all"] + SEASONS, dtype=object), n_items)
+    items["image_url"] = ("images/" + items["category"] + "/"
+                          + items["name"].str.lower().str.replace(" ", "_") + ".jpg")
+    return items
+
+
+class _ItemSampler:
+    """Inverse-CDF sampling of items per (restaurant, time of day, season)"""
+
+    def __init__(self, items: pd.DataFrame, rng: np.random.Generator):
+        n_items = len(items)
+        # Items are grouped by restaurant so each restaurant is one contiguous slice
+        order = np.argsort(items["restaurant_id"].to_numpy(), kind="stable")
+        self.item_ids = items["item_id"].to_numpy()[order]
+        self.prices = items["price"].to_numpy()[order]
+        restaurant_ids = items["restaurant_id"].to_numpy()[order]
+        self.restaurants, self.starts, counts = np.unique(restaurant_ids, return_index=True, return_counts=True)
+        self.ends = self.starts + counts
+
+        # Zipf popularity within each restaurant, in a random rank order
+        base = np.empty(n_items)
+        for start, end in zip(self.starts, self.ends):
+            base[start:end] = rng.permutation(_zipf_weights(end - start))
+
+        time_pref = items["time_preference"].to_numpy()[order]
+        seasonal = items["seasonal"].to_numpy()[order]
+        self.cdf = np.empty((len(TIMES_OF_DAY), len(SEASONS), n_items + 1))
+        for t, tod in enumerate(TIMES_OF_DAY):
+            time_boost = np.where(time_pref == tod, TIME_MATCH_BOOST, 1.0)
+            for s, season in enumerate(SEASONS):
+                season_boost = np.where(seasonal == season, SEASON_MATCH_BOOST, 1.0)
+                self.cdf[t, s, 0] = 0.0
+                np.cumsum(base * time_boost * season_boost, out=self.cdf[t, s, 1:])
+
+        # Restaurants themselves follow a Zipf popularity
+        self.restaurant_weights = rng.permutation(_zipf_weights(len(self.restaurants)))
+        self.restaurant_weights /= self.restaurant_weights.sum()
+
+    def sample(self, restaurant_idx: np.ndarray, tod: np.ndarray, season: np.ndarray,
+               rng: np.random.Generator) -> np.ndarray:
+        """Positions (into item_ids) of one item per row"""
+        positions = np.empty(len(restaurant_idx), dtype=np.int64)
+        u = rng.random(len(restaurant_idx))
+        for t in range(len(TIMES_OF_DAY)):
+            for s in range(len(SEASONS)):
+                rows = np.nonzero((tod == t) & (season == s))[0]
+                if rows.size == 0:
+                    continue
+                cdf = self.cdf[t, s]
+                lo = cdf[self.starts[restaurant_idx[rows]]]
+                hi = cdf[self.ends[restaurant_idx[rows]]]
+                target = lo + u[rows] * (hi - lo)
+                positions[rows] = np.searchsorted(cdf, target, side="right") - 1
+        # Guard the upper edge of each restaurant slice against float round-off
+        return np.clip(positions, self.starts[restaurant_idx], self.ends[restaurant_idx] - 1)
+
+
+def _customization_options() -> np.ndarray:
+    combos = [""] + INGREDIENTS + [f"{a},{b}" for i, a in enumerate(INGREDIENTS) for b in INGREDIENTS[i + 1:]]
+    return np.array(combos, dtype=object)
+
+
+def generate_orders(n_orders: int, users: pd.DataFrame, items: pd.DataFrame,
+                    rng: np.random.Generator, chunk_size: int = 100_000, days: int = 365,
+                    end: Optional[datetime] = None) -> Iterator[Dict[str, pd.DataFrame]]:
+    """Yield {"orders": ..., "order_items": ...} chunks of ``chunk_size`` orders"""
+    end = end or datetime.now()
+    start = end - timedelta(days=days)
+    sampler = _ItemSampler(items, rng)
+    user_ids = users["user_id"].to_numpy()
+    user_weights = rng.permutation(_zipf_weights(len(user_ids), exponent=0.8))
+    user_weights /= user_weights.sum()
+
+    # Day weights follow the monthly volume pattern
+    day_dates = pd.date_range(start.date(), periods=days, freq="D")
+    day_weights = MONTH_VOLUME[day_dates.month - 1]
+    day_weights = day_weights / day_weights.sum()
+
+    customizations = _customization_options()
+    n_single = 1 + len(INGREDIENTS)
+    custom_weights = np.concatenate([[0.6], np.full(n_single - 1, 0.3 / (n_single - 1)),
+                                     np.full(len(customizations) - n_single, 0.1 / (len(customizations) - n_single))])
+
+    next_order_id = 1
+    for chunk_start in range(0, n_orders, chunk_size):
+        n = min(chunk_size, n_orders - chunk_start)
+        order_ids = np.arange(next_order_id, next_order_id + n)
+        next_order_id += n
+
+        # When: day by seasonal volume, hour by time-of-day share
+        day = rng.choice(days, n, p=day_weights)
+        tod = rng.choice(len(TIMES_OF_DAY), n, p=TIME_OF_DAY_SHARE)
+        hour_lo = np.array([h[0] for h in TIME_OF_DAY_HOURS])[tod]
+        hour_hi = np.array([h[1] for h in TIME_OF_DAY_HOURS])[tod]
+        seconds = (rng.integers(hour_lo, hour_hi) * 3600 + rng.integers(0, 3600, n)).astype("timedelta64[s]")
+        timestamps = day_dates.values[day] + seconds
+        season = _season_index(day_dates.month.to_numpy()[day])
+
+        # Who and where
+        users_idx = rng.choice(len(user_ids), n, p=user_weights)
+        restaurant_idx = rng.choice(len(sampler.restaurants), n, p=sampler.restaurant_weights)
+
+        # What: 1-4 lines per order
+        lines_per_order = rng.integers(1, 5, n)
+        line_order = np.repeat(np.arange(n), lines_per_order)
+        positions = sampler.sample(restaurant_idx[line_order], tod[line_order], season[line_order], rng)
+        quantity = rng.choice([1, 2, 3], len(line_order), p=[0.65, 0.25, 0.1])
+        price = sampler.prices[positions]
+
+        order_items = pd.DataFrame({
+            "order_id": order_ids[line_order],
+            "item_id": sampler.item_ids[positions],
+            "quantity": quantity,
+            "price": price,
+            "added_ingredients": rng.choice(customizations, len(line_order), p=custom_weights),
+            "removed_ingredients": rng.choice(customizations, len(line_order), p=custom_weights),
+        })
+        orders = pd.DataFrame({
+            "order_id": order_ids,
+            "user_id": user_ids[users_idx],
+            "timestamp": timestamps,
+            "total_amount": np.round(np.bincount(line_order, weights=price * quantity, minlength=n), 2),
+            "restaurant_id": sampler.restaurants[restaurant_idx],
+        })
+        yield {"orders": orders, "order_items": order_items}
+
+
+class _ChunkWriter:
+    """Appends DataFrame chunks to CSV or Parquet files"""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self._writer = None
+        self._first = True
+
+    def write(self, df: pd.DataFrame):
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def generate(n_users: int = 20, n_items: int = 20, n_orders: int = 100, n_restaurants: int = 1,
+             out_dir: str = "data/raw", fmt: str = "csv", chunk_size: int = 100_000,
+             days: int = 30, seed: Optional[int] = None) -> Dict[str, str]:
+    """Generate a dataset into ``out_dir``; returns the written file paths"""
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unknown format '{fmt}', expected csv or parquet")
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, f"{name}.{fmt}") for name in ["users", "items", "orders", "order_items"]}
+
+    writers = {name: _ChunkWriter(path, fmt) for name, path in paths.items()}
+    try:
+        users = generate_users(n_users, rng)
+        writers["users"].write(users)
+        items = generate_items(n_items, n_restaurants, rng)
+        writers["items"].write(items)
+        for chunk in generate_orders(n_orders, users, items, rng, chunk_size=chunk_size, days=days):
+            writers["orders"].write(chunk["orders"])
+            writers["order_items"].write(chunk["order_items"])
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate mock restaurant data")
+    parser.add_argument("--users", type=int, default=20, help="Number of users")
+    parser.add_argument("--items", type=int, default=20, help="Number of menu items")
+    parser.add_argument("--orders", type=int, default=100, help="Number of orders")
+    parser.add_argument("--restaurants", type=int, default=1, help="Number of restaurants")
+    parser.add_argument("--days", type=int, default=30, help="History length in days")
+    parser.add_argument("--out", type=str, default="data/raw", help="Output directory")
+    parser.add_argument("--format", type=str, default="csv", choices=["csv", "parquet"])
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Orders per written chunk")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+
+    generate(n_users=args.users, n_items=args.items, n_orders=args.orders,
+             n_restaurants=args.restaurants, out_dir=args.out, fmt=args.format,
+             chunk_size=args.chunk_size, days=args.days, seed=args.seed)
+    print(f"✅ Mock data generated in {args.out}/")
+
 
-print("✅ Mock data generated in data/raw/")
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,5 @@
 import argparse
 from datetime import datetime
-from .hybrid import recommend
-from .contextual import Context
-from .utils import print_df
-from .notifications import generate_notifications
 
 
 def main():
@@ -14,11 +10,22 @@ def main():
     parser.add_argument("--top", type=int, default=10, help="Top K recommendations")
     args = parser.parse_args()
 
+    # Imported after argument parsing so --help and usage errors return instantly
+    from .core.hybrid import recommend
+    from .core.contextual import Context
+    from .utils import print_df
+    from .notifications import UnknownUser, generate_notifications
+
     ctx = Context(user_id=args.user, now=datetime.now(), budget_level=args.budget, time_of_day=args.time)
     recs = recommend(args.user, top_k=args.top, ctx=ctx)
     print_df(recs)
     print("\nNotifications:")
-    for n in generate_notifications(args.user):
+    try:
+        notifications = generate_notifications(args.user)
+    except UnknownUser:
+        print(f"- none (user {args.user} has no profile)")
+        notifications = []
+    for n in notifications:
         print(f"- [{n['type']}] {n['title']}: {n['body']} -> {n['cta']}")
 
 
@@ -0,0 +1,342 @@
+"""
+Metrics - Prometheus text-format counters, gauges and histograms
+Writes go to per-thread shards (a plain dict owned by the writing thread), so
+the hot path takes no lock; shards are only summed when ``/metrics`` is
+scraped. Gauges can also be computed at scrape time from a callback.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds for latency histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class _ThreadShards:
+    """One private dict per writing thread, merged on collection"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:  # once per thread
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            return list(self._shards)
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_values(self, labels: dict) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, values: LabelValues, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    @property
+    def exposed_name(self) -> str:
+        return self.name
+
+    def render(self) -> List[str]:
+        name = self.exposed_name
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.metric_type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_shards", "_key")
+
+    def __init__(self, shards: _ThreadShards, key: LabelValues):
+        self._shards = shards
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        shard = self._shards.shard()
+        shard[self._key] = shard.get(self._key, 0.0) + amount
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _ThreadShards()
+        self._children: Dict[LabelValues, _CounterChild] = {}
+
+    @property
+    def exposed_name(self) -> str:
+        return f"{self.name}_total"
+
+    def labels(self, **labels) -> _CounterChild:
+        key = self._label_values(labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, _CounterChild(self._shards, key))
+        return child
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def remove(self, *values):
+        """Drop one labelled series (e.g. of a retired model version) from every shard"""
+        key = tuple(str(value) for value in values)
+        self._children.pop(key, None)
+        for shard in self._shards.all():
+            shard.pop(key, None)
+
+    def values(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for shard in self._shards.all():
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def samples(self):
+        for key, value in sorted(self.values().items()):
+            yield "", self._format_labels(key), value
+
+
+class Gauge(_Metric):
+    """Point-in-time value, either set directly or computed at scrape time"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: List[Callable[[], Dict[LabelValues, float]]] = []
+
+    def set(self, value: float, **labels):
+        self._values[self._label_values(labels)] = value
+
+    def set_function(self, function: Callable[[], object]):
+        """Compute the value(s) at scrape time.
+
+        ``function`` returns a number (unlabelled gauges) or a dict mapping
+        label-value tuples to numbers; ``None`` values are skipped.
+        """
+        self._functions.append(function)
+
+    def values(self) -> Dict[LabelValues, float]:
+        values = dict(self._values)
+        for function in self._functions:
+            try:
+                result = function()
+            except Exception:
+                continue  # a broken callback must not break the scrape
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in k): val for k, val in result.items()})
+            elif result is not None:
+                values[()] = result
+        return {k: v for k, v in values.items() if v is not None}
+
+    def samples(self):
+        for key, value in sorted(self.values().items()):
+            yield "", self._format_labels(key), value
+
+
+class _HistogramChild:
+    __slots__ = ("_shards", "_key", "_buckets")
+
+    def __init__(self, shards: _ThreadShards, key: LabelValues, buckets: Tuple[float, ...]):
+        self._shards = shards
+        self._key = key
+        self._buckets = buckets
+
+    def observe(self, value: float):
+        shard = self._shards.shard()
+        state = shard.get(self._key)
+        if state is None:
+            # bucket counts (last slot is +Inf), count, sum
+            state = shard[self._key] = [[0] * (len(self._buckets) + 1), 0, 0.0]
+        state[0][bisect.bisect_left(self._buckets, value)] += 1
+        state[1] += 1
+        state[2] += value
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram (cumulative buckets on output)"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards()
+        self._children: Dict[LabelValues, _HistogramChild] = {}
+
+    def labels(self, **labels) -> _HistogramChild:
+        key = self._label_values(labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, _HistogramChild(self._shards, key, self.buckets))
+        return child
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def values(self) -> Dict[LabelValues, Tuple[List[int], int, float]]:
+        """label values -> (per-bucket counts, count, sum), merged across threads"""
+        merged: Dict[LabelValues, Tuple[List[int], int, float]] = {}
+        for shard in self._shards.all():
+            for key, (counts, count, total) in list(shard.items()):
+                if key in merged:
+                    m_counts, m_count, m_total = merged[key]
+                    merged[key] = ([a + b for a, b in zip(m_counts, counts)], m_count + count, m_total + total)
+                else:
+                    merged[key] = (list(counts), count, total)
+        return merged
+
+    def snapshot(self) -> Dict[LabelValues, Dict]:
+        """JSON-friendly view: count, sum, mean and cumulative buckets"""
+        result = {}
+        for key, (counts, count, total) in self.values().items():
+            cumulative, buckets = 0, {}
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                buckets[_format_value(bound)] = cumulative
+            result[key] = {
+                'count': count,
+                'sum_seconds': total,
+                'mean_seconds': total / count if count else 0.0,
+                'buckets': buckets,
+            }
+        return result
+
+    def samples(self):
+        for key, (counts, count, total) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield "_bucket", self._format_labels(key, (("le", _format_value(bound)),)), cumulative
+            yield "_count", self._format_labels(key), count
+            yield "_sum", self._format_labels(key), total
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Shared metric families; modules record into these
+HTTP_REQUESTS = REGISTRY.counter(
+    "smart_menu_http_requests", "HTTP requests by endpoint, method and status",
+    ["endpoint", "method", "status"])
+HTTP_LATENCY = REGISTRY.histogram(
+    "smart_menu_http_request_duration_seconds", "HTTP request latency by endpoint", ["endpoint"])
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "smart_menu_http_requests_in_flight", "Requests currently being processed")
+STAGE_LATENCY = REGISTRY.histogram(
+    "smart_menu_stage_duration_seconds", "Recommendation pipeline stage latency", ["stage"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "smart_menu_cache_requests", "Cache lookups by cache and result (hit/miss)", ["cache", "result"])
+CACHE_EVICTIONS = REGISTRY.counter(
+    "smart_menu_cache_evictions", "Entries evicted to respect max_entries", ["cache"])
+CACHE_SIZE = REGISTRY.gauge(
+    "smart_menu_cache_entries", "Live entries per cache", ["cache"])
+MODEL_VERSION = REGISTRY.gauge(
+    "smart_menu_model_version", "Version of the model bundle being served")
+MODEL_AGE = REGISTRY.gauge(
+    "smart_menu_model_age_seconds", "Seconds since the served model bundle was built")
+MODEL_BUILD_SECONDS = REGISTRY.gauge(
+    "smart_menu_model_build_seconds", "Build duration of the served model bundle")
+MODEL_PENDING_ORDERS = REGISTRY.gauge(
+    "smart_menu_model_pending_orders", "Orders recorded since the last model build")
+MODEL_REQUESTS = REGISTRY.counter(
+    "smart_menu_model_requests", "Requests served per model bundle version (current and previous)", ["version"])
+TENANT_REQUESTS = REGISTRY.counter(
+    "smart_menu_tenant_requests", "Tenant bundle lookups by result (hit/load/unknown)", ["result"])
+TENANT_EVICTIONS = REGISTRY.counter(
+    "smart_menu_tenant_evictions", "Tenant bundles evicted to respect the resident limit")
+TENANTS_RESIDENT = REGISTRY.gauge(
+    "smart_menu_tenants_resident", "Tenant bundles currently loaded")
+COLD_START_REQUESTS = REGISTRY.counter(
+    "smart_menu_cold_start_requests",
+    "Cold-start segment lookups by kind (scores/recommendations/anonymous) and result (hit/miss)",
+    ["kind", "result"])
+DATASET_ROWS = REGISTRY.gauge(
+    "smart_menu_dataset_rows", "Rows in the loaded dataset by table", ["table"])
+FEEDBACK_DEPTH = REGISTRY.gauge(
+    "smart_menu_feedback_buffer_depth", "Feedback events held in the feedback store")
+THREADPOOL_BUSY = REGISTRY.gauge(
+    "smart_menu_worker_pool_busy", "Worker-pool threads currently running requests")
+THREADPOOL_QUEUE = REGISTRY.gauge(
+    "smart_menu_worker_pool_queue_length", "Requests waiting for a worker-pool thread")
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of every registered metric"""
+    return REGISTRY.render()
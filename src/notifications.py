@@ -4,22 +4,38 @@ import random
 import pandas as pd
 from datetime import datetime
 from .data_loader import load_all
-from .contextual import Context
+from .core.contextual import Context
+from .core.dataset_index import DatasetIndex
+from .core.model_refresher import get_model_refresher
+from .core.ranking import top_k, top_k_series
+
+
+class UnknownUser(KeyError):
+    """No users row for the requested user"""
 
 
 def generate_notifications(user_id: int, now: datetime | None = None) -> list[dict]:
-    users, items, orders = load_all()
+    # The served bundle's index when the refresher runs, else one over a fresh load
+    bundle = get_model_refresher().current()
+    if bundle is not None:
+        index = bundle.index
+        fav_scores = bundle.favorites.get(user_id, pd.Series(dtype=float))
+    else:
+        index = DatasetIndex(*load_all())
+        fav_scores = index.user_orders(user_id).groupby("item_id").size()
+    items = index.items
     now = now or pd.Timestamp.now().to_pydatetime()
     ctx = Context(user_id=user_id, now=now).ensure()
 
-    user = users.loc[users.user_id == user_id].iloc[0]
+    user = index.user(user_id)
+    if user is None:
+        raise UnknownUser(user_id)
     msgs: list[dict] = []
 
-    # Favorite item reminder
-    fav_counts = orders[orders.user_id == user_id].groupby("item_id").size().sort_values(ascending=False)
-    if not fav_counts.empty:
-        fav_id = fav_counts.index[0]
-        fav = items.loc[items.item_id == fav_id].iloc[0]
+    # Favorite item reminder (favorites are the scaled order counts, so the same item wins)
+    fav_counts = top_k_series(fav_scores, 1)
+    fav = index.item(fav_counts.index[0]) if not fav_counts.empty else None
+    if fav is not None:
         msgs.append({
             "type": "favorite_discount",
             "title": "Your favorite is on promo!",
@@ -28,9 +44,9 @@ def generate_notifications(user_id: int, now: datetime | None = None) -> list[di
         })
 
     # Time-of-day suggestion
-    suggestions = items[items.time_preference.fillna("any").isin([ctx.time_of_day, "any", "all"])].sample(n=1, random_state=1)
+    suggestions = items[items.time_preference.fillna("any").isin([ctx.time_of_day, "any", "all"])]
     if not suggestions.empty:
-        it = suggestions.iloc[0]
+        it = suggestions.sample(n=1, random_state=1).iloc[0]
         msgs.append({
             "type": "time_suggestion",
             "title": "Perfect for now",
@@ -42,7 +58,7 @@ def generate_notifications(user_id: int, now: datetime | None = None) -> list[di
     fav_cats = user.get("favorite_categories", [])
     if fav_cats:
         cat = random.choice(fav_cats)
-        cand = items[items.category == cat].sort_values("popularity_score", ascending=False).head(1)
+        cand = top_k(items[items.category == cat], "popularity_score", 1)
         if not cand.empty:
             it = cand.iloc[0]
             msgs.append({
@@ -0,0 +1,190 @@
+"""
+Serialization - fast JSON for recommendation payloads
+Recommendation responses are mostly the same static item fields (name,
+category, price, tags) repeated request after request, plus a few scores.
+Each catalogue item's static fields are encoded to JSON once
+(``ItemFragments``); a response splices those fragments together with its
+score columns instead of building and re-encoding a dict per row.
+
+``dumps`` uses orjson when it is installed (NumPy scalars and arrays,
+datetimes and NaN -> null handled natively) and falls back to the standard
+``json`` module otherwise.
+
+Result caches hold ``detached`` copies: their rows are the encoded JSON
+(``EncodedRows``), so a cached response keeps no reference to the catalogue
+frame it was ranked from.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+from collections.abc import Sequence
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:  # NumPy/pandas stay out of the API's import path
+    import numpy as np
+    import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # optional dependency, see requirements.txt
+    orjson = None
+
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    """Encode what the JSON encoders do not know natively"""
+    if isinstance(obj, (RecommendationRows, EncodedRows)):
+        return obj.records()
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):  # scalars and arrays
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON bytes; a payload's row values are spliced from their encoded form, in key order"""
+    if isinstance(obj, dict) and any(isinstance(value, (RecommendationRows, EncodedRows)) for value in obj.values()):
+        fields = [
+            _dumps(key if isinstance(key, str) else str(key)) + b":"
+            + (value.to_json() if isinstance(value, (RecommendationRows, EncodedRows)) else _dumps(value))
+            for key, value in obj.items()
+        ]
+        return b"{" + b",".join(fields) + b"}"
+    return _dumps(obj)
+
+
+def detached(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a response whose rows are encoded JSON, for caching (no catalogue reference)"""
+    return {key: EncodedRows(value.to_json()) if isinstance(value, RecommendationRows) else value
+            for key, value in payload.items()}
+
+
+def _static(value: Any) -> Any:
+    """Static item field as stored in a fragment (missing values become null)"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _number(value: float) -> bytes:
+    return repr(value).encode() if math.isfinite(value) else b"null"
+
+
+class ItemFragments:
+    """Pre-encoded static fields per catalogue row, e.g. ``{"item_id":1,"name":"Veggie Wrap"``
+
+    Fragments leave the object open so score fields can be appended.
+    """
+
+    def __init__(self, items: pd.DataFrame, columns: List[str]):
+        self.columns = list(columns)
+        self.fragments = [
+            _dumps({key: _static(value) for key, value in record.items()})[:-1]
+            for record in items[self.columns].to_dict(orient="records")
+        ]
+
+    def encode_rows(self, positions: np.ndarray, scores: Dict[str, np.ndarray]) -> bytes:
+        """JSON array of the rows at ``positions`` with the score columns appended"""
+        keys = [b',"' + name.encode() + b'":' for name in scores]
+        columns = [values.astype(float).tolist() for values in scores.values()]
+        rows = []
+        for i, position in enumerate(positions.tolist()):
+            fields = b"".join(key + _number(column[i]) for key, column in zip(keys, columns))
+            rows.append(self.fragments[position] + fields + b"}")
+        return b"[" + b",".join(rows) + b"]"
+
+
+class RecommendationRows(Sequence):
+    """Response rows kept as catalogue positions plus score columns.
+
+    Reads like a list of row dicts (materialized on first access, and pickled
+    as one), while ``dumps`` encodes it straight from the item fragments and
+    score arrays. ``reasons`` are the explanation reason codes of the rows
+    (``core/explanations.py``); they are not part of the response.
+    """
+
+    def __init__(self, items: pd.DataFrame, fragments: ItemFragments, positions: np.ndarray,
+                 scores: Dict[str, np.ndarray], reasons: np.ndarray | None = None):
+        self.items = items
+        self.fragments = fragments
+        self.positions = positions
+        self.scores = scores
+        self.reasons = reasons
+        self._records: List[Dict[str, Any]] | None = None
+
+    def records(self) -> List[Dict[str, Any]]:
+        if self._records is None:
+            frame = self.items.iloc[self.positions][self.fragments.columns].assign(**self.scores)
+            self._records = frame.to_dict(orient="records")
+        return self._records
+
+    def to_json(self) -> bytes:
+        return self.fragments.encode_rows(self.positions, self.scores)
+
+    def __getitem__(self, index):
+        return self.records()[index]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (RecommendationRows, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"RecommendationRows({self.records()!r})"
+
+    def __reduce__(self):
+        # Shared cache backends store plain rows, not the catalogue they came from
+        return list, (self.records(),)
+
+
+class EncodedRows(Sequence):
+    """Response rows kept as their encoded JSON array (``RecommendationRows.to_json`` output).
+
+    Reads like a list of row dicts (decoded on first access); ``dumps``
+    splices the bytes as they are.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._records: List[Dict[str, Any]] | None = None
+
+    def records(self) -> List[Dict[str, Any]]:
+        if self._records is None:
+            self._records = json.loads(self.data)
+        return self._records
+
+    def to_json(self) -> bytes:
+        return self.data
+
+    def __getitem__(self, index):
+        return self.records()[index]
+
+    def __len__(self) -> int:
+        return len(self.records())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (RecommendationRows, EncodedRows, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"EncodedRows({self.records()!r})"
+
+    def __reduce__(self):
+        return EncodedRows, (self.data,)
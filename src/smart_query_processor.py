@@ -8,15 +8,21 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime
 import logging
 
-logger = logging.getLogger(__name__)
+from .core.contextual import Context
+from .core.explanations import (CATEGORY, QUERY_DIET, QUERY_MOOD, QUERY_PHRASES, QUERY_PRICE, TIME_PREFERENCE,
+                                render)
+from .cache import get_cache
 
-from .contextual import Context
+logger = logging.getLogger(__name__)
 
 
 class SmartQueryProcessor:
     """Smart query processing with impressive but realistic features"""
     
     def __init__(self):
+        # Parsed queries are shared across workers through the cache backend
+        self.query_cache = get_cache('parsed_queries', max_entries=10000)
+        
         # Predefined patterns for common queries
         self.patterns = {
             'dietary': {
@@ -71,17 +77,25 @@ class SmartQueryProcessor:
         current_time = current_time or datetime.now()
         base_context = Context(user_id=user_id, now=current_time)
         
-        # Extract information from query
-        extracted_info = self._extract_information(query)
-        
-        # Determine intent
-        intent = self._determine_intent(query, extracted_info)
-        
-        # Build search filters
-        filters = self._build_filters(extracted_info)
-        
-        # Calculate confidence
-        confidence = self._calculate_confidence(extracted_info)
+        # Parsing only depends on the query text, so reuse earlier results
+        cache_key = query.lower()
+        parsed = self.query_cache.get(cache_key)
+        if parsed is None:
+            # Extract information from query
+            extracted_info = self._extract_information(query)
+            
+            # Determine intent
+            intent = self._determine_intent(query, extracted_info)
+            
+            # Build search filters
+            filters = self._build_filters(extracted_info)
+            
+            # Calculate confidence
+            confidence = self._calculate_confidence(extracted_info)
+            
+            parsed = (intent, filters, confidence, extracted_info)
+            self.query_cache.set(cache_key, parsed)
+        intent, filters, confidence, extracted_info = parsed
         
         return {
             'user_id': user_id,
@@ -208,37 +222,32 @@ class SmartQueryProcessor:
     
     def generate_explanation(self, item: Dict[str, Any], query_info: Dict[str, Any]) -> str:
         """Generate explanation for recommendation based on query"""
-        explanations = []
-        
-        # Item name
-        item_name = item.get('name', 'this item')
+        filters = query_info.get('filters', {})
+        code = 0
         
         # Intent-based explanation
         intent = query_info.get('intent', 'browse')
         if intent == 'dietary_restriction':
-            dietary = query_info.get('filters', {}).get('dietary')
+            dietary = filters.get('dietary')
             if dietary and dietary in item.get('dietary_tags', []):
-                explanations.append(f"perfect for your {dietary} diet")
+                code |= QUERY_DIET
         elif intent == 'price_sensitive':
-            price = query_info.get('filters', {}).get('price')
+            price = filters.get('price')
             if price and item.get('budget_category') == price:
-                explanations.append(f"fits your {price} budget")
+                code |= QUERY_PRICE
         elif intent == 'mood_based':
-            mood = query_info.get('filters', {}).get('mood')
-            if mood:
-                explanations.append(f"great for a {mood} occasion")
+            if filters.get('mood'):
+                code |= QUERY_MOOD
         
         # General explanations
         if item.get('category'):
-            explanations.append(f"from our {item['category']} selection")
-        
+            code |= CATEGORY
         if item.get('time_preference'):
-            explanations.append(f"perfect for {item['time_preference']}")
+            code |= TIME_PREFERENCE
         
-        if explanations:
-            return f"I recommend {item_name} because it's {' and '.join(explanations)}!"
-        else:
-            return f"I recommend {item_name} - it's a great choice from our menu!"
+        context = {key: filters.get(key) for key in ('dietary', 'price', 'mood')}
+        return render(QUERY_PHRASES, code, context, name=item.get('name', 'this item'),
+                      category=item.get('category'), time_preference=item.get('time_preference'))
 
 
 # Global instance
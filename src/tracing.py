@@ -0,0 +1,64 @@
+"""
+Tracing - per-stage latency instrumentation
+Wrap pipeline stages with ``span()`` / ``@traced()`` to aggregate latency
+histograms per stage (``smart_menu_stage_duration_seconds`` on ``/metrics``),
+and use ``collect_spans()`` to get the breakdown of a single request.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterator, Optional
+
+from .metrics import STAGE_LATENCY
+
+# Per-request breakdown, only populated inside collect_spans()
+_request_spans: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_spans", default=None)
+
+
+def record(name: str, seconds: float):
+    """Record one timing for stage ``name``"""
+    STAGE_LATENCY.labels(stage=name).observe(seconds)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of ``span``; defaults to the function name"""
+    def decorator(func):
+        stage = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_spans() -> Iterator[Dict[str, float]]:
+    """Collect the per-stage timings of the enclosed request"""
+    spans: Dict[str, float] = {}
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def stage_latency_snapshot() -> Dict[str, Dict]:
+    """Aggregated histogram per stage"""
+    return {stage: snapshot for (stage,), snapshot in sorted(STAGE_LATENCY.snapshot().items())}
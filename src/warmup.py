@@ -0,0 +1,84 @@
+"""
+Warm-up - load data, models and code paths before a worker takes traffic
+Entry points import the recommenders lazily so the CLI and each API worker
+start fast; the API's startup hook then calls ``warm_up`` so the first real
+request does not pay for the imports, the dataset load, the model build or
+the catalogue encoding.
+
+Configuration (environment):
+- ``SMART_MENU_WARMUP``: ``0`` skips the warm-up in the API startup hook
+"""
+
+import time
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _step(name: str, timings: Dict[str, float]):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def warm_up(user_id: Optional[int] = None) -> Dict[str, float]:
+    """Preload everything a recommendation request needs; returns seconds per step.
+
+    With the model refresher enabled the first bundle is built synchronously,
+    so the worker serves from trained models from its first request, and its
+    cold-start segments are scored ahead of the first new user; otherwise the
+    dataset is loaded once. ``user_id`` (default: the first user) is scored
+    once through the hybrid scorer and once through the smart recommender (the
+    API's default path: stages, formatting and the result cache).
+    """
+    timings: Dict[str, float] = {}
+    with _step("imports", timings):
+        from .core.contextual import Context
+        from .core.hybrid import recommend_rows
+        from .core.item_features import get_item_features
+        from .core.model_refresher import get_model_refresher
+        from .core.scoring import get_scoring_config
+        from .data_loader import load_all
+        from .smart_recommender import get_smart_recommender
+        from . import notifications, smart_query_processor  # noqa: F401 - imported for their cost
+
+    with _step("scoring", timings):
+        get_scoring_config()  # a bad SMART_MENU_SCORING file fails here, before any traffic
+
+    refresher = get_model_refresher()
+    bundle = None
+    with _step("data", timings):
+        if refresher.interval_seconds > 0:
+            bundle = refresher.current() or refresher.refresh()
+            users, items = (bundle.users, bundle.items) if bundle is not None else load_all()[:2]
+        else:
+            users, items, _ = load_all()
+
+    with _step("catalogue", timings):
+        get_item_features(items).fragments
+        get_smart_recommender()
+
+    if bundle is not None:
+        with _step("segments", timings):
+            # Cold-start scores of every diet x budget segment for the current context
+            bundle.segments.precompute(Context(user_id=None, now=datetime.now()).ensure())
+
+    with _step("request", timings):
+        if user_id is None and len(users):
+            user_id = int(users["user_id"].iloc[0])
+        if user_id is not None:
+            try:
+                recommend_rows(user_id, top_k=10, ctx=Context(user_id=user_id, now=datetime.now()).ensure()).to_json()
+                get_smart_recommender().get_recommendations(user_id, top_k=10)
+            except Exception as e:
+                logger.warning(f"Warm-up request for user {user_id} failed: {e}")
+
+    steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    logger.info(f"Warm-up finished in {sum(timings.values()):.2f}s ({steps})")
+    return timings
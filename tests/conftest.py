@@ -0,0 +1,44 @@
+"""Shared fixtures: a private copy of the sample dataset and fresh module singletons"""
+
+import os
+import shutil
+
+import pytest
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "raw")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """data/raw copied to a temporary directory (the order journal is written next to it)"""
+    path = tmp_path / "raw"
+    shutil.copytree(SAMPLE_DATA, path)
+    monkeypatch.setenv("SMART_MENU_DATA_DIR", str(path))
+    monkeypatch.delenv("SMART_MENU_ORDER_JOURNAL", raising=False)
+    monkeypatch.setenv("SMART_MENU_CACHE_BACKEND", "memory")
+    return path
+
+
+@pytest.fixture
+def fresh(data_dir, monkeypatch):
+    """Module singletons reset so a test builds its own refresher, recommenders and registry"""
+    from src import hybrid_recommender, smart_recommender
+    from src.core import model_refresher, scoring, tenants
+
+    monkeypatch.setenv("SMART_MENU_REFRESH_SECONDS", "0")
+    for module, name in [(model_refresher, "_model_refresher"), (smart_recommender, "_smart_recommender"),
+                         (hybrid_recommender, "_hybrid_recommender"), (tenants, "_tenant_registry"),
+                         (scoring, "_scoring_config")]:
+        monkeypatch.setattr(module, name, None)
+    return data_dir
+
+
+@pytest.fixture
+def chain_dir(data_dir):
+    """The sample data as a chain of three restaurants (items assigned round-robin)"""
+    import pandas as pd
+
+    items = pd.read_csv(data_dir / "items.csv")
+    items["restaurant_id"] = items["item_id"] % 3 + 1
+    items.to_csv(data_dir / "items.csv", index=False)
+    return data_dir
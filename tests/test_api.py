@@ -0,0 +1,50 @@
+"""API error mappings: request errors are 4xx/503 responses, not 500s"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import app
+from src.core.model_refresher import get_model_refresher
+
+
+@pytest.fixture
+def client(fresh):
+    # Not entered as a context manager: no startup warm-up or background refresher
+    return TestClient(app)
+
+
+def test_recommendations(client):
+    response = client.get("/recommendations", params={"user_id": 1, "top": 3})
+    assert response.status_code == 200
+    assert len(response.json()["recommendations"]) == 3
+
+
+def test_unknown_restaurant_is_not_found(chain_dir, client):
+    response = client.get("/recommendations", params={"user_id": 1, "restaurant_id": 99})
+    assert response.status_code == 404
+
+
+def test_restaurant_of_single_tenant_data_is_a_bad_request(client):
+    assert client.get("/recommendations", params={"user_id": 1, "restaurant_id": 1}).status_code == 400
+
+
+@pytest.mark.parametrize("use_smart", [True, False])
+def test_anonymous_request_without_a_bundle_is_unavailable(client, use_smart):
+    response = client.get("/recommendations", params={"diet": "vegan", "use_smart": use_smart})
+    assert response.status_code == 503
+
+
+def test_anonymous_request_is_served_once_a_bundle_is_built(client):
+    get_model_refresher().refresh()
+    assert client.get("/recommendations", params={"diet": "vegan"}).status_code == 200
+
+
+def test_notifications_of_unknown_user_are_not_found(client):
+    assert client.get("/notifications", params={"user_id": 1}).status_code == 200
+    assert client.get("/notifications", params={"user_id": 10_000}).status_code == 404
+
+
+def test_purchase_of_an_item_not_on_the_menu_is_a_bad_request(client):
+    params = {"user_id": 1, "feedback_type": "purchase", "value": 1}
+    assert client.post("/feedback", params=dict(params, item_id=3)).status_code == 200
+    assert client.post("/feedback", params=dict(params, item_id=10_000)).status_code == 400
@@ -0,0 +1,82 @@
+"""Cache backends: expiry, LRU eviction and namespace isolation"""
+
+import pytest
+
+from src import cache as cache_module
+from src.cache import InProcessCache, SQLiteCache, fingerprint, get_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(namespace="test", ttl=None, max_entries=None):
+        if request.param == "sqlite":
+            return SQLiteCache(namespace, ttl=ttl, max_entries=max_entries, path=str(tmp_path / "cache.sqlite3"))
+        return InProcessCache(namespace, ttl=ttl, max_entries=max_entries)
+    return make
+
+
+def test_entries_expire_after_their_ttl(make_cache, clock):
+    cache = make_cache(ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=100)
+    clock[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.size() == 1
+
+
+def test_hits_and_misses_are_counted(make_cache):
+    cache = make_cache()
+    cache.set("a", {"x": 1})
+    assert cache.get("a") == {"x": 1}
+    assert cache.get("missing", "default") == "default"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_namespaces_are_isolated(make_cache):
+    first, second = make_cache("first"), make_cache("second")
+    first.set("key", 1)
+    second.set("key", 2)
+    first.clear()
+    assert "key" not in first
+    assert second.get("key") == 2
+
+
+def test_memory_cache_evicts_the_least_recently_used():
+    cache = InProcessCache("test", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_sqlite_cache_prunes_the_oldest_writes(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(SQLiteCache, "PRUNE_EVERY", 5)
+    cache = SQLiteCache("test", max_entries=3, path=str(tmp_path / "cache.sqlite3"))
+    for i in range(5):
+        clock[0] += 1
+        cache.set(i, i)
+    assert cache.size() == 3
+    assert [i for i in range(5) if i in cache] == [2, 3, 4]
+    assert cache.evictions == 2
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        get_cache("test", backend="nope")
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+    assert fingerprint(None) == fingerprint({}) == "-"
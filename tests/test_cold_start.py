@@ -0,0 +1,75 @@
+"""Segment tables and materialized anonymous rows match ranking from scratch"""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.core.cold_start import Segment, score_segment
+from src.core.contextual import Context
+from src.core.model_refresher import get_model_refresher
+from src.core.scoring import scoring_formula
+from src.smart_recommender import get_smart_recommender
+
+NEW_USER = 10_000
+
+
+@pytest.fixture
+def served(fresh):
+    recommender = get_smart_recommender()  # materializes anonymous rows with each bundle
+    return recommender, get_model_refresher().refresh()
+
+
+def assert_same_ranking(rows, expected):
+    """Same items in the same order; scores agree up to the popularity decay between the two scoring times"""
+    assert [row["item_id"] for row in rows] == [row["item_id"] for row in expected]
+    np.testing.assert_allclose([row["smart_score"] for row in rows], [row["smart_score"] for row in expected],
+                               rtol=1e-4)
+
+
+def from_scratch(recommender, bundle, segment, ctx, top_k=10):
+    """The baseline: score the segment and run the ranking stages, no tables involved"""
+    return recommender._rank(score_segment(bundle, segment, ctx), ctx, segment.preferences(), top_k, {})
+
+
+def test_segment_scores_match_scoring_from_scratch(served):
+    _, bundle = served
+    ctx = Context(user_id=None, now=datetime(2024, 6, 12, 19), budget_level="low").ensure()
+    for diet in ("none", "vegan"):
+        segment = Segment(diet=diet, budget="low")
+        cached, expected = bundle.segments.scored(segment, ctx), score_segment(bundle, segment, ctx)
+        assert bundle.segments.scored(segment, ctx) is cached
+        np.testing.assert_array_equal(cached.hybrid_score, expected.hybrid_score)
+
+
+@pytest.mark.parametrize("hour", [8, 13, 19])
+@pytest.mark.parametrize("budget", [None, "low"])
+@pytest.mark.parametrize("diet", ["none", "vegan"])
+def test_anonymous_rows_are_served_from_the_materialized_table(served, hour, budget, diet):
+    recommender, bundle = served
+    ctx = Context(user_id=None, now=datetime(*datetime.now().timetuple()[:3], hour), budget_level=budget).ensure()
+    assert bundle.segments.anonymous("smart", ctx, Segment(diet=diet), 10) is not None
+    result = recommender.get_recommendations(None, top_k=10, context=ctx, answers={"diet": diet})
+    assert_same_ranking(result["recommendations"], from_scratch(recommender, bundle, Segment(diet=diet), ctx))
+
+
+def test_answers_beyond_the_diet_are_ranked_per_request(served):
+    recommender, bundle = served
+    ctx = Context(user_id=None, now=datetime.now()).ensure()
+    answers = {"diet": "vegan", "favorite_categories": "dessert"}
+    segment = Segment.from_answers(answers)
+    assert bundle.segments.anonymous("smart", ctx, segment, 10) is None
+    result = recommender.get_recommendations(None, top_k=10, context=ctx, answers=answers)
+    assert_same_ranking(result["recommendations"], from_scratch(recommender, bundle, segment, ctx))
+
+
+def test_new_users_share_their_segments_ranking(served):
+    recommender, bundle = served
+    assert not bundle.has_history(NEW_USER)
+    ctx = Context(user_id=NEW_USER, now=datetime.now()).ensure()
+    first = recommender.get_recommendations(NEW_USER, top_k=5, context=ctx)
+    second = recommender.get_recommendations(NEW_USER + 1, top_k=5, context=ctx)
+    assert_same_ranking(first["recommendations"], second["recommendations"])
+    assert bundle.segments.stats()["recommendation_entries"] == 1
+    assert_same_ranking(first["recommendations"], from_scratch(recommender, bundle, Segment(), ctx, 5))
+    assert first["metadata"]["scoring_variant"] == scoring_formula(NEW_USER).name
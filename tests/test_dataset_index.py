@@ -0,0 +1,76 @@
+"""DatasetIndex: lookups match frame scans, folded purchases match a rebuilt index"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.core.dataset_index import DatasetIndex
+from src.data_loader import load_all
+
+
+@pytest.fixture
+def frames(data_dir):
+    return load_all()
+
+
+def test_lookups_match_frame_scans(frames):
+    users, items, orders = frames
+    index = DatasetIndex(users, items, orders)
+    for user_id in list(users["user_id"]) + [10_000]:
+        expected = orders.loc[orders.user_id == user_id]
+        pd.testing.assert_frame_equal(index.user_orders(user_id), expected)
+        assert index.has_orders(user_id) == (not expected.empty)
+        prices = expected["item_id"].map(items.set_index("item_id")["price"])
+        assert index.mean_price(user_id) == pytest.approx(prices.mean(), nan_ok=True)
+    assert index.item(items["item_id"].iloc[3])["name"] == items["name"].iloc[3]
+    assert index.user(10_000) is None and index.item(10_000) is None
+
+
+def test_folded_purchases_match_an_index_built_with_them(frames):
+    users, items, orders = frames
+    index = DatasetIndex(users, items, orders)
+    user_ids = [int(orders["user_id"].iloc[0]), int(users["user_id"].iloc[-1])]
+    at = orders["timestamp"].max() + pd.Timedelta(days=1)
+    added = []
+    for n, user_id in enumerate(user_ids):
+        bought = items["item_id"].iloc[[n, n + 5, n + 9]].tolist()
+        index.add_orders(user_id, bought)
+        added += [{"user_id": user_id, "item_id": item_id, "timestamp": at + pd.Timedelta(seconds=k)}
+                  for k, item_id in enumerate(bought)]
+    rebuilt = DatasetIndex(users, items, pd.concat([orders, pd.DataFrame(added)], ignore_index=True))
+    for user_id in user_ids:
+        assert index.mean_price(user_id) == pytest.approx(rebuilt.mean_price(user_id))
+        np.testing.assert_array_equal(index.recent_positions(user_id), rebuilt.recent_positions(user_id))
+        assert index.added_orders(user_id) == 3
+    assert index.added_orders(10_000) == 0
+
+
+def test_users_outside_the_users_table_are_not_indexed(frames):
+    users, items, orders = frames
+    index = DatasetIndex(users, items, orders)
+    index.add_orders(10_000, [items["item_id"].iloc[0]])
+    assert np.isnan(index.mean_price(10_000)) and index.added_orders(10_000) == 0
+
+
+def test_readers_see_consistent_ranges_while_slots_grow(frames):
+    users, items, orders = frames
+    # Only the first order lines' users get slots at build; the rest grow the arrays as they buy
+    index = DatasetIndex(users, items, orders.iloc[:5])
+    expected = {user_id: index.order_rows(user_id).tolist() for user_id in users["user_id"]}
+    stop, errors = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            for user_id, rows in expected.items():
+                if index.order_rows(user_id).tolist() != rows or index.has_orders(user_id) != bool(rows):
+                    errors.append(user_id)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for user_id in users["user_id"]:
+        index.add_orders(user_id, [items["item_id"].iloc[0]])
+    stop.set()
+    reader.join()
+    assert errors == []
@@ -0,0 +1,77 @@
+"""DecayedCounter agrees with decaying every event from scratch"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from src.core.decay import HALF_LIFE_DAYS, DecayedCounter
+
+
+def direct(keys, timestamps, weights, at, half_life_days=HALF_LIFE_DAYS):
+    """The baseline: ``w * 0.5 ** (age_days / half_life)`` summed per key"""
+    age_days = (pd.Timestamp(at) - pd.Series(timestamps)).dt.total_seconds() / 86400
+    decayed = pd.Series(weights) * 0.5 ** (age_days / half_life_days)
+    return decayed.groupby(pd.Series(keys).to_numpy()).sum()
+
+
+def events(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = pd.Series(rng.integers(1, 20, size=n))
+    timestamps = pd.Series(pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.uniform(0, 400, size=n), unit="D"))
+    weights = pd.Series(rng.integers(1, 4, size=n).astype(float))
+    return keys, timestamps, weights
+
+
+def test_batch_matches_direct_decay():
+    keys, timestamps, weights = events()
+    counter = DecayedCounter.from_events(keys, timestamps, weights)
+    for at in (timestamps.max(), timestamps.max() + pd.Timedelta(days=90)):
+        expected = direct(keys, timestamps, weights, at)
+        pd.testing.assert_series_equal(counter.decayed(at).sort_index(), expected, check_names=False, rtol=1e-9)
+    pd.testing.assert_series_equal(counter.totals().sort_index(), weights.groupby(keys.to_numpy()).sum(),
+                                   check_names=False)
+
+
+def test_single_adds_match_a_batch():
+    keys, timestamps, weights = events(100)
+    batch = DecayedCounter.from_events(keys, timestamps, weights)
+    single = DecayedCounter()
+    for key, at, weight in zip(keys, timestamps, weights):
+        single.add(key, at, weight)
+    at = timestamps.max()
+    pd.testing.assert_series_equal(single.decayed(at).sort_index(), batch.decayed(at).sort_index(), rtol=1e-9)
+
+
+def test_rebasing_keeps_sums():
+    # Events far apart force the landmark to move before 2 ** exponent overflows
+    keys = pd.Series([1, 2, 1])
+    timestamps = pd.Series(pd.to_datetime(["2000-01-01", "2010-01-01", "2030-01-01"]))
+    weights = pd.Series([1.0, 2.0, 3.0])
+    counter = DecayedCounter(half_life_days=10)
+    for i in range(3):
+        counter.add_many(keys[i:i + 1], timestamps[i:i + 1], weights[i:i + 1])
+    at = timestamps.max()
+    decayed = counter.decayed(at)
+    assert np.isfinite(decayed).all()
+    pd.testing.assert_series_equal(decayed.sort_index(), direct(keys, timestamps, weights, at, 10),
+                                   check_names=False, rtol=1e-9)
+
+
+def test_earlier_times_are_evaluated_at_the_newest_event():
+    keys, timestamps, weights = events(50)
+    counter = DecayedCounter.from_events(keys, timestamps, weights)
+    pd.testing.assert_series_equal(counter.decayed(timestamps.min()), counter.decayed())
+
+
+def test_pair_keys_and_pickling():
+    counter = DecayedCounter()
+    counter.add((1, 10), "2024-01-01")
+    counter.add((1, 10), "2024-01-31")
+    counter.add((2, 11), "2024-01-31")
+    restored = pickle.loads(pickle.dumps(counter))
+    decayed = restored.decayed()
+    assert decayed[(1, 10)] == 1.5
+    assert decayed[(2, 11)] == 1.0
+    restored.add((2, 11), "2024-01-31")
+    assert restored.totals()[(2, 11)] == 2.0
@@ -0,0 +1,11 @@
+"""Entry points stay within their import budget (see benchmarks/import_budget.py)"""
+
+import os
+
+from benchmarks.import_budget import check
+
+
+def test_entry_points_within_import_budget():
+    # SMART_MENU_IMPORT_BUDGET_SCALE loosens the time budgets on slow runners
+    scale = float(os.environ.get("SMART_MENU_IMPORT_BUDGET_SCALE", 1.0))
+    assert check(scale=scale) == []
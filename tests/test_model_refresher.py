@@ -0,0 +1,47 @@
+"""Model refresher build hooks"""
+
+from types import SimpleNamespace
+
+import pandas as pd
+
+from src.core.model_refresher import ModelRefresher
+from src.metrics import MODEL_REQUESTS
+
+
+def _builder(version):
+    return SimpleNamespace(version=version, orders=pd.DataFrame(), build_seconds=0.0, age_seconds=0.0, metadata={})
+
+
+def test_registering_a_hook_runs_only_that_hook_on_the_current_bundle():
+    refresher = ModelRefresher(interval_seconds=0, builder=_builder)
+    first, second = [], []
+    refresher.on_build(lambda bundle: first.append(bundle.version))
+    bundle = refresher.refresh()
+    assert first == [bundle.version]
+
+    refresher.on_build(lambda bundle: second.append(bundle.version))
+    assert first == [bundle.version]
+    assert second == [bundle.version]
+
+    rebuilt = refresher.refresh()
+    assert first == [bundle.version, rebuilt.version]
+    assert second == [bundle.version, rebuilt.version]
+
+
+def test_a_failing_hook_does_not_stop_the_others():
+    refresher = ModelRefresher(interval_seconds=0, builder=_builder)
+    seen = []
+    refresher.on_build(lambda bundle: 1 / 0)
+    refresher.on_build(lambda bundle: seen.append(bundle.version))
+    bundle = refresher.refresh()
+    assert bundle is not None and seen == [bundle.version]
+
+
+def test_request_counts_are_kept_for_the_current_and_previous_bundle_only():
+    refresher = ModelRefresher(interval_seconds=0, builder=_builder)
+    versions = []
+    for _ in range(5):
+        versions.append(refresher.refresh().version)
+        refresher.current()
+    assert set(MODEL_REQUESTS.values()) == {(str(versions[-2]),), (str(versions[-1]),)}
+    assert set(refresher.stats()['requests_served_by_version']) == set(versions[-2:])
@@ -0,0 +1,60 @@
+"""Order journal: concurrent appends, compaction into the order files"""
+
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+from src import data_loader
+from src.data_loader import (JOURNAL_COLUMNS, compact_journal, journal_path, load_all, load_order_tables,
+                             record_order_lines)
+from src.core.model_refresher import ModelRefresher
+
+pytestmark = pytest.mark.skipif(data_loader.fcntl is None, reason="the journal file lock needs fcntl")
+
+
+def _record(data_dir, user_id):
+    import os
+    os.environ["SMART_MENU_DATA_DIR"] = data_dir
+    record_order_lines(user_id, [1, 2])
+
+
+def _lines(orders: pd.DataFrame) -> list:
+    return sorted(orders[["user_id", "item_id", "quantity", "timestamp"]].astype(str).itertuples(index=False))
+
+
+def test_workers_creating_the_journal_write_one_header(data_dir):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_record, args=(str(data_dir), user_id)) for user_id in range(1, 9)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    journal = pd.read_csv(journal_path())
+    assert list(journal.columns) == JOURNAL_COLUMNS
+    assert len(journal) == 16
+    assert sorted(journal["user_id"].unique()) == list(range(1, 9))
+
+
+def test_compaction_moves_the_journal_into_the_order_files(data_dir):
+    record_order_lines(1, [1, 2], at="2025-10-01 12:00:00")
+    record_order_lines(2, [3], at="2025-10-02 19:30:00")
+    before = load_all()[2]
+
+    assert compact_journal() == 3
+    assert not (data_dir / "recorded_orders.csv").exists()
+    after = load_all()[2]
+    assert _lines(after) == _lines(before)
+
+    orders, order_items = load_order_tables()
+    assert orders["order_id"].is_monotonic_increasing and order_items["order_id"].is_monotonic_increasing
+    assert orders["order_id"].is_unique
+    assert compact_journal() == 0
+
+
+def test_refresher_compacts_after_a_build(data_dir):
+    refresher = ModelRefresher(interval_seconds=0, compact=True)
+    record_order_lines(1, [1, 2])
+    bundle = refresher.refresh()
+    assert not (data_dir / "recorded_orders.csv").exists()
+    assert len(refresher.refresh().orders) == len(bundle.orders)
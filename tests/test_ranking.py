@@ -0,0 +1,51 @@
+"""Partial top-k selection matches a full stable sort, ties and NaN included"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.core.ranking import top_k, top_k_indices, top_k_per_group, top_k_series
+
+
+def full_sort(scores, k, ascending=False):
+    """The baseline: a stable sort of the whole array, NaN last"""
+    series = pd.Series(np.asarray(scores, dtype=float))
+    return series.sort_values(ascending=ascending, kind="stable", na_position="last").index[:k].to_numpy()
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("ascending", [False, True])
+def test_matches_a_full_sort(seed, ascending):
+    rng = np.random.default_rng(seed)
+    # Few distinct values so most of the cut falls on ties
+    scores = rng.integers(0, 6, size=200).astype(float)
+    scores[rng.choice(200, size=20, replace=False)] = np.nan
+    for k in (0, 1, 7, 50, 180, 200, 250):
+        np.testing.assert_array_equal(top_k_indices(scores, k, ascending), full_sort(scores, k, ascending))
+
+
+def test_ties_keep_position_order():
+    np.testing.assert_array_equal(top_k_indices([1.0, 3.0, 3.0, 2.0, 3.0], 2), [1, 2])
+
+
+def test_nan_ranks_last_in_both_directions():
+    scores = [np.nan, 2.0, np.nan, 1.0]
+    np.testing.assert_array_equal(top_k_indices(scores, 4), [1, 3, 0, 2])
+    np.testing.assert_array_equal(top_k_indices(scores, 4, ascending=True), [3, 1, 0, 2])
+
+
+def test_frame_and_series_helpers_match_pandas():
+    frame = pd.DataFrame({"score": [0.5, 0.9, 0.5, 0.1, 0.9], "item_id": [10, 11, 12, 13, 14]})
+    expected = frame.sort_values("score", ascending=False, kind="stable").head(3)
+    pd.testing.assert_frame_equal(top_k(frame, "score", 3), expected)
+    series = frame.set_index("item_id")["score"]
+    pd.testing.assert_series_equal(top_k_series(series, 3), series.nlargest(3))
+    pd.testing.assert_series_equal(top_k_series(series, 3, ascending=True), series.nsmallest(3))
+
+
+def test_per_group_selection_matches_groupby_head():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"group": rng.integers(0, 4, size=60), "score": rng.integers(0, 5, size=60).astype(float)})
+    picked = set(top_k_per_group(frame["score"].to_numpy(), frame["group"].to_numpy(), 3))
+    expected = frame.sort_values("score", ascending=False, kind="stable").groupby("group").head(3)
+    assert picked == set(expected.index)
@@ -0,0 +1,35 @@
+"""Result caches: keys follow everything the ranking depends on"""
+
+from src.hybrid_recommender import get_hybrid_recommender
+from src.smart_recommender import get_smart_recommender
+
+
+def test_repeated_request_is_served_from_cache(fresh):
+    recommender = get_smart_recommender()
+    first = recommender.get_recommendations(1, top_k=5)
+    second = recommender.get_recommendations(1, top_k=5)
+    assert first['metadata']['from_cache'] is False
+    assert second['metadata']['from_cache'] is True
+    assert list(second['recommendations']) == list(first['recommendations'])
+
+
+def test_new_preferences_are_not_served_a_stale_result(fresh):
+    for recommender in (get_smart_recommender(), get_hybrid_recommender()):
+        recommender.get_recommendations(1, top_k=5)
+        recommender.set_user_preferences(1, {'diet': 'vegan'})
+        assert recommender.get_recommendations(1, top_k=5)['metadata']['from_cache'] is False
+        assert recommender.get_recommendations(1, top_k=5)['metadata']['from_cache'] is True
+
+
+def test_different_answers_are_ranked_separately(fresh):
+    recommender = get_smart_recommender()
+    recommender.get_recommendations(1, top_k=5, answers={'diet': 'vegan'})
+    assert recommender.get_recommendations(1, top_k=5, answers={'diet': 'omnivore'})['metadata']['from_cache'] is False
+    assert recommender.get_recommendations(1, top_k=5, answers={'diet': 'vegan'})['metadata']['from_cache'] is True
+
+
+def test_recommenders_keep_results_in_their_own_namespace(fresh):
+    smart, hybrid = get_smart_recommender(), get_hybrid_recommender()
+    assert smart.recommendation_cache.namespace != hybrid.recommendation_cache.namespace
+    smart.get_recommendations(1, top_k=5)
+    assert hybrid.get_recommendations(1, top_k=5)['metadata']['from_cache'] is False
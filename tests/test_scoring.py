@@ -0,0 +1,109 @@
+"""Scoring formulas: baseline parity, compilation, transforms, traffic splits and config errors"""
+
+import json
+import zlib
+
+import numpy as np
+import pytest
+
+from src.core import scoring
+from src.core.scoring import BASELINE, CONTENT_FEATURES, Formula, ScoringConfig, ScoringFormula, get_scoring_config
+
+
+@pytest.fixture
+def factors():
+    rng = np.random.default_rng(7)
+    return {name: rng.uniform(0.5, 1.5, 50) for name in CONTENT_FEATURES}
+
+
+def test_baseline_content_score_is_the_original_product(factors):
+    expected = (factors["base"] * factors["diet_multiplier"] * factors["time_multiplier"]
+                * factors["season_multiplier"] * factors["budget_multiplier"] * factors["favorite_boost"]
+                * factors["price_align"] * factors["recent_penalty"])
+    np.testing.assert_array_equal(BASELINE.content_score(factors), expected)
+
+
+def test_baseline_blend_is_the_original_geometric_mean():
+    score, cf_score = np.linspace(0, 1, 11), np.linspace(1, 0, 11)
+    expected = (score + 1e-6) ** 0.7 * (cf_score + 1e-6) ** 0.3
+    np.testing.assert_array_equal(BASELINE.hybrid_score(score, cf_score), expected)
+
+
+def test_rules_compile_to_one_expression():
+    features = (("score", 0.6), ("cf_score", 0.4))
+    assert Formula(features, rule="linear").expression() == "0.6 * score + 0.4 * cf_score"
+    assert Formula(features, rule="product").expression() == "score ** 0.6 * cf_score ** 0.4"
+    assert Formula((("score", 1.0),), rule="geometric", epsilon=0.5).expression() == "(score + 0.5)"
+
+
+@pytest.mark.parametrize("transform, expected", [
+    ("identity", [0.0, 0.25, 4.0]),
+    ("log1p", np.log1p([0.0, 0.25, 4.0])),
+    ("sqrt", [0.0, 0.5, 2.0]),
+    ("square", [0.0, 0.0625, 16.0]),
+    ("clip01", [0.0, 0.25, 1.0]),
+])
+def test_transforms(transform, expected):
+    formula = Formula((("score", 1.0),), transforms=(("score", transform),))
+    np.testing.assert_array_equal(formula.evaluate({"score": np.array([0.0, 0.25, 4.0])}), expected)
+    clipped = Formula((("score", 1.0),), transforms=(("score", "clip01"),)).evaluate({"score": np.array([-2.0])})
+    assert clipped.tolist() == [0.0]
+
+
+def test_constant_formula_broadcasts_to_the_catalogue():
+    formula = Formula((("score", 0.0),), rule="linear")
+    assert formula.evaluate({"score": np.ones(4)}).shape == (4,)
+
+
+def test_traffic_split_is_stable_and_follows_the_shares():
+    linear = ScoringFormula.from_config("linear", {"blend": {"rule": "linear", "features": {"score": 1.0}}})
+    config = ScoringConfig({"linear": linear}, traffic={"linear": 0.3})
+    assert config.formula_for(None) is BASELINE
+    for user_id in range(200):
+        bucket = zlib.crc32(str(user_id).encode()) % 10_000 / 10_000
+        assert config.formula_for(user_id).name == ("linear" if bucket < 0.3 else "baseline")
+    share = np.mean([config.formula_for(user_id).name == "linear" for user_id in range(10_000)])
+    assert 0.27 < share < 0.33
+
+
+@pytest.mark.parametrize("config, message", [
+    ({"variants": {"x": {"blend": {"rule": "linear"}}}}, "without features"),
+    ({"variants": {"x": {"blend": {"features": {}}}}}, "without features"),
+    ({"variants": {"x": {"blend": {"features": {"nope": 1}}}}}, "Unknown scoring features"),
+    ({"variants": {"x": {"blend": {"features": {"score": "a"}}}}}, "could not convert"),
+    ({"variants": {"x": {"blend": {"features": {"score": float("nan")}}}}}, "not a finite number"),
+    ({"variants": {"x": {"blend": {"features": {"score": float("inf")}}}}}, "not a finite number"),
+    ({"variants": {"x": {"blend": {"features": {"score": 1}, "epsilon": float("inf")}}}}, "not a finite number"),
+    ({"variants": {"x": {"blend": {"features": {"score": 1}, "rule": "max"}}}}, "Unknown scoring rule"),
+    ({"variants": {"x": {"blend": {"features": {"score": 1}, "transforms": {"score": "exp"}}}}}, "Unknown transform"),
+    ({"default": "missing"}, "Unknown scoring variant"),
+    ({"traffic": {"x": -0.5}, "variants": {"x": {}}}, "must not be negative"),
+    ({"traffic": {"x": 0.6, "y": 0.6}, "variants": {"x": {}, "y": {}}}, "more than 1"),
+    ({"variants": {"x": {"content": {"rule": "linear", "features": {"base": 1e308, "price_align": 1e308}}}}},
+     "no finite content scores"),
+])
+def test_bad_config_files_raise_value_error_naming_the_file(tmp_path, config, message):
+    path = tmp_path / "scoring.json"
+    path.write_text(json.dumps(config))  # NaN and Infinity are written as json.load reads them
+    with pytest.raises(ValueError, match=message) as error:
+        ScoringConfig.from_file(str(path))
+    assert str(error.value).startswith(f"Invalid scoring config {path}")
+
+
+def test_unreadable_config_file(tmp_path):
+    path = tmp_path / "scoring.json"
+    path.write_text("{bad")
+    with pytest.raises(ValueError, match="Invalid scoring config"):
+        ScoringConfig.from_file(str(path))
+    with pytest.raises(ValueError, match="Invalid scoring config"):
+        ScoringConfig.from_file(str(tmp_path / "missing.json"))
+
+
+def test_global_config_from_environment(tmp_path, monkeypatch):
+    path = tmp_path / "scoring.json"
+    path.write_text(json.dumps({"default": "linear", "variants": {
+        "linear": {"blend": {"rule": "linear", "features": {"score": 0.6, "cf_score": 0.4}}}}}))
+    monkeypatch.setattr(scoring, "_scoring_config", None)
+    monkeypatch.setenv("SMART_MENU_SCORING", str(path))
+    assert get_scoring_config().default.name == "linear"
+    assert set(get_scoring_config().variants) == {"baseline", "linear"}
@@ -0,0 +1,83 @@
+"""Spliced JSON payloads decode to the same rows as encoding the records directly"""
+
+import json
+import math
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import serialization
+from src.serialization import EncodedRows, ItemFragments, RecommendationRows, detached, dumps
+
+COLUMNS = ["item_id", "name", "category", "price", "tags"]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+def catalogue():
+    return pd.DataFrame({
+        "item_id": [1, 2, 3, 4],
+        "name": ["Veggie Wrap", 'Crème "brûlée"', "Tofu\nBowl", "Soup"],
+        "category": ["main", "dessert", "main", None],
+        "price": [8.5, 6.0, np.nan, 4.25],
+        "tags": ["vegan,light", "sweet", "", "warm"],
+        "calories": [400, 300, 500, 200],  # not part of the response
+    })
+
+
+def rows(items=None):
+    items = catalogue() if items is None else items
+    scores = {"smart_score": np.array([0.9, 1 / 3, np.nan]), "cf_score": np.array([np.inf, 0.0, -0.5], dtype=np.float32)}
+    return RecommendationRows(items, ItemFragments(items, COLUMNS), np.array([2, 0, 1]), scores)
+
+
+def baseline(records):
+    """The baseline: a dict per row encoded whole, NaN/Inf as null"""
+    clean = [{key: None if isinstance(value, float) and not math.isfinite(value) else value
+              for key, value in record.items()} for record in records]
+    return json.loads(json.dumps(clean))
+
+
+def test_rows_match_the_records(encoder):
+    recommendations = rows()
+    payload = {"user_id": np.int64(7), "recommendations": recommendations, "metadata": {"top_k": 3}}
+    decoded = json.loads(dumps(payload))
+    assert list(decoded) == ["user_id", "recommendations", "metadata"]
+    assert decoded["user_id"] == 7 and decoded["metadata"] == {"top_k": 3}
+    assert decoded["recommendations"] == baseline(recommendations.records())
+    assert [list(row) for row in decoded["recommendations"]] == [COLUMNS + ["smart_score", "cf_score"]] * 3
+
+
+def test_detached_rows_encode_the_same(encoder):
+    payload = {"recommendations": rows(), "count": 3}
+    cached = detached(payload)
+    assert isinstance(cached["recommendations"], EncodedRows)
+    assert dumps(cached) == dumps(payload)
+    assert list(cached["recommendations"]) == baseline(payload["recommendations"].records())
+    restored = pickle.loads(pickle.dumps(cached))
+    assert dumps(restored) == dumps(payload)
+
+
+def test_pickled_rows_are_plain_records():
+    recommendations = rows()
+    restored = pickle.loads(pickle.dumps(recommendations))
+    assert isinstance(restored, list)
+    assert baseline(restored) == baseline(recommendations.records())
+
+
+def test_encoders_agree_on_plain_values(monkeypatch):
+    if serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    value = {"a": [1, 2.5, None], "b": np.float64(0.25), "c": {"d": "é"}, "when": pd.Timestamp("2024-01-02").to_pydatetime()}
+    fast = json.loads(dumps(value))
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(dumps(value)) == fast
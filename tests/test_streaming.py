@@ -0,0 +1,55 @@
+"""Streamed aggregates match the in-memory bundle build"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.core.model_refresher import build_bundle
+from src.core.streaming import RECENT_COLUMNS, RECENT_LINES, aggregate_orders, build_streaming_bundle
+from src.data_loader import load_all
+
+NOW = pd.Timestamp("2025-01-01")
+
+
+@pytest.fixture
+def bundles(data_dir, monkeypatch):
+    monkeypatch.delenv("SMART_MENU_STREAM_CHUNK", raising=False)
+    in_memory = build_bundle(1, now=NOW)
+    # Small chunks so users and items span many chunks and the pair sums are compacted
+    return in_memory, build_streaming_bundle(2, chunksize=7, now=NOW)
+
+
+def test_popularity_and_favorites_match(bundles):
+    in_memory, streamed = bundles
+    assert streamed.metadata["streamed_chunks"] > 8
+    pd.testing.assert_series_equal(streamed.popularity.sort_index(), in_memory.popularity.sort_index(),
+                                   check_names=False, check_index_type=False, check_dtype=False)
+    pd.testing.assert_series_equal(streamed.decayed_popularity.sort_index(),
+                                   in_memory.decayed_popularity.sort_index(), check_names=False, rtol=1e-9)
+    pd.testing.assert_series_equal(streamed.favorites.sort_index(), in_memory.favorites.sort_index(),
+                                   check_names=False, check_index_type=False)
+
+
+def test_collaborative_scores_match(bundles):
+    in_memory, streamed = bundles
+    for user_id in in_memory.users["user_id"].head(20):
+        expected = in_memory.cf_model.scores_for_user(user_id)
+        actual = streamed.cf_model.scores_for_user(user_id)
+        pd.testing.assert_series_equal(actual.sort_index(), expected.sort_index(),
+                                       check_names=False, check_index_type=False, rtol=1e-9)
+
+
+def test_recent_orders_are_each_users_latest_lines(data_dir):
+    orders = load_all()[2]
+    expected = (orders.iloc[orders["timestamp"].argsort(kind="stable")]
+                .groupby("user_id", sort=False).tail(RECENT_LINES))
+    actual = aggregate_orders(chunksize=13, now=NOW).recent_orders()
+    columns = [col for col in RECENT_COLUMNS if col in orders.columns]
+    pd.testing.assert_frame_equal(actual[columns], expected[columns].reset_index(drop=True), check_dtype=False)
+
+
+def test_chunk_size_does_not_change_the_sums(data_dir):
+    coarse, fine = aggregate_orders(chunksize=10_000, now=NOW), aggregate_orders(chunksize=7, now=NOW)
+    assert coarse.lines == fine.lines
+    pd.testing.assert_series_equal(coarse.popularity().sort_index(), fine.popularity().sort_index())
+    np.testing.assert_allclose(fine.interactions().to_frame().to_numpy(), coarse.interactions().to_frame().to_numpy())
@@ -0,0 +1,59 @@
+"""Tenant registry: known ids, LRU of tenant bundles, refresh off the request path"""
+
+import os
+
+import pytest
+
+from src.core.tenants import SingleTenantData, TenantRegistry, UnknownTenant
+from src.data_loader import partition_tenants, record_order_lines
+
+
+def test_single_restaurant_data_is_rejected(data_dir):
+    with pytest.raises(SingleTenantData):
+        TenantRegistry().get(1)
+
+
+def test_unknown_restaurant(chain_dir):
+    with pytest.raises(UnknownTenant):
+        TenantRegistry().get(99)
+
+
+def test_tenant_bundle_serves_its_own_menu(chain_dir):
+    bundle = TenantRegistry().get(2)
+    assert set(bundle.items["restaurant_id"]) == {2}
+    assert bundle.metadata["restaurant_id"] == 2
+
+
+def test_least_recently_used_tenant_is_evicted(chain_dir):
+    registry = TenantRegistry(max_tenants=2)
+    first = registry.get(1)
+    registry.get(2)
+    assert registry.get(1) is first  # hit, and now the most recent
+    registry.get(3)
+    assert registry.resident() == [1, 3]
+    assert registry.evictions == 1 and registry.loads == 3
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_refresh_rebuilds_only_tenants_whose_data_changed(chain_dir, partitioned):
+    if partitioned:
+        partition_tenants()
+    registry = TenantRegistry()
+    bundles = {restaurant_id: registry.get(restaurant_id) for restaurant_id in (1, 2)}
+    assert registry.refresh() == []
+    assert registry.get(1) is bundles[1] and registry.get(2) is bundles[2]
+
+    record_order_lines(1, [3])  # item 3 is on restaurant 1's menu
+    rebuilt = registry.refresh()
+    assert 1 in rebuilt
+    assert registry.get(1) is not bundles[1]
+    assert len(registry.get(1).orders) == len(bundles[1].orders) + 1
+
+
+def test_refresh_keeps_the_bundle_when_a_rebuild_fails(chain_dir, monkeypatch):
+    registry = TenantRegistry()
+    bundle = registry.get(1)
+    os.utime(chain_dir / "users.csv", ns=(0, 0))
+    monkeypatch.setattr(registry, "_build", lambda restaurant_id: 1 / 0)
+    assert registry.refresh() == []
+    assert registry.get(1) is bundle